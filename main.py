@@ -15,96 +15,116 @@ starting one from scratch.
 import argparse
 import logging
 import threading
-
-
-import pyglet
-
-from modules.memory import Memory
+import time
 
 log = logging.getLogger('logger')
 
-lock = threading.Lock()
-
-
-class Singleton(type):
-    _instances = {}
-
-    def __call__(cls, *args, **kwargs):
-        if cls not in cls._instances:
-            with lock:
-                if cls not in cls._instances:
-                    cls._instances[cls] = super(Singleton, cls).__call__(*args, **kwargs)
-        return cls._instances[cls]
-
 
-class Manager(threading.Thread, metaclass=Singleton):
-
-    def __init__(self) -> None:
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        description="Command line options for NEStor")
+    parser.add_argument('romfile', metavar="filename", type=str,
+                        help="The ROM file to load")
+    parser.add_argument('--compile-blocks', action='store_true',
+                        help="Translate hot code blocks into Python functions")
+    parser.add_argument('--idle-skip', action='store_true',
+                        help="Fast-forward the CPU over polling loops")
+    parser.add_argument('--renderer', choices=('dot', 'scanline', 'layer'), default='dot',
+                        help="Draw a pixel per PPU cycle, whole scanlines at once, or "
+                             "scanlines from prerendered nametables")
+    parser.add_argument('--frameskip', metavar="N", type=int, default=0,
+                        help="Skip drawing N frames after each one drawn")
+    parser.add_argument('--sync', choices=('lockstep', 'catch-up'), default='lockstep',
+                        help="Run the PPU after every short CPU batch, or only when needed")
+    parser.add_argument('--palette', metavar="filename", type=str,
+                        help="Load the colors from a .pal file")
+    parser.add_argument('--trace', metavar="filename", type=str,
+                        help="Write a binary trace of every instruction")
+    parser.add_argument('--headless', action='store_true',
+                        help="Run without a window (frames only go to the sinks below)")
+    parser.add_argument('--throttle', action=argparse.BooleanOptionalAction,
+                        help="Limit the speed to 60 frames per second (default: only with a window)")
+    parser.add_argument('--frames', metavar="N", type=int,
+                        help="Stop after N frames")
+    parser.add_argument('--raw', metavar="filename", type=str,
+                        help="Write every frame as raw RGB24 to the given file")
+    parser.add_argument('--png', metavar="directory", type=str,
+                        help="Save frames as PNG files in the given directory")
+    parser.add_argument('--png-every', metavar="N", type=int, default=1,
+                        help="Save only one every N frames as PNG")
+    return parser.parse_args()
+
+
+class Manager(threading.Thread):
+    """
+    Runs a console configured from the command line, drawing its frames in a
+    pyglet window (in its own thread) or only feeding them to the frame
+    sinks when headless.
+    """
+
+    frame_rate = 60.0988  # NTSC
+
+    def __init__(self, args: argparse.Namespace) -> None:
 
         super().__init__()
 
-        from modules.cartridge import Cartridge
-        from modules.apu import APU
-        from modules.cpu import CPU
-        from modules.memory import PPUMemory
-        from modules.ppu import PPU
-        from modules.ui import UI
-        from modules.controller import IO
-
-        self._memory: Memory = Memory()
-        self.ppu: PPU = PPU(self.memory)
-        self.cpu: CPU = CPU(self.memory)
-        self.counter: int = 0
-        self.apu: APU = APU()
-        self.ui = UI(on_draw=self.on_draw)
-        self.io = IO()
-        self.ppu_memory = PPUMemory(self)
-        parser = argparse.ArgumentParser(
-            description="Command line options for NEStor")
-        parser.add_argument('romfile', metavar="filename", type=str,
-                            help="The ROM file to load")
-        args = parser.parse_args()
-        self.cartridge = Cartridge(args.romfile)
-        self._mapper = self.cartridge.mapper
+        from modules.console import Console
+        from modules.frame_sink import PNGSink, RawFileSink
+
+        self.console = Console(args.romfile)
+        self.ui = None
+        self.sinks = []
+        if not args.headless:
+            from modules.ui import UI
+
+            self.ui = UI(on_draw=self.on_draw)
+            self.console.ppu.add_frame_listener(self.ui.generate_frame)
+        if args.raw:
+            self.sinks.append(RawFileSink(args.raw))
+        if args.png:
+            self.sinks.append(PNGSink(args.png, args.png_every))
+        for sink in self.sinks:
+            self.console.ppu.add_frame_listener(sink.on_frame)
+
+        if args.compile_blocks:
+            self.console.cpu.enable_block_compiler()
+        if args.idle_skip:
+            self.console.enable_idle_detection()
+        if args.renderer in ('scanline', 'layer'):
+            self.console.ppu.enable_scanline_renderer(background_cache=args.renderer == 'layer')
+        self.console.catch_up_mode = args.sync == 'catch-up'
+        self.console.ppu.frameskip = args.frameskip
+        if args.palette:
+            from modules.palette import load_palette
+
+            self.console.ppu.frame_buffer.set_palette(load_palette(args.palette))
+        if args.trace:
+            self.console.enable_trace(args.trace)
+        self.throttle = not args.headless if args.throttle is None else args.throttle
+        self.frames = args.frames
 
     def run(self) -> None:
-        self.reset()
-        while True:
-            self.step()
-
-    @property
-    def memory(self) -> Memory:
-        return getattr(self, '_memory', None)
-
-    @memory.setter
-    def memory(self, value) -> None:
-        self._memory = value
-
-    @property
-    def mapper(self) -> 'BaseMapper':
-        return getattr(self, '_mapper', None)
-
-    @mapper.setter
-    def mapper(self, value) -> None:
-        self._mapper = value
+        console = self.console
+        console.reset()
+        frame_time = 1 / self.frame_rate
+        next_frame = time.perf_counter()
+        while self.frames is None or console.ppu.frame < self.frames:
+            console.run_frame()
+            if self.throttle:
+                next_frame += frame_time
+                delay = next_frame - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+                else:
+                    # Running late, don't rush to make up for it
+                    next_frame = time.perf_counter()
+        console.disable_trace()
+        for sink in self.sinks:
+            sink.close()
 
     def on_draw(self) -> None:
         self.ui.clear()
-        window_frame = self.ppu.window_frame
-        window_frame.draw()
-
-    def step(self) -> int:
-        cpu_cycles = self.cpu.step()
-        ppu_cycles = cpu_cycles * 3  # PPU runs at thrice the speed
-        for _ in range(ppu_cycles):
-            self.ppu.step()
-            self.mapper.step()
-        for _ in range(cpu_cycles):
-            self.apu.step()
-        return cpu_cycles
-
-    def reset(self) -> None:
-        self.cpu.reset()
+        self.ui.draw()
 
 
 if __name__ == "__main__":
@@ -112,7 +132,12 @@ if __name__ == "__main__":
     logging.basicConfig(format='%(levelname)s:%(message)s', level=logging.DEBUG)
     logging.info('Starting...')
 
-    manager = Manager()
-    manager.start()
+    arguments = parse_args()
+    manager = Manager(arguments)
+    if arguments.headless:
+        manager.run()
+    else:
+        import pyglet
 
-    pyglet.app.run()
+        manager.start()
+        pyglet.app.run()
@@ -1,4 +1,6 @@
 class APU(object):
 
+    needs_step = False  # nothing to do per cycle yet
+
     def step(self) -> None:
         pass
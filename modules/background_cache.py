@@ -0,0 +1,146 @@
+import numpy as np
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from .memory import PPUMemory
+
+
+class BackgroundCache(object):
+    """
+    Keeps the four logical nametables rendered as a single 480x512 layer of
+    background colors (attribute << 2 | pixel), laid out as they are
+    scrolled: $2000 top left, $2400 top right, $2800 bottom left and $2C00
+    bottom right.
+
+    Tiles are only drawn again after being invalidated: nametable and
+    attribute writes mark the tiles they cover (in every logical nametable
+    mirroring the one written), CHR RAM writes mark the tiles of the layer
+    showing the pattern written, while CHR bank, mirroring and pattern table
+    changes invalidate the whole layer.
+    """
+
+    def __init__(self, memory: 'PPUMemory') -> None:
+        self.memory = memory
+        self.layer = np.zeros((480, 512), dtype=np.uint8)
+        # One flag per tile of the layer
+        self.dirty = np.ones((60, 64), dtype=bool)
+        # Patterns of the background table written since the last refresh
+        self.dirty_patterns = set()
+        self.pattern_table = 0
+        self.chr_offsets = (0, 0x1000)
+        self.version = 0  # increased every time the layer changes
+        self.columns = np.arange(256)
+        self.rows = np.arange(240)
+        mapper = memory.mapper
+        mapper.add_bank_listener(self.on_bank_switch)
+        mapper.add_mirror_listener(self.invalidate)
+        mapper.add_chr_listener(self.on_chr_write)
+        self.on_bank_switch()
+
+    def invalidate(self) -> None:
+        self.dirty[:] = True
+        self.dirty_patterns.clear()
+        self.version += 1
+
+    def on_bank_switch(self) -> None:
+        self.chr_offsets = self.memory.mapper.chr_bank_offsets()
+        self.invalidate()
+
+    def on_chr_write(self, index: int) -> None:
+        """
+        Marks the pattern a CHR RAM byte belongs to, if it's in the background
+        pattern table. The tiles showing it are found on the next refresh.
+        :param index: CHR index of the byte written
+        """
+        offset = index - self.chr_offsets[self.pattern_table]
+        if 0 <= offset < 0x1000:
+            self.dirty_patterns.add(offset >> 4)
+            self.version += 1
+
+    def on_nametable_write(self, address: int) -> None:
+        """
+        Marks the tiles covered by a nametable or attribute byte.
+        :param address: PPU address of the byte written ($2000-$3EFF)
+        """
+        address = int(address)
+        offset = address & 0x03FF
+        if offset < 0x3C0:
+            rows = slice(offset >> 5, (offset >> 5) + 1)
+            columns = slice(offset & 31, (offset & 31) + 1)
+        else:
+            # Each attribute byte covers 4x4 tiles
+            y, x = (offset - 0x3C0) >> 3, (offset - 0x3C0) & 7
+            rows = slice(y * 4, min(y * 4 + 4, 30))
+            columns = slice(x * 4, x * 4 + 4)
+        written = self.memory.nametables[(address >> 10) & 3]
+        for logical, nametable in enumerate(self.memory.nametables):
+            if nametable is written:
+                dirty = self.dirty[(logical >> 1) * 30:(logical >> 1) * 30 + 30,
+                                   (logical & 1) * 32:(logical & 1) * 32 + 32]
+                dirty[rows, columns] = True
+        self.version += 1
+
+    def refresh(self, pattern_table: int) -> None:
+        """
+        Draws the invalidated tiles again.
+        :param pattern_table: background pattern table (0 or 1)
+        """
+        if pattern_table != self.pattern_table:
+            self.pattern_table = pattern_table
+            self.invalidate()
+        nametables = None
+        if self.dirty_patterns:
+            nametables = self.stack_nametables()
+            # The 60x64 tiles of the layer, from the four nametables
+            names = nametables[:, :0x3C0].reshape(2, 2, 30, 32).transpose(0, 2, 1, 3).reshape(60, 64)
+            self.dirty |= np.isin(names, list(self.dirty_patterns))
+            self.dirty_patterns.clear()
+        ys, xs = np.nonzero(self.dirty)
+        if not len(ys):
+            return
+        logical = (ys // 30) * 2 + xs // 32
+        rows, columns = ys % 30, xs % 32
+
+        if nametables is None:
+            nametables = self.stack_nametables()
+        tiles = nametables[logical, rows * 32 + columns].astype(np.intp)
+        attributes = nametables[logical, 0x3C0 + (rows >> 2) * 8 + (columns >> 2)]
+        shifts = ((rows & 2) << 1) | (columns & 2)
+        palettes = (((attributes >> shifts) & 3) << 2).astype(np.uint8)
+
+        pixels = self.memory.tile_cache.table(pattern_table)[tiles, 0]
+        tiles_view = self.layer.reshape(60, 8, 64, 8)
+        tiles_view[ys, :, xs, :] = pixels | palettes[:, None, None]
+        self.dirty[:] = False
+
+    def stack_nametables(self) -> np.ndarray:
+        """
+        :return: the four logical nametables, as a 4x1024 array of uint8
+        """
+        return np.stack([np.frombuffer(nametable, dtype=np.uint8)
+                         for nametable in self.memory.nametables])
+
+    def position(self, v: int, fine_x: int) -> tuple:
+        """
+        Turns the scroll in v and x into a position in the layer.
+        :return: row and column of the layer
+        """
+        y = ((v >> 11) & 1) * 240 + ((v >> 5) & 0x1F) * 8 + ((v >> 12) & 7)
+        x = ((v >> 10) & 1) * 256 + (v & 0x1F) * 8 + fine_x
+        return y % 480, x
+
+    def line(self, v: int, fine_x: int) -> np.ndarray:
+        """
+        :return: the 256 background colors of the line scrolled to v and x
+        """
+        y, x = self.position(v, fine_x)
+        return self.layer[y].take(self.columns + x, mode='wrap')
+
+    def frame(self, v: int, fine_x: int) -> np.ndarray:
+        """
+        :return: the 240x256 background of a whole frame scrolled to v and
+        x, assuming the scroll isn't changed while it's drawn
+        """
+        y, x = self.position(v, fine_x)
+        rows = self.layer.take(self.rows + y, axis=0, mode='wrap')
+        return rows.take(self.columns + x, axis=1, mode='wrap')
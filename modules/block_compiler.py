@@ -0,0 +1,478 @@
+import logging
+from typing import TYPE_CHECKING, Callable, Dict, List, Optional
+
+from .cpu import InstructionMode
+
+if TYPE_CHECKING:
+    from .cpu import CPU
+
+log = logging.getLogger('logger')
+
+M = InstructionMode
+
+
+class BlockCompiler(object):
+    """
+    Translates straight-line runs of PRG ROM code into Python functions.
+
+    A block starts at a given address and keeps going until it reaches a
+    branch, a jump, JSR/RTS, an instruction that can't be translated or an
+    instruction accessing the PPU/APU/IO registers (those are left to the
+    interpreter, so the rest of the system can catch up before them).
+    Indirect accesses, whose address is only known when running, check it
+    first and leave the block right before the instruction when it falls
+    among the registers. The generated function keeps A/X/Y/SP and the
+    flags in locals, and adds the precomputed cycle total of the block in
+    one go. Before every instruction but the first it checks the cycles
+    left until the limit run_until is heading to, and leaves the block when
+    they're spent, as the interpreter would stop there.
+
+    Blocks are cached per PRG bank, following the mapper bank switches the
+    same way the CPU decode cache does.
+    """
+
+    max_instructions = 32  # longest block to translate
+    hot_threshold = 2  # visits needed before a block gets translated
+
+    # Instructions that end a block after being translated
+    terminators = ('BCC', 'BCS', 'BEQ', 'BMI', 'BNE', 'BPL', 'BVC', 'BVS',
+                   'JMP', 'JSR', 'RTS')
+
+    def __init__(self, cpu: 'CPU') -> None:
+        self.cpu = cpu
+        self.memory = cpu.memory
+        # Blocks (or False when a block can't be built) and visit counters
+        # keyed by PRG bank offset, then by address inside the 16 KB window
+        self.banks = {}  # type: Dict[int, dict]
+        self.windows = None  # type: Optional[List[dict]]
+        self.namespace = {
+            'read': self.memory.read,
+            'write': self.memory.write,
+            'read16bug': self.memory.read16bug,
+        }
+        self.emitters = {
+            'ADC': self.emit_adc, 'AND': self.emit_and, '_AND': self.emit_and,
+            'ASL': self.emit_asl, 'BIT': self.emit_bit, 'CLC': self.emit_flag,
+            'CLD': self.emit_flag, 'CLI': self.emit_flag, 'CLV': self.emit_flag,
+            'CMP': self.emit_compare, 'CPX': self.emit_compare,
+            'CPY': self.emit_compare, 'DEC': self.emit_dec, 'DEX': self.emit_dex,
+            'DEY': self.emit_dey, 'EOR': self.emit_eor, 'INC': self.emit_inc,
+            'INX': self.emit_inx, 'INY': self.emit_iny, 'LDA': self.emit_load,
+            'LDX': self.emit_load, 'LDY': self.emit_load, 'LSR': self.emit_lsr,
+            'NOP': self.emit_nop, 'ORA': self.emit_ora, 'PHA': self.emit_pha,
+            'PHP': self.emit_php, 'PLA': self.emit_pla, 'PLP': self.emit_plp,
+            'ROL': self.emit_rol, 'ROR': self.emit_ror, 'SBC': self.emit_sbc,
+            'SEC': self.emit_flag, 'SED': self.emit_flag, 'SEI': self.emit_flag,
+            'STA': self.emit_store, 'STX': self.emit_store,
+            'STY': self.emit_store, 'TAX': self.emit_transfer,
+            'TAY': self.emit_transfer, 'TSX': self.emit_transfer,
+            'TXA': self.emit_transfer, 'TXS': self.emit_transfer,
+            'TYA': self.emit_transfer,
+        }
+        self.compiled = 0  # number of blocks translated so far
+
+    def set_mapper(self, mapper) -> None:
+        """
+        Follows the mapper bank switches, so blocks are looked up in the
+        banks currently mapped at $8000 and $C000.
+        :param mapper: the cartridge mapper
+        """
+        self.mapper = mapper
+        mapper.add_bank_listener(self.on_bank_switch)
+        self.on_bank_switch()
+
+    def on_bank_switch(self) -> None:
+        windows = []
+        for offset in self.mapper.prg_bank_offsets():
+            blocks = self.banks.get(offset)
+            if blocks is None:
+                blocks = self.banks[offset] = {}
+            windows.append(blocks)
+        self.windows = windows
+
+    def lookup(self, pc: int) -> Optional[Callable]:
+        """
+        Returns the block starting at the given PRG ROM address, translating
+        it once it's hot enough. Returns None when the interpreter has to be
+        used instead.
+        :param pc: an address between 0x8000 and 0xFFFF
+        """
+        blocks = self.windows[(pc >> 14) & 1]
+        index = pc & 0x3FFF
+        block = blocks.get(index, 0)
+        if block.__class__ is int:
+            # Still cold, count the visit
+            block += 1
+            if block < self.hot_threshold:
+                blocks[index] = block
+                return None
+            block = blocks[index] = self.compile(pc) or False
+        return block or None
+
+    def compile(self, pc: int) -> Optional[Callable]:
+        """
+        Translates the block starting at the given address.
+        :param pc: an address between 0x8000 and 0xFFFF
+        :return: the generated function, or None if not even the first
+        instruction can be translated
+        """
+        cpu = self.cpu
+        start = pc
+        window = pc & 0xC000
+        lines = []
+        cycles = 0
+        count = 0
+        terminated = False
+
+        while count < self.max_instructions:
+            opcode = self.memory.read(pc)
+            name = str(cpu.instruction_names[opcode])
+            mode = int(cpu.instruction_modes[opcode])
+            size = cpu.dispatch[opcode][2]
+            emitter = self.emitters.get(name)
+            if name in self.terminators:
+                emitter = self.emit_control
+            if emitter is None or (pc & 0x3FFF) + size > 0x4000:
+                break
+            operand = 0
+            if size == 2:
+                operand = self.memory.read(pc + 1)
+            elif size == 3:
+                operand = self.memory.read16(pc + 1)
+            if self.touches_registers(name, mode, operand):
+                break
+            if cpu.idle_horizon is not None and self.jumps_back(name, mode, pc, operand, start):
+                # Left to the interpreter, which looks for idle loops there
+                break
+
+            # Everything spent so far is accounted in every exit of the block
+            entry_cycles = cycles
+            if count:
+                lines.append(f'if {entry_cycles} + extra >= budget:')
+                lines.extend('    ' + line for line in self.exit_lines(f'0x{pc:04X}', entry_cycles))
+            cycles += int(cpu.instruction_cycles[opcode])
+            instruction = Instruction(pc, opcode, name, mode, size, operand,
+                                      int(cpu.instruction_page_cycles[opcode]),
+                                      cycles, entry_cycles)
+            lines.append(f'# ${pc:04X}: {name} {mode} ${operand:X}')
+            stop = emitter(instruction, lines)
+            pc += size
+            count += 1
+            if name in self.terminators:
+                terminated = True
+                break
+            if stop or (pc & 0xC000) != window:
+                break
+
+        if count == 0:
+            return None
+        if not terminated:
+            lines.extend(self.exit_lines(f'0x{pc:04X}', cycles))
+
+        offset = self.mapper.prg_bank_offsets()[(start >> 14) & 1]
+        function_name = f'block_{offset:x}_{start:04x}'
+        source = [f'def {function_name}(cpu):',
+                  '    a = cpu.a; x = cpu.x; y = cpu.y; sp = cpu.sp',
+                  '    c = cpu.c; z = cpu.z; i = cpu.i; d = cpu.d; v = cpu.v; n = cpu.n',
+                  '    extra = 0; budget = cpu.cycle_limit - cpu.cycles']
+        source.extend('    ' + line for line in lines)
+        namespace = dict(self.namespace)
+        exec(compile('\n'.join(source), f'<{function_name}>', 'exec'), namespace)
+        self.compiled += 1
+        log.debug(f'Compiled block ${start:04X} ({count} instructions, {cycles} cycles)')
+        return namespace[function_name]
+
+    @staticmethod
+    def touches_registers(name: str, mode: int, operand: int) -> bool:
+        """
+        Returns whether an instruction accesses (or might access, when
+        indexed) the PPU/APU/IO registers between $2000 and $401F. Indirect
+        modes are checked when running instead (see register_guard), and
+        the zero page indexed ones can't get past $00FF.
+        """
+        if name in ('JMP', 'JSR'):
+            return False
+        if mode == M.MODE_ABSOLUTE:
+            return 0x2000 <= operand <= 0x401F
+        if mode in (M.MODE_ABSOLUTE_X, M.MODE_ABSOLUTE_Y):
+            return operand <= 0x401F and operand + 0xFF >= 0x2000
+        return False
+
+    @staticmethod
+    def jumps_back(name: str, mode: int, pc: int, operand: int, start: int) -> bool:
+        """
+        Returns whether a branch or an absolute jump goes back inside the
+        block being translated (i.e. the block would be a loop).
+        """
+        if mode == M.MODE_RELATIVE:
+            target = (pc + 2 + (operand - 0x100 if operand & 0x80 else operand)) & 0xFFFF
+        elif name == 'JMP' and mode == M.MODE_ABSOLUTE:
+            target = operand
+        else:
+            return False
+        return start <= target <= pc
+
+    @staticmethod
+    def exit_lines(pc: str, cycles: int) -> List[str]:
+        """
+        Code writing the local state back to the CPU and leaving the block.
+        :param pc: expression with the next program counter
+        :param cycles: cycles spent by the block until this exit
+        """
+        return ['cpu.a = a; cpu.x = x; cpu.y = y; cpu.sp = sp',
+                'cpu.c = c; cpu.z = z; cpu.i = i; cpu.d = d; cpu.v = v; cpu.n = n',
+                f'cpu.pc = {pc}',
+                f'cpu.cycles += {cycles} + extra',
+                'return']
+
+    """
+    OPERAND HELPERS
+    """
+    @staticmethod
+    def address(inst: 'Instruction', lines: List[str]) -> str:
+        """
+        Emits the code computing the effective address of an instruction,
+        adding the page crossing cycle when needed.
+        :return: expression with the address
+        """
+        mode = inst.mode
+        operand = inst.operand
+        if mode in (M.MODE_ZERO_PAGE, M.MODE_ABSOLUTE):
+            return f'0x{operand:04X}'
+        if mode == M.MODE_ZERO_PAGE_X:
+            lines.append(f'ad = (0x{operand:02X} + x) & 0xFF')
+        elif mode == M.MODE_ZERO_PAGE_Y:
+            lines.append(f'ad = (0x{operand:02X} + y) & 0xFF')
+        elif mode in (M.MODE_ABSOLUTE_X, M.MODE_ABSOLUTE_Y):
+            register = 'x' if mode == M.MODE_ABSOLUTE_X else 'y'
+            if inst.page_cycles:
+                lines.append(f'if 0x{operand & 0xFF:02X} + {register} > 0xFF: extra += {inst.page_cycles}')
+            lines.append(f'ad = (0x{operand:04X} + {register}) & 0xFFFF')
+        elif mode == M.MODE_INDEXED_INDIRECT:
+            lines.append(f'ad = read16bug((0x{operand:02X} + x) & 0xFF)')
+            BlockCompiler.register_guard(inst, lines)
+        elif mode == M.MODE_INDIRECT_INDEXED:
+            lines.append(f'base = read16bug(0x{operand:02X}); ad = (base + y) & 0xFFFF')
+            BlockCompiler.register_guard(inst, lines)
+            if inst.page_cycles:
+                lines.append(f'if (base & 0xFF) + y > 0xFF: extra += {inst.page_cycles}')
+        else:
+            raise ValueError(f'Unexpected addressing mode {mode}')
+        return 'ad'
+
+    @staticmethod
+    def register_guard(inst: 'Instruction', lines: List[str]) -> None:
+        """
+        Emits an exit right before the instruction when its address falls
+        among the PPU/APU/IO registers, so the interpreter runs it with the
+        CPU state up to date.
+        """
+        lines.append('if 0x2000 <= ad <= 0x401F:')
+        lines.extend('    ' + line
+                     for line in BlockCompiler.exit_lines(f'0x{inst.pc:04X}', inst.entry_cycles))
+
+    def load(self, inst: 'Instruction', lines: List[str]) -> str:
+        """
+        Emits the code reading the operand value of an instruction.
+        :return: expression with the value
+        """
+        if inst.mode == M.MODE_IMMEDIATE:
+            return f'0x{inst.operand:02X}'
+        return f'read({self.address(inst, lines)})'
+
+    @staticmethod
+    def zn(register: str) -> str:
+        return f'z = 1 if {register} == 0 else 0; n = {register} >> 7'
+
+    def shift(self, inst: 'Instruction', lines: List[str], code: str) -> None:
+        """
+        Emits a read-modify-write operation over the accumulator or memory,
+        where code turns the local `m` into the new value.
+        """
+        if inst.mode == M.MODE_ACCUMULATOR:
+            lines.append('m = a')
+            lines.append(code)
+            lines.append('a = m; ' + self.zn('a'))
+        else:
+            address = self.address(inst, lines)
+            if address != 'ad':
+                lines.append(f'ad = {address}')
+            lines.append('m = read(ad)')
+            lines.append(code)
+            lines.append('write(ad, m); ' + self.zn('m'))
+            self.check_mapper_write(inst, lines)
+
+    def check_mapper_write(self, inst: 'Instruction', lines: List[str]) -> Optional[bool]:
+        """
+        Writes to the cartridge may switch banks, making the rest of the
+        block stale. Returns True when that's known at compile time, and
+        emits an early exit when the address is only known when running.
+        """
+        if inst.mode in (M.MODE_ZERO_PAGE, M.MODE_ZERO_PAGE_X, M.MODE_ZERO_PAGE_Y):
+            return None
+        if inst.mode == M.MODE_ABSOLUTE:
+            return True if inst.operand >= 0x8000 else None
+        lines.append('if ad >= 0x8000:')
+        lines.extend('    ' + line
+                     for line in self.exit_lines(f'0x{inst.pc + inst.size:04X}', inst.cycles))
+        return None
+
+    """
+    EMITTERS
+    Each one appends the code for a single instruction. Returning True ends
+    the block after that instruction.
+    """
+    def emit_adc(self, inst, lines):
+        lines.append(f'm = {self.load(inst, lines)}; t = a + m + c')
+        lines.append('v = 1 if (a ^ m) & 0x80 == 0 and (a ^ t) & 0x80 != 0 else 0')
+        lines.append('c = 1 if t > 0xFF else 0; a = t & 0xFF; ' + self.zn('a'))
+
+    def emit_sbc(self, inst, lines):
+        lines.append(f'm = {self.load(inst, lines)}; t = a - m - (1 - c)')
+        lines.append('v = 1 if (a ^ m) & 0x80 != 0 and (a ^ t) & 0x80 != 0 else 0')
+        lines.append('c = 1 if t >= 0 else 0; a = t & 0xFF; ' + self.zn('a'))
+
+    def emit_and(self, inst, lines):
+        lines.append(f'a &= {self.load(inst, lines)}; ' + self.zn('a'))
+
+    def emit_ora(self, inst, lines):
+        lines.append(f'a |= {self.load(inst, lines)}; ' + self.zn('a'))
+
+    def emit_eor(self, inst, lines):
+        lines.append(f'a ^= {self.load(inst, lines)}; ' + self.zn('a'))
+
+    def emit_bit(self, inst, lines):
+        lines.append(f'm = {self.load(inst, lines)}')
+        lines.append('v = (m >> 6) & 1; n = m >> 7; z = 1 if m & a == 0 else 0')
+
+    def emit_compare(self, inst, lines):
+        register = {'CMP': 'a', 'CPX': 'x', 'CPY': 'y'}[inst.name]
+        lines.append(f'm = {self.load(inst, lines)}; t = ({register} - m) & 0xFF')
+        lines.append(f'c = 1 if {register} >= m else 0; ' + self.zn('t'))
+
+    def emit_load(self, inst, lines):
+        register = inst.name[2].lower()
+        lines.append(f'{register} = {self.load(inst, lines)}; ' + self.zn(register))
+
+    def emit_store(self, inst, lines):
+        register = inst.name[2].lower()
+        lines.append(f'write({self.address(inst, lines)}, {register})')
+        return self.check_mapper_write(inst, lines)
+
+    def emit_asl(self, inst, lines):
+        self.shift(inst, lines, 'c = m >> 7; m = (m << 1) & 0xFF')
+
+    def emit_lsr(self, inst, lines):
+        self.shift(inst, lines, 'c = m & 1; m >>= 1')
+
+    def emit_rol(self, inst, lines):
+        self.shift(inst, lines, 't = c; c = m >> 7; m = ((m << 1) | t) & 0xFF')
+
+    def emit_ror(self, inst, lines):
+        self.shift(inst, lines, 't = c; c = m & 1; m = (m >> 1) | (t << 7)')
+
+    def emit_inc(self, inst, lines):
+        self.shift(inst, lines, 'm = (m + 1) & 0xFF')
+
+    def emit_dec(self, inst, lines):
+        self.shift(inst, lines, 'm = (m - 1) & 0xFF')
+
+    def emit_inx(self, inst, lines):
+        lines.append('x = (x + 1) & 0xFF; ' + self.zn('x'))
+
+    def emit_iny(self, inst, lines):
+        lines.append('y = (y + 1) & 0xFF; ' + self.zn('y'))
+
+    def emit_dex(self, inst, lines):
+        lines.append('x = (x - 1) & 0xFF; ' + self.zn('x'))
+
+    def emit_dey(self, inst, lines):
+        lines.append('y = (y - 1) & 0xFF; ' + self.zn('y'))
+
+    def emit_transfer(self, inst, lines):
+        source = inst.name[1].lower().replace('s', 'sp')
+        target = inst.name[2].lower().replace('s', 'sp')
+        lines.append(f'{target} = {source}')
+        if target != 'sp':
+            lines.append(self.zn(target))
+
+    def emit_flag(self, inst, lines):
+        flag = inst.name[2].lower()
+        lines.append(f'{flag} = {1 if inst.name[0] == "S" else 0}')
+
+    def emit_nop(self, inst, lines):
+        if inst.page_cycles:
+            # Only needed for the page crossing cycle
+            self.address(inst, lines)
+        else:
+            lines.append('pass')
+
+    def emit_pha(self, inst, lines):
+        lines.append('write(0x100 | sp, a); sp = (sp - 1) & 0xFF')
+
+    def emit_php(self, inst, lines):
+        lines.append('write(0x100 | sp, c | z << 1 | i << 2 | d << 3 | 0x10 | cpu.u << 5 | v << 6 | n << 7)')
+        lines.append('sp = (sp - 1) & 0xFF')
+
+    def emit_pla(self, inst, lines):
+        lines.append('sp = (sp + 1) & 0xFF; a = read(0x100 | sp); ' + self.zn('a'))
+
+    def emit_plp(self, inst, lines):
+        lines.append('sp = (sp + 1) & 0xFF; m = read(0x100 | sp)')
+        lines.append('c = m & 1; z = (m >> 1) & 1; i = (m >> 2) & 1; d = (m >> 3) & 1')
+        lines.append('v = (m >> 6) & 1; n = m >> 7; cpu.b = 0; cpu.u = 1')
+
+    def emit_control(self, inst, lines):
+        """
+        Branches, jumps and subroutine calls/returns, always the last
+        instruction of a block.
+        """
+        name = inst.name
+        next_pc = inst.pc + inst.size
+        if name == 'JMP' and inst.mode == M.MODE_ABSOLUTE:
+            lines.extend(self.exit_lines(f'0x{inst.operand:04X}', inst.cycles))
+        elif name == 'JMP':
+            lines.extend(self.exit_lines(f'read16bug(0x{inst.operand:04X})', inst.cycles))
+        elif name == 'JSR':
+            lines.append(f'write(0x100 | sp, 0x{((next_pc - 1) >> 8) & 0xFF:02X}); sp = (sp - 1) & 0xFF')
+            lines.append(f'write(0x100 | sp, 0x{(next_pc - 1) & 0xFF:02X}); sp = (sp - 1) & 0xFF')
+            lines.extend(self.exit_lines(f'0x{inst.operand:04X}', inst.cycles))
+        elif name == 'RTS':
+            lines.append('sp = (sp + 1) & 0xFF; t = read(0x100 | sp)')
+            lines.append('sp = (sp + 1) & 0xFF; t |= read(0x100 | sp) << 8')
+            lines.extend(self.exit_lines('(t + 1) & 0xFFFF', inst.cycles))
+        else:
+            # Branches: the target and its page crossing are known beforehand
+            offset = inst.operand if inst.operand < 0x80 else inst.operand - 0x100
+            target = (next_pc + offset) & 0xFFFF
+            taken = 2 if (next_pc & 0xFF00) != (target & 0xFF00) else 1
+            condition = {
+                'BCC': 'c == 0', 'BCS': 'c != 0', 'BEQ': 'z != 0',
+                'BMI': 'n != 0', 'BNE': 'z == 0', 'BPL': 'n == 0',
+                'BVC': 'v == 0', 'BVS': 'v != 0',
+            }[name]
+            lines.append(f'if {condition}:')
+            lines.extend('    ' + line
+                         for line in self.exit_lines(f'0x{target:04X}', inst.cycles + taken))
+            lines.extend(self.exit_lines(f'0x{next_pc:04X}', inst.cycles))
+        return True
+
+
+class Instruction(object):
+    """
+    A decoded instruction, as seen by the block compiler.
+    """
+    __slots__ = ('pc', 'opcode', 'name', 'mode', 'size', 'operand',
+                 'page_cycles', 'cycles', 'entry_cycles')
+
+    def __init__(self, pc: int, opcode: int, name: str, mode: int, size: int,
+                 operand: int, page_cycles: int, cycles: int, entry_cycles: int) -> None:
+        self.pc = pc
+        self.opcode = opcode
+        self.name = name
+        self.mode = mode
+        self.size = size
+        self.operand = operand
+        self.page_cycles = page_cycles
+        self.cycles = cycles  # block cycles up to (and including) this one
+        self.entry_cycles = entry_cycles  # block cycles before this one
@@ -12,28 +12,43 @@ class Cartridge:
     chr: np.ndarray = None  # CHR cartridge ROM (graphics and sound data)
     mapper: BaseMapper = None
     mirror: np.uint8 = None
-    sram: np.ndarray = np.ndarray((0x2000,), dtype=np.uint8)  # Save RAM (if any)
+    sram: np.ndarray = None  # Save RAM (if any)
 
-    def __init__(self, filename: str = None) -> None:
+    def __init__(self, filename: str = None, data: bytes = None) -> None:
+        """
+        :param filename: iNES file to load
+        :param data: contents of an iNES file, instead of the filename
+        """
         self.prg = np.zeros((0x2000, ))
+        self.sram = np.zeros(0x2000, dtype=np.uint8)
         self.mirror = np.uint8(0)
         if filename is not None:
             self.load(filename)
+        elif data is not None:
+            self.load_bytes(data)
 
     def load(self, file: str):
         log.debug(f'Reading cartridge {file}...')
         with open(file, 'rb') as f:
-            header = f.read(16)
-            self._parse_header(header)
+            self.load_bytes(f.read())
 
-            # Read PRG ROM
-            self.prg = np.frombuffer(f.read(self._prg_rom_pages * 0x4000), dtype=np.uint8)
+    def load_bytes(self, data: bytes) -> None:
+        header = data[:16]
+        self._parse_header(header)
 
-            # Read CHR ROM
-            self.chr = np.frombuffer(f.read(self._chr_rom_pages * 0x2000), dtype=np.uint8)
+        # Read PRG ROM
+        prg_end = 16 + self._prg_rom_pages * 0x4000
+        self.prg = np.frombuffer(data[16:prg_end], dtype=np.uint8)
 
-            self.mapper = self.load_mapper(self._mapper_id)
-            log.debug(f'Uses mapper: {self.mapper.__class__}')
+        # Read CHR ROM
+        chr_end = prg_end + self._chr_rom_pages * 0x2000
+        self.chr = np.frombuffer(data[prg_end:chr_end], dtype=np.uint8)
+        if self._chr_rom_pages == 0:
+            # No CHR ROM means the cartridge has 8KB of CHR RAM instead
+            self.chr = np.zeros(0x2000, dtype=np.uint8)
+
+        self.mapper = self.load_mapper(self._mapper_id)
+        log.debug(f'Uses mapper: {self.mapper.__class__}')
 
     def _parse_header(self, header: bytes) -> None:
         # Verify legal header.
@@ -48,6 +63,12 @@ class Cartridge:
         self._flags6 = header[6]
         self._flags7 = header[7]
 
+        # Nametable mirroring (values match the PPUMemory.MIRROR_* constants)
+        if self._flags6 & 0b1000:
+            self.mirror = np.uint8(4)  # four-screen
+        else:
+            self.mirror = np.uint8(self._flags6 & 1)  # horizontal or vertical
+
         if self._flags7 & 0b100:
             # NES 2.0 format
             raise Exception('NES 2.0 format not yet implemented.')
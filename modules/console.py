@@ -0,0 +1,173 @@
+import logging
+from typing import Union
+
+from .apu import APU
+from .cartridge import Cartridge
+from .controller import IO
+from .cpu import CPU
+from .memory import Memory, PPUMemory
+from .ppu import PPU
+from .scheduler import Scheduler
+
+log = logging.getLogger('logger')
+
+
+class Console(object):
+    """
+    A whole NES: the cartridge, the CPU, the PPU, the APU and the I/O ports,
+    wired together by explicit references. Nothing is global, so any number
+    of consoles can run side by side in the same process; the frontend only
+    has to call step() (or run_frame()) and listen for frames through
+    ppu.add_frame_listener.
+    """
+
+    cpu_batch_cycles = 24  # CPU cycles run before syncing the rest
+
+    def __init__(self, rom: Union[str, bytes]) -> None:
+        """
+        :param rom: path of an iNES file, or its contents
+        """
+        if isinstance(rom, str):
+            self.cartridge = Cartridge(rom)
+        else:
+            self.cartridge = Cartridge(data=rom)
+        self.mapper = self.cartridge.mapper
+        self.memory = Memory()
+        self.ppu_memory = PPUMemory(self)
+        self.cpu = CPU(self.memory)
+        self.ppu = PPU(self.memory, self.ppu_memory, self.cpu)
+        self.apu = APU()
+        self.io = IO()
+        self.scheduler = Scheduler()
+        self.catch_up_mode = False
+        self.tracer = None
+
+        self.memory.connect(self)
+        self.ppu_memory.connect(self.mapper)
+        self.cpu.set_mapper(self.mapper)
+        self.scheduler.add_component(self.ppu, 3)  # PPU runs at thrice the speed
+        self.scheduler.add_component(self.mapper, 3)
+        self.scheduler.add_component(self.apu)
+
+    def reset(self) -> None:
+        self.cpu.reset()
+        self.ppu.scheduler = self.scheduler if self.catch_up_mode else None
+        self.ppu.nmi_pending = False
+        if self.catch_up_mode:
+            self.schedule_ppu_events()
+
+    def step(self) -> int:
+        """
+        Runs a batch of CPU instructions and lets the rest of the system
+        catch up.
+        :return: the number of CPU cycles run
+        """
+        # The CPU runs ahead, in small batches or (in catch-up mode) until the
+        # next scheduled event, where catching up delivers the NMI or ends the
+        # DMA. Batches end early whenever the PPU/APU/IO registers are
+        # accessed or an interrupt is requested, and small batches also stop
+        # at the PPU deadline, so NMIs aren't taken late
+        start = self.cpu.cycles
+        if self.catch_up_mode:
+            self.cpu.run_until(self.scheduler.next_event())
+        else:
+            self.cpu.run_until(min(start + self.cpu_batch_cycles, self.ppu_deadline()))
+        self.catch_up()
+        if self.catch_up_mode:
+            # Register writes may have moved them
+            self.schedule_ppu_events()
+        return self.cpu.cycles - start
+
+    def run_frame(self) -> None:
+        """
+        Runs until the PPU finishes the current frame.
+        """
+        frame = self.ppu.frame
+        while self.ppu.frame == frame:
+            self.step()
+
+    def catch_up(self) -> None:
+        """
+        Runs the PPU, the mapper and the APU until they reach the CPU. Called
+        at the end of every batch, and by the memory bus before the CPU
+        accesses a PPU register.
+        """
+        if self.cpu.cycles <= self.ppu.last_synced:
+            return
+        self.ppu.last_synced = self.cpu.cycles
+        self.scheduler.advance(self.cpu.cycles)
+
+    def ppu_deadline(self) -> int:
+        """
+        CPU cycle where the rest of the system has to catch up with the PPU
+        (see PPU.cycles_until_deadline).
+        """
+        return self.ppu_cycle(self.ppu.cycles_until_deadline())
+
+    def ppu_cycle(self, cycles: int) -> int:
+        """
+        CPU cycle where the PPU will have run the given number of PPU cycles
+        past the point it has caught up to, rounded up.
+        """
+        return self.scheduler.cycle + max(-(-cycles // 3), 1)
+
+    def schedule_ppu_events(self) -> None:
+        """
+        Schedules the next NMI, delivered by its event, and the end of the
+        frame (only stopping the CPU, so run_frame returns on time).
+        """
+        ppu = self.ppu
+        if ppu.nmi_pending:
+            # Safety net, should the NMI have come before its event
+            self.deliver_nmi(self.scheduler.cycle)
+        frame_end = 262 * 341 - (ppu.scanline * 341 + ppu.cycle)
+        self.scheduler.schedule(self.ppu_cycle(frame_end), 'frame end')
+        nmi = ppu.cycles_until_nmi()
+        if nmi is None:
+            self.scheduler.cancel('nmi')
+        else:
+            self.scheduler.schedule(self.ppu_cycle(nmi), 'nmi', self.deliver_nmi)
+
+    def deliver_nmi(self, cycle: int) -> None:
+        """
+        Passes the NMI raised by the PPU to the CPU.
+        :param cycle: CPU cycle of the event
+        """
+        if self.ppu.nmi_pending:
+            self.ppu.nmi_pending = False
+            self.cpu.trigger_nmi()
+
+    def idle_horizon(self) -> int:
+        """
+        CPU cycles left until the next PPU event, taking into account that the
+        PPU hasn't caught up with the CPU yet.
+        """
+        behind = self.cpu.cycles - self.ppu.last_synced
+        return self.ppu.cycles_until_event() // 3 - behind
+
+    def ppu_position(self) -> tuple:
+        """
+        Scanline and dot the PPU will be at once it catches up with the CPU.
+        """
+        dot = self.ppu.cycle + (self.cpu.cycles - self.ppu.last_synced) * 3
+        scanline = (self.ppu.scanline + dot // 341) % 262
+        return scanline, dot % 341
+
+    def enable_idle_detection(self) -> None:
+        self.cpu.enable_idle_detection(self.idle_horizon)
+
+    def enable_trace(self, path: str) -> None:
+        """
+        Starts writing every executed instruction to the given file (see
+        Tracer.format to turn it into text).
+        """
+        from .tracer import Tracer
+
+        self.disable_trace()
+        self.tracer = Tracer(self.cpu, path, self.ppu_position)
+        self.tracer.start()
+
+    def disable_trace(self) -> None:
+        if self.tracer is not None:
+            self.tracer.stop()
+            self.tracer = None
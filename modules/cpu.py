@@ -1,26 +1,46 @@
 import numpy as np
 import threading
-from typing import TYPE_CHECKING, Optional
+from functools import wraps
+from typing import TYPE_CHECKING, Callable, Optional, Tuple, Union
 
 if TYPE_CHECKING:
+    from .mappers import BaseMapper
     from .memory import Memory
 
 
 class InstructionMode(object):
 
-    MODE_ABSOLUTE = 0
-    MODE_ABSOLUTE_X = 1
-    MODE_ABSOLUTE_Y = 2
-    MODE_ACCUMULATOR = 3
-    MODE_IMMEDIATE = 4
-    MODE_IMPLIED = 5
-    MODE_INDEXED_INDIRECT = 6
-    MODE_INDIRECT = 7
-    MODE_INDIRECT_INDEXED = 8
-    MODE_RELATIVE = 9
-    MODE_ZERO_PAGE = 10
-    MODE_ZERO_PAGE_X = 11
-    MODE_ZERO_PAGE_Y = 12
+    # These values match the ones used in CPU.instruction_modes
+    MODE_ABSOLUTE = 1
+    MODE_ABSOLUTE_X = 2
+    MODE_ABSOLUTE_Y = 3
+    MODE_ACCUMULATOR = 4
+    MODE_IMMEDIATE = 5
+    MODE_IMPLIED = 6
+    MODE_INDEXED_INDIRECT = 7
+    MODE_INDIRECT = 8
+    MODE_INDIRECT_INDEXED = 9
+    MODE_RELATIVE = 10
+    MODE_ZERO_PAGE = 11
+    MODE_ZERO_PAGE_X = 12
+    MODE_ZERO_PAGE_Y = 13
+
+    # Instruction size (opcode + operand) implied by each addressing mode
+    sizes = {
+        MODE_ABSOLUTE: 3,
+        MODE_ABSOLUTE_X: 3,
+        MODE_ABSOLUTE_Y: 3,
+        MODE_ACCUMULATOR: 1,
+        MODE_IMMEDIATE: 2,
+        MODE_IMPLIED: 1,
+        MODE_INDEXED_INDIRECT: 2,
+        MODE_INDIRECT: 3,
+        MODE_INDIRECT_INDEXED: 2,
+        MODE_RELATIVE: 2,
+        MODE_ZERO_PAGE: 2,
+        MODE_ZERO_PAGE_X: 2,
+        MODE_ZERO_PAGE_Y: 2,
+    }
 
 
 class Interrupt(object):
@@ -31,11 +51,9 @@ class Interrupt(object):
 
 
 class StepInfo(object):
-    pc = None  # type: np.uint16
-    address = None  # type: np.uint8
-    mode = None  # type: InstructionMode
+    __slots__ = ('address', 'pc', 'mode')
 
-    def __init__(self, address: np.uint8, pc: np.uint8, mode: InstructionMode):
+    def __init__(self, address: int, pc: int, mode: int):
         self.address = address
         self.pc = pc
         self.mode = mode
@@ -151,42 +169,181 @@ class CPU(object):
     ])
 
     frequency = 1789773
-
-    cycles: np.uint64 = 0
-    pc = 0  # program counter, stores the next instruction
-    sp: np.uint16 = np.uint16(0xFD)  # stack pointer (documented initial state)
-    a: np.uint8 = np.uint8(0)  # accumulator
-    x: np.uint8 = np.uint8(0)  # X register
-    y: np.uint8 = np.uint8(0)  # Y register
-    c: np.uint8 = np.uint8(0)  # carry flag
-    z: np.uint8 = np.uint8(0)  # zero flag
-    i: np.uint8 = np.uint8(0)  # interrupt disable flag
-    d: np.uint8 = np.uint8(0)  # decimal mode flag
-    b: np.uint8 = np.uint8(0)  # break command flag
-    u: np.uint8 = np.uint8(0)  # unused flag
-    v: np.uint8 = np.uint8(0)  # overflow flag
-    n: np.uint8 = np.uint8(0)  # negative flag
-    interrupt = Interrupt.NONE  # interrupt type to perform
-    stall = 0  # number of cycles to stall
-    table = []
-    memory: 'Memory' = None
+    no_cycle_limit = 1 << 62  # cycle_limit outside run_until
+
+    # Registers and flags are plain ints, masked explicitly to their width
+    __slots__ = (
+        'memory',
+        'mapper',
+        'dispatch',
+        'decoded_banks',  # decoded PRG instructions, keyed by bank offset
+        'decode_windows',  # decoded banks mapped at $8000 and $C000
+        'block_compiler',  # translates PRG ROM code when enabled
+        'idle_horizon',  # cycles until the next PPU event, for idle loops
+        'idle_loops',  # analyzed backward jumps, see analyze_idle_loop
+        'idle_state',  # state seen the last time a polling loop jumped back
+        'idle_cycles_skipped',  # cycles fast-forwarded over idle loops
+        'cycle_limit',  # where run_until stops, checked by translated blocks
+        'cycles',
+        'pc',  # program counter, stores the next instruction
+        'sp',  # stack pointer
+        'a',  # accumulator
+        'x',  # X register
+        'y',  # Y register
+        'c',  # carry flag
+        'z',  # zero flag
+        'i',  # interrupt disable flag
+        'd',  # decimal mode flag
+        'b',  # break command flag
+        'u',  # unused flag
+        'v',  # overflow flag
+        'n',  # negative flag
+        'interrupt',  # interrupt type to perform
+        'stall',  # number of cycles to stall
+        'sync_requested',  # set when the batched run loop has to stop
+    )
 
     def __init__(self, memory: 'Memory'):
         self.memory = memory
+        self.cycles = 0
+        self.pc = 0
+        self.sp = 0xFD  # documented initial state
+        self.a = 0
+        self.x = 0
+        self.y = 0
+        self.c = 0
+        self.z = 0
+        self.i = 0
+        self.d = 0
+        self.b = 0
+        self.u = 0
+        self.v = 0
+        self.n = 0
+        self.interrupt = Interrupt.NONE
+        self.stall = 0
+        self.sync_requested = False
+        self.cycle_limit = self.no_cycle_limit
+        self.mapper = None
+        self.decoded_banks = {}
+        self.decode_windows = None
+        self.block_compiler = None
+        self.idle_horizon = None
+        self.idle_loops = {}
+        self.idle_state = None
+        self.idle_cycles_skipped = 0
+        self.dispatch = self.build_dispatch_table()
+
+    def build_dispatch_table(self) -> list:
+        """
+        Builds the 256-entry table used by step() to execute an opcode with
+        a single indexed fetch. Each entry holds the addressing mode
+        resolver, the handler, the instruction size, its base cycles, the
+        extra cycles taken when a page is crossed and the addressing mode.
+        :return: list of tuples indexed by opcode
+        """
+        resolvers = {
+            InstructionMode.MODE_ABSOLUTE: self.resolve_absolute,
+            InstructionMode.MODE_ABSOLUTE_X: self.resolve_absolute_x,
+            InstructionMode.MODE_ABSOLUTE_Y: self.resolve_absolute_y,
+            InstructionMode.MODE_ACCUMULATOR: self.resolve_implied,
+            InstructionMode.MODE_IMMEDIATE: self.resolve_immediate,
+            InstructionMode.MODE_IMPLIED: self.resolve_implied,
+            InstructionMode.MODE_INDEXED_INDIRECT: self.resolve_indexed_indirect,
+            InstructionMode.MODE_INDIRECT: self.resolve_indirect,
+            InstructionMode.MODE_INDIRECT_INDEXED: self.resolve_indirect_indexed,
+            InstructionMode.MODE_RELATIVE: self.resolve_relative,
+            InstructionMode.MODE_ZERO_PAGE: self.resolve_zero_page,
+            InstructionMode.MODE_ZERO_PAGE_X: self.resolve_zero_page_x,
+            InstructionMode.MODE_ZERO_PAGE_Y: self.resolve_zero_page_y,
+        }
+        table = []
+        for opcode in range(256):
+            mode = int(self.instruction_modes[opcode])
+            # Illegal opcodes have no size in the original table, so it's
+            # taken from their addressing mode instead
+            size = int(self.instruction_sizes[opcode]) or InstructionMode.sizes[mode]
+            handler = getattr(self, str(self.instruction_names[opcode]).lower())
+            table.append((resolvers[mode], handler, size,
+                          int(self.instruction_cycles[opcode]),
+                          int(self.instruction_page_cycles[opcode]), mode))
+        return table
 
     def reset(self) -> None:
-        self.pc = self.memory.read(np.uint8(0xFFFC))
-        self.sp = np.uint16(0xFD)
-        self.set_flags(np.uint8(0x24))
+        self.pc = self.memory.read16(0xFFFC)
+        self.sp = 0xFD
+        self.set_flags(0x24)
 
     def run_instruction(self, inst: str, **kwargs) -> None:
         if inst not in self.instruction_names:
             raise Exception('Invalid instruction!')
         getattr(self, inst.lower())(**kwargs)
 
+    def run_cycles(self, budget: int) -> int:
+        """
+        Executes instructions until the given amount of cycles has been spent
+        or an event needs the rest of the system to catch up (see run_until).
+        :param budget: number of CPU cycles to run
+        :return: the number of cycles consumed
+        """
+        return self.run_until(self.cycles + budget)
+
+    def run_until(self, target: Union[int, Callable[['CPU'], bool]]) -> int:
+        """
+        Executes instructions in a tight loop until the target is reached or
+        an event is raised: an interrupt request, a DMA stall or an access to
+        the PPU/APU/IO registers. Stall cycles are consumed in bulk.
+        :param target: the CPU cycle count to reach, or a predicate receiving
+        the CPU that is checked after every instruction
+        :return: the number of cycles consumed
+        """
+        start = self.cycles
+        if callable(target):
+            predicate, limit = target, None
+        else:
+            predicate, limit = None, int(target)
+        step = self.step
+        self.sync_requested = False
+        self.cycle_limit = self.no_cycle_limit if limit is None else limit
+
+        while True:
+            if self.stall:
+                cycles = self.stall
+                if limit is not None:
+                    cycles = min(cycles, max(limit - self.cycles, 1))
+                self.stall -= cycles
+                self.cycles += cycles
+            else:
+                step()
+            if self.sync_requested:
+                break
+            if limit is not None and self.cycles >= limit:
+                break
+            if predicate is not None and predicate(self):
+                break
+
+        self.sync_requested = False
+        self.cycle_limit = self.no_cycle_limit
+        return self.cycles - start
+
+    def trigger_nmi(self) -> None:
+        """
+        Requests a non maskable interrupt, handled before the next instruction.
+        """
+        self.interrupt = Interrupt.NMI
+        self.sync_requested = True
+
+    def trigger_irq(self) -> None:
+        """
+        Requests an IRQ, unless they're disabled by the I flag.
+        """
+        if self.i == 0:
+            self.interrupt = Interrupt.IRQ
+            self.sync_requested = True
+
     def step(self) -> int:
         if self.stall:
             self.stall -= 1
+            self.cycles += 1
             return 1
 
         # Handle interrupts
@@ -196,103 +353,292 @@ class CPU(object):
             self.irq()
         self.interrupt = Interrupt.NONE
 
-        page_crossed = False
-        address = None
-
         cycles = self.cycles
-
-        # Get the opcode from the program counter, and its instruction mode
-        opcode = self.memory.read(self.pc)
-        print(f'opcode: {opcode}')
-        if int(opcode) >= self.instruction_modes.size:
-            print('coso')
-        mode = self.instruction_modes[opcode]
+        pc = self.pc
+
+        # Translated blocks run several instructions in a single call
+        compiler = self.block_compiler
+        if compiler is not None and pc >= 0x8000:
+            block = compiler.lookup(pc)
+            if block is not None:
+                block(self)
+                if self.cycles != cycles:
+                    return self.cycles - cycles
+                # The block left before its first instruction, which accesses
+                # a register through a pointer
+
+        # Get everything needed to execute the instruction: PRG ROM code is
+        # decoded once per bank, anything else (RAM, SRAM) can be rewritten
+        # so it's decoded every time
+        windows = self.decode_windows
+        if windows is not None and pc >= 0x8000:
+            entries = windows[(pc >> 14) & 1]
+            entry = entries[pc & 0x3FFF]
+            if entry is None:
+                entry = self.decode(pc)
+                # Instructions crossing into the other window can't be cached,
+                # as their operand may come from a different bank
+                if (pc & 0x3FFF) + entry[2] <= 0x4000:
+                    entries[pc & 0x3FFF] = entry
+        else:
+            entry = self.decode(pc)
+        resolve, handler, size, base_cycles, page_cycles, mode, operand = entry
 
         # According to the given instruction's mode, we define which address to
         # send to its handler
-        if mode == InstructionMode.MODE_ABSOLUTE:
-            address = self.memory.read16(self.pc + 1)
-        elif mode == InstructionMode.MODE_ABSOLUTE_X:
-            address = self.memory.read16(self.pc + 1) + np.uint16(self.x)
-            page_crossed = self.pages_differ(address - np.uint16(self.x),
-                                             address)
-        elif mode == InstructionMode.MODE_ABSOLUTE_Y:
-            address = self.memory.read16(self.pc + 1) + np.uint16(self.y)
-            page_crossed = self.pages_differ(address - np.uint16(self.y),
-                                             address)
-        elif mode == InstructionMode.MODE_ACCUMULATOR:
-            address = 0
-        elif mode == InstructionMode.MODE_IMMEDIATE:
-            address = self.pc + 1
-        elif mode == InstructionMode.MODE_IMPLIED:
-            address = 0
-        elif mode == InstructionMode.MODE_INDEXED_INDIRECT:
-            address = self.memory.read16bug(np.uint16(self.memory.read(
-                self.pc + 1) + self.x))
-        elif mode == InstructionMode.MODE_INDIRECT:
-            address = self.memory.read16bug(self.memory.read16(self.pc + 1))
-        elif mode == InstructionMode.MODE_INDIRECT_INDEXED:
-            address = self.memory.read16bug(np.uint16(self.memory.read(
-                self.pc + 1))) + np.uint16(self.y)
-            page_crossed = self.pages_differ(address - np.uint16(self.y),
-                                             address)
-        elif mode == InstructionMode.MODE_RELATIVE:
-            offset = np.add(np.int16(self.memory.read(self.pc + 1)),
-                            np.uint16(self.y))
-
-            if offset < 0x80:
-                address = self.pc + 2 + offset
-            else:
-                address = self.pc + 2 + offset - 0x100
-        elif mode == InstructionMode.MODE_ZERO_PAGE:
-            address = np.uint16(self.memory.read(self.pc + 1))
-        elif mode == InstructionMode.MODE_ZERO_PAGE_X:
-            address = np.uint16(self.memory.read(self.pc + 1) + self.x)
-        elif mode == InstructionMode.MODE_ZERO_PAGE_Y:
-            address = np.uint16(self.memory.read(self.pc + 1) + self.y)
-
-        self.pc += np.uint16(self.instruction_sizes[opcode])
-        self.cycles += np.uint64(self.instruction_cycles[opcode])
+        address, page_crossed = resolve(pc, operand)
 
+        self.pc = (pc + size) & 0xFFFF
+        self.cycles += base_cycles
         if page_crossed:
-            self.cycles += np.uint64(self.instruction_page_cycles[opcode])
-
-        info = StepInfo(address, self.pc, mode)
-        opcode_name = self.instruction_names[opcode].lower()
+            self.cycles += page_cycles
 
         # Execute the operation
-        opcode = getattr(self, opcode_name, None)
-        if opcode:
-            opcode(info)
-            print('Executing opcode: ' + opcode_name)
-            print('address: ' + str(hex(address)))
-            print('pc: ' + str(hex(self.pc)))
-
-        print(f'cycles: {self.cycles}')
-        return int(self.cycles - cycles)
-
-    def set_n(self, value: np.uint8) -> None:
+        handler(StepInfo(address, self.pc, mode))
+        return self.cycles - cycles
+
+    def decode(self, pc: int) -> tuple:
+        """
+        Reads the instruction at the given address, returning its dispatch
+        table entry followed by its operand (0, a byte or a word depending on
+        the instruction size).
+        :param pc: address of the opcode
+        :return: tuple
+        """
+        entry = self.dispatch[self.memory.read(pc)]
+        size = entry[2]
+        if size == 2:
+            operand = self.memory.read((pc + 1) & 0xFFFF)
+        elif size == 3:
+            operand = self.memory.read16((pc + 1) & 0xFFFF)
+        else:
+            operand = 0
+        return entry + (operand, )
+
+    def set_mapper(self, mapper: 'BaseMapper') -> None:
+        """
+        Enables the decode cache for the cartridge PRG ROM, following the
+        mapper bank switches.
+        :param mapper: the cartridge mapper
+        """
+        self.mapper = mapper
+        self.decoded_banks = {}
+        mapper.add_bank_listener(self.on_bank_switch)
+        self.on_bank_switch()
+
+    def enable_block_compiler(self) -> None:
+        """
+        Enables the block translation mode: hot PRG ROM code is turned into
+        Python functions, while the interpreter is kept for everything else.
+        Requires a mapper to be set first.
+        """
+        from .block_compiler import BlockCompiler
+
+        self.block_compiler = BlockCompiler(self)
+        self.block_compiler.set_mapper(self.mapper)
+
+    def on_bank_switch(self) -> None:
+        """
+        Points the $8000-$BFFF and $C000-$FFFF decode windows to the cache of
+        the PRG banks currently mapped there. Each bank keeps its own cache,
+        so switching back to a bank doesn't need to decode it again.
+        """
+        windows = []
+        for offset in self.mapper.prg_bank_offsets():
+            entries = self.decoded_banks.get(offset)
+            if entries is None:
+                entries = self.decoded_banks[offset] = [None] * 0x4000
+            windows.append(entries)
+        self.decode_windows = windows
+        self.idle_loops = {}
+
+    def flush_decode_cache(self) -> None:
+        """
+        Drops every decoded instruction, needed whenever the dispatch table
+        changes.
+        """
+        self.decoded_banks = {}
+        if self.mapper is not None:
+            self.on_bank_switch()
+
+    """
+    IDLE LOOP DETECTION
+    Games often spin on a few instructions polling $2002 or a RAM flag set by
+    the NMI handler. Those loops can only end when the PPU changes something,
+    so the CPU can jump straight to that point.
+    """
+    idle_reads = ('LDA', 'LDX', 'LDY', 'BIT', 'CMP', 'CPX', 'CPY', '_AND',
+                  'ORA', 'EOR')
+    idle_max_instructions = 8
+    branches = ('BCC', 'BCS', 'BEQ', 'BMI', 'BNE', 'BPL', 'BVC', 'BVS')
+
+    def enable_idle_detection(self, horizon: Callable[[], Optional[int]]) -> None:
+        """
+        Enables the idle loop detection. Backward branches and jumps are
+        checked for polling loops, which are fast-forwarded as a whole.
+        :param horizon: returns how many CPU cycles are left until the PPU
+        can change anything a polling loop may be reading (or None if unknown)
+        """
+        self.idle_horizon = horizon
+        self.idle_cycles_skipped = 0
+        for opcode, entry in enumerate(self.dispatch):
+            name = str(self.instruction_names[opcode])
+            if name in self.branches or opcode == 0x4C:  # JMP absolute
+                self.dispatch[opcode] = entry[:1] + (self.idle_jump(entry[1]), ) + entry[2:]
+        self.flush_decode_cache()
+
+    def idle_jump(self, handler: Callable[[StepInfo], None]) -> Callable[[StepInfo], None]:
+        """
+        Wraps a branch or jump handler so jumping backwards checks for idle
+        loops.
+        """
+        @wraps(handler)
+        def jump(info: StepInfo) -> None:
+            handler(info)
+            if self.pc < info.pc:
+                self.check_idle_loop((info.pc - InstructionMode.sizes[info.mode]) & 0xFFFF)
+        return jump
+
+    def check_idle_loop(self, jump_pc: int) -> None:
+        """
+        Called after jumping backwards from jump_pc. Once a polling loop goes
+        through two iterations with the same registers, nothing but the PPU
+        (or the NMI handler) can make it end, so whole iterations are skipped
+        until the next PPU event.
+        :param jump_pc: address of the branch or jump
+        """
+        key = (self.pc, jump_pc)
+        idle = self.idle_loops.get(key)
+        if idle is None:
+            idle = self.idle_loops[key] = self.analyze_idle_loop(self.pc, jump_pc)
+        if not idle:
+            self.idle_state = None
+            return
+
+        state = (jump_pc, self.a, self.x, self.y, self.sp, self.flags())
+        previous = self.idle_state
+        self.idle_state = (state, self.cycles)
+        if previous is None or previous[0] != state:
+            return
+
+        loop_cycles = self.cycles - previous[1]
+        if not 0 < loop_cycles <= idle:
+            # The loop was left and entered again since the last time
+            return
+        horizon = self.idle_horizon()
+        if not horizon:
+            return
+        # Leave at least one real iteration to see the event happen
+        skipped = ((horizon - 1) // loop_cycles) * loop_cycles
+        if skipped > 0:
+            self.cycles += skipped
+            self.idle_cycles_skipped += skipped
+            self.idle_state = (state, self.cycles)
+            # The rest of the system needs to catch up with the skipped cycles
+            self.sync_requested = True
+
+    def analyze_idle_loop(self, start: int, end: int) -> int:
+        """
+        Checks whether the code between start and the jump at end only reads
+        RAM or the PPU status register, without any other side effects.
+        :param start: the target of the backward jump
+        :param end: address of the jump
+        :return: the longest an iteration can take in cycles, or 0 if it's
+        not an idle loop
+        """
+        pc = start
+        count = 0
+        cycles = 4 + int(self.instruction_cycles[self.memory.read(end)])
+        while pc < end:
+            opcode = self.memory.read(pc)
+            name = str(self.instruction_names[opcode])
+            mode = int(self.instruction_modes[opcode])
+            if name not in self.idle_reads or count == self.idle_max_instructions:
+                return 0
+            if mode in (InstructionMode.MODE_ZERO_PAGE, InstructionMode.MODE_ABSOLUTE):
+                address = self.decode(pc)[-1]
+                ram = address < 0x2000
+                ppu_status = 0x2000 <= address < 0x4000 and address & 7 == 2
+                if not (ram or ppu_status):
+                    return 0
+            elif mode != InstructionMode.MODE_IMMEDIATE:
+                return 0
+            cycles += int(self.instruction_cycles[opcode])
+            pc += InstructionMode.sizes[mode]
+            count += 1
+        return cycles if pc == end else 0
+
+    """
+    ADDRESSING MODE RESOLVERS
+    Each one receives the address of the current opcode and its operand, and 
+    returns the effective address for its handler and whether a page was 
+    crossed.
+    """
+    def resolve_absolute(self, pc: int, operand: int) -> Tuple[int, bool]:
+        return operand, False
+
+    def resolve_absolute_x(self, pc: int, operand: int) -> Tuple[int, bool]:
+        address = (operand + self.x) & 0xFFFF
+        return address, self.pages_differ(operand, address)
+
+    def resolve_absolute_y(self, pc: int, operand: int) -> Tuple[int, bool]:
+        address = (operand + self.y) & 0xFFFF
+        return address, self.pages_differ(operand, address)
+
+    def resolve_immediate(self, pc: int, operand: int) -> Tuple[int, bool]:
+        return pc + 1, False
+
+    def resolve_implied(self, pc: int, operand: int) -> Tuple[int, bool]:
+        # Also used for the accumulator mode
+        return 0, False
+
+    def resolve_indexed_indirect(self, pc: int, operand: int) -> Tuple[int, bool]:
+        return self.memory.read16bug((operand + self.x) & 0xFF), False
+
+    def resolve_indirect(self, pc: int, operand: int) -> Tuple[int, bool]:
+        return self.memory.read16bug(operand), False
+
+    def resolve_indirect_indexed(self, pc: int, operand: int) -> Tuple[int, bool]:
+        base = self.memory.read16bug(operand)
+        address = (base + self.y) & 0xFFFF
+        return address, self.pages_differ(base, address)
+
+    def resolve_relative(self, pc: int, operand: int) -> Tuple[int, bool]:
+        if operand < 0x80:
+            return (pc + 2 + operand) & 0xFFFF, False
+        return (pc + 2 + operand - 0x100) & 0xFFFF, False
+
+    def resolve_zero_page(self, pc: int, operand: int) -> Tuple[int, bool]:
+        return operand, False
+
+    def resolve_zero_page_x(self, pc: int, operand: int) -> Tuple[int, bool]:
+        return (operand + self.x) & 0xFF, False
+
+    def resolve_zero_page_y(self, pc: int, operand: int) -> Tuple[int, bool]:
+        return (operand + self.y) & 0xFF, False
+
+    def set_n(self, value: int) -> None:
         """
         Sets the negative flag if the argument is negative (high bit is set)
         [in 8-bit signed integers, any value > 128 is treated as negative]
         :param value: an 8-bit value
         """
-        self.n = np.uint8(1 if value & 0x80 != 0 else 0)
+        self.n = (value >> 7) & 1
 
-    def set_z(self, value: np.uint8) -> None:
+    def set_z(self, value: int) -> None:
         """
         Sets the zero flag if the provided value is zero.
         :param value: byte
         """
-        self.z = np.uint8(1 if value == 0 else 0)
+        self.z = 1 if value == 0 else 0
 
-    def set_zn(self, value: np.uint8) -> None:
+    def set_zn(self, value: int) -> None:
         """
         Check the value and set the negative or zero flags if needed.
         :param value: byte
         """
-        self.set_z(value)
-        self.set_n(value)
+        self.z = 1 if value == 0 else 0
+        self.n = (value >> 7) & 1
 
     def set_pc(self, info: StepInfo) -> None:
         """
@@ -303,26 +649,25 @@ class CPU(object):
         self.pc = info.address
         self.add_branch_cycles(info)
 
-    def stack_push(self, value: np.uint8) -> None:
-        self.sp -= 1
-        self.memory.write(np.uint16(0x100 | np.uint16(self.sp)), value)
+    def stack_push(self, value: int) -> None:
+        self.memory.write(0x100 | self.sp, value)
+        self.sp = (self.sp - 1) & 0xFF
 
-    def stack_pull(self) -> np.uint8:
-        self.sp += 1
-        val = self.memory.read(0x100 + self.sp)
-        return val
+    def stack_pull(self) -> int:
+        self.sp = (self.sp + 1) & 0xFF
+        return self.memory.read(0x100 | self.sp)
 
-    def stack_push16(self, value: np.uint16) -> None:
+    def stack_push16(self, value: int) -> None:
         """
         Pushes two bytes into the stack.
         :param value: 16-bit integer
         """
-        hi = value >> 8  # takes the upper byte
+        hi = (value >> 8) & 0xFF  # takes the upper byte
         lo = value & 0xFF  # lower byte
         self.stack_push(hi)
         self.stack_push(lo)
 
-    def stack_pull16(self) -> np.uint16:
+    def stack_pull16(self) -> int:
         """
         Pulls two bytes from the stack.
         """
@@ -330,20 +675,20 @@ class CPU(object):
         hi = self.stack_pull()
         return hi << 8 | lo
 
-    def flags(self) -> np.uint8:
-        flags = np.uint8(0)
-        flags = flags | self.c << 0
-        flags = flags | self.z << 1
-        flags = flags | self.i << 2
-        flags = flags | self.d << 3
-        flags = flags | self.b << 4
-        flags = flags | self.u << 5
-        flags = flags | self.v << 6
-        flags = flags | self.n << 7
-        return flags
-
-    def set_flags(self, flags: np.uint8) -> None:
-        self.c = (flags >> 0) & 1
+    def flags(self) -> int:
+        """
+        Packs all flags into the P register.
+        :return: byte
+        """
+        return (self.c | self.z << 1 | self.i << 2 | self.d << 3 |
+                self.b << 4 | self.u << 5 | self.v << 6 | self.n << 7)
+
+    def set_flags(self, flags: int) -> None:
+        """
+        Unpacks the P register into the individual flags.
+        :param flags: byte
+        """
+        self.c = flags & 1
         self.z = (flags >> 1) & 1
         self.i = (flags >> 2) & 1
         self.d = (flags >> 3) & 1
@@ -353,7 +698,7 @@ class CPU(object):
         self.n = (flags >> 7) & 1
 
     @staticmethod
-    def pages_differ(a, b) -> bool:
+    def pages_differ(a: int, b: int) -> bool:
         """
         Returns true if the two addresses reference different pages.
         :param a: memory address 
@@ -372,24 +717,24 @@ class CPU(object):
         if self.pages_differ(info.pc, info.address):
             self.cycles += 1
 
-    def compare(self, a: np.uint8, b: np.uint8) -> None:
+    def compare(self, a: int, b: int) -> None:
         """
         Compares two bytes, setting the carry flag if a is bigger or equal to b
         and setting the Z and N flags according to their difference.
         :param a: byte
         :param b: byte
         """
-        self.set_zn(a - b)
-        self.c = np.uint8(1 if a >= b else 0)
+        self.set_zn((a - b) & 0xFF)
+        self.c = 1 if a >= b else 0
 
     def nmi(self) -> None:
         """
         Non maskable interrupt
         """
-        self.stack_push(self.pc)
+        self.stack_push16(self.pc)
         self.php(None)
-        self.pc = self.memory.read16(np.uint16(0xFFFA))
-        self.i = np.uint8(1)
+        self.pc = self.memory.read16(0xFFFA)
+        self.i = 1
         # The NES has an interrupt latency of 7 cycles, which means it takes 7
         # CPU cycles to begin executing the interrupt handler
         self.cycles += 7
@@ -398,40 +743,39 @@ class CPU(object):
         """
         IRQ interrupt
         """
-        self.stack_push(self.pc)
+        self.stack_push16(self.pc)
         self.php(None)
-        self.pc = self.memory.read16(np.uint16(0xFFFE))
-        self.i = np.uint8(1)
+        self.pc = self.memory.read16(0xFFFE)
+        self.i = 1
         self.cycles += 7
 
     def adc(self, info: StepInfo) -> None:
         """
         ADC - Add with Carry
-        :param info: 
-        :return: 
+        :param info: a StepInfo object
         """
-        a: np.uint8 = self.a  # accumulator
-        b: np.uint8 = self.memory.read(info.address)  # memory address input
-        c: np.uint8 = self.c  # carry flag
+        a = self.a  # accumulator
+        b = self.memory.read(info.address)  # memory address input
+        result = a + b + self.c
 
-        self.a = a + b + c
+        self.a = result & 0xFF
         self.set_zn(self.a)
 
         # Step 1: check for carry
-        self.c = np.uint8(1 if int(a) + int(b) + int(c) > 0xFF else 0)
+        self.c = 1 if result > 0xFF else 0
 
         # Step 2: check for overflow
         if (a ^ b) & 0x80 == 0 and (a ^ self.a) & 0x80 != 0:
-            self.v = np.uint8(1)
+            self.v = 1
         else:
-            self.v = np.uint8(0)
+            self.v = 0
 
     def _and(self, info: StepInfo) -> None:
         """
         Makes a logical AND between an address and the accumulator
         :param info: a StepInfo object
         """
-        self.a = self.a & self.memory.read(info.address)
+        self.a &= self.memory.read(info.address)
         self.set_zn(self.a)
 
     def asl(self, info: StepInfo) -> None:
@@ -440,13 +784,13 @@ class CPU(object):
         :param info: a StepInfo object
         """
         if info.mode == InstructionMode.MODE_ACCUMULATOR:
-            self.c = (self.a << 7) & 1
-            self.a = self.a << 1
+            self.c = (self.a >> 7) & 1
+            self.a = (self.a << 1) & 0xFF
             self.set_zn(self.a)
         else:
-            value: np.uint8 = self.memory.read(info.address)
-            self.c = (value << 7) & 1
-            value = value << 1
+            value = self.memory.read(info.address)
+            self.c = (value >> 7) & 1
+            value = (value << 1) & 0xFF
             self.memory.write(info.address, value)
             self.set_zn(value)
 
@@ -519,13 +863,12 @@ class CPU(object):
     def brk(self, info: StepInfo) -> None:
         """
         BRK (BReaK): Force interrupt
-        :param info: 
-        :return: 
+        :param info: a StepInfo object
         """
         self.stack_push16(self.pc)
         self.php(info)
         self.sei(info)
-        self.pc = self.memory.read16(np.uint16(0xFFFE))
+        self.pc = self.memory.read16(0xFFFE)
 
     def bvc(self, info: StepInfo) -> None:
         """
@@ -550,52 +893,49 @@ class CPU(object):
         CLC (CLear the Carry flag).
         :param info: a StepInfo object.
         """
-        self.c = np.uint8(0)
+        self.c = 0
 
     def cld(self, info: StepInfo) -> None:
         """
         CLD (CLear the Decimal mode).
         :param info: a StepInfo object.
         """
-        self.d = np.uint8(0)
+        self.d = 0
 
     def cli(self, info: StepInfo) -> None:
         """
         CLD (CLear the Interrupt disable).
         :param info: a StepInfo object.
         """
-        self.i = np.uint8(0)
+        self.i = 0
 
     def clv(self, info: StepInfo) -> None:
         """
         CLV (CLear the oVerflow flag).
         :param info: a StepInfo object.
         """
-        self.v = np.uint8(0)
+        self.v = 0
 
     def cmp(self, info: StepInfo) -> None:
         """
         CMP (CoMPare): Compares the accumulator with a given address.
         :param info: a StepInfo object.
         """
-        value: np.uint8 = self.memory.read(info.address)
-        self.compare(self.a, value)
+        self.compare(self.a, self.memory.read(info.address))
 
     def cpx(self, info: StepInfo) -> None:
         """
         CPX (ComPare with X): Compares the X register with a given address.
         :param info: a StepInfo object.
         """
-        value: np.uint8 = self.memory.read(info.address)
-        self.compare(self.x, value)
+        self.compare(self.x, self.memory.read(info.address))
 
     def cpy(self, info: StepInfo) -> None:
         """
         CPY (ComPare with Y): Compares the Y register with a given address.
         :param info: a StepInfo object.
         """
-        value: np.uint8 = self.memory.read(info.address)
-        self.compare(self.y, value)
+        self.compare(self.y, self.memory.read(info.address))
 
     def dec(self, info: StepInfo) -> None:
         """
@@ -603,7 +943,7 @@ class CPU(object):
         memory address.
         :param info: a StepInfo object.
         """
-        value: np.uint8 = self.memory.read(info.address) - 1
+        value = (self.memory.read(info.address) - 1) & 0xFF
         self.memory.write(info.address, value)
         self.set_zn(value)
 
@@ -612,7 +952,7 @@ class CPU(object):
         DEX (DEcrement X): Subtracts one -1- from the contents of X register.
         :param info: a StepInfo object.
         """
-        self.x -= 1
+        self.x = (self.x - 1) & 0xFF
         self.set_zn(self.x)
 
     def dey(self, info: StepInfo) -> None:
@@ -620,7 +960,7 @@ class CPU(object):
         DEY (DEcrement Y): Subtracts one -1- from the contents of Y register.
         :param info: a StepInfo object.
         """
-        self.y -= 1
+        self.y = (self.y - 1) & 0xFF
         self.set_zn(self.y)
 
     def eor(self, info: StepInfo) -> None:
@@ -629,7 +969,7 @@ class CPU(object):
         accumulator.
         :param info: a StepInfo object.
         """
-        self.a = self.a ^ self.memory.read(info.address)
+        self.a ^= self.memory.read(info.address)
         self.set_zn(self.a)
 
     def inc(self, info: StepInfo) -> None:
@@ -638,7 +978,7 @@ class CPU(object):
         memory address.
         :param info: a StepInfo object.
         """
-        value: np.uint8 = self.memory.read(info.address) + 1
+        value = (self.memory.read(info.address) + 1) & 0xFF
         self.memory.write(info.address, value)
         self.set_zn(value)
 
@@ -647,7 +987,7 @@ class CPU(object):
         INX (INcrement X): Adds one -1- to the contents of X register.
         :param info: a StepInfo object.
         """
-        self.x += 1
+        self.x = (self.x + 1) & 0xFF
         self.set_zn(self.x)
 
     def iny(self, info: StepInfo) -> None:
@@ -655,7 +995,7 @@ class CPU(object):
         INY (INcrement Y): Adds one -1- to the contents of Y register.
         :param info: a StepInfo object.
         """
-        self.y += 1
+        self.y = (self.y + 1) & 0xFF
         self.set_zn(self.y)
 
     def jmp(self, info: StepInfo) -> None:
@@ -672,7 +1012,7 @@ class CPU(object):
         address.
         :param info: a StepInfo object.
         """
-        self.stack_push16(self.pc - 1)
+        self.stack_push16((self.pc - 1) & 0xFFFF)
         self.pc = info.address
 
     def lda(self, info: StepInfo) -> None:
@@ -709,7 +1049,7 @@ class CPU(object):
         """
         if info.mode == InstructionMode.MODE_ACCUMULATOR:
             self.c = self.a & 1
-            self.a = self.a >> 1
+            self.a >>= 1
             self.set_zn(self.a)
         else:
             value = self.memory.read(info.address)
@@ -730,7 +1070,7 @@ class CPU(object):
         ORA (logical inclusive OR on Accumulator)
         :param info: a StepInfo object 
         """
-        self.a = self.a | self.memory.read(info.address)
+        self.a |= self.memory.read(info.address)
         self.set_zn(self.a)
 
     def pha(self, info: StepInfo) -> None:
@@ -768,15 +1108,15 @@ class CPU(object):
         shifted into bit 0 and the original bit 7 is shifted into the Carry.
         :param info: a StepInfo object 
         """
-        c: np.uint8 = self.c
+        c = self.c
         if info.mode == InstructionMode.MODE_ACCUMULATOR:
             self.c = (self.a >> 7) & 1
-            self.a = (self.a << 1) & c
+            self.a = ((self.a << 1) | c) & 0xFF
             self.set_zn(self.a)
         else:
-            value: np.uint8 = self.memory.read(info.address)
+            value = self.memory.read(info.address)
             self.c = (value >> 7) & 1
-            value = (value << 1) & c
+            value = ((value << 1) | c) & 0xFF
             self.memory.write(info.address, value)
             self.set_zn(value)
 
@@ -786,13 +1126,13 @@ class CPU(object):
         shifted into bit 7 and the original bit 0 is shifted into the Carry.
         :param info: a StepInfo object 
         """
-        c: np.uint8 = self.c
+        c = self.c
         if info.mode == InstructionMode.MODE_ACCUMULATOR:
             self.c = self.a & 1
             self.a = (self.a >> 1) | (c << 7)
             self.set_zn(self.a)
         else:
-            value: np.uint8 = self.memory.read(info.address)
+            value = self.memory.read(info.address)
             self.c = value & 1
             value = (value >> 1) | (c << 7)
             self.memory.write(info.address, value)
@@ -813,41 +1153,41 @@ class CPU(object):
         (low byte first) and transfers program control to that address + 1.
         :param info: a StepInfo object 
         """
-        self.pc = self.stack_pull16() + 1
+        self.pc = (self.stack_pull16() + 1) & 0xFFFF
 
     def sbc(self, info: StepInfo) -> None:
         """
         SBC (SuBstract with Carry)
         :param info: a StepInfo object 
         """
-        a: np.uint8 = self.a
-        b: np.uint8 = self.memory.read(info.address)
-        c: np.uint8 = self.c
-        self.a = a - b - (1 - c)
+        a = self.a
+        b = self.memory.read(info.address)
+        result = a - b - (1 - self.c)
+        self.a = result & 0xFF
         self.set_zn(self.a)
-        self.c = np.uint8(1 if int(a) - int(b) - int(1 - c) >= 0 else 0)
-        self.v = np.uint8(1 if (a ^ b) & 0x80 != 0 and (a ^ self.a) & 0x80 != 0 else 0)
+        self.c = 1 if result >= 0 else 0
+        self.v = 1 if (a ^ b) & 0x80 != 0 and (a ^ self.a) & 0x80 != 0 else 0
 
     def sec(self, info: StepInfo) -> None:
         """
         SEC (SEt Carry flag)
         :param info: a StepInfo object 
         """
-        self.c = np.uint8(1)
+        self.c = 1
 
     def sed(self, info: StepInfo) -> None:
         """
         SED (SEt Decimal flag)
         :param info: a StepInfo object 
         """
-        self.d = np.uint8(1)
+        self.d = 1
 
     def sei(self, info: StepInfo) -> None:
         """
         SEI (SEt Interrupt disable)
         :param info: a StepInfo object 
         """
-        self.i = np.uint8(1)
+        self.i = 1
 
     def sta(self, info: StepInfo) -> None:
         """
@@ -925,3 +1265,171 @@ class CPU(object):
         """
         self.a = self.y
         self.set_zn(self.a)
+
+    """
+    ILLEGAL OPCODES
+    Undocumented instructions, most of them are combinations of two official
+    operations sharing the same addressing mode.
+    """
+    def ahx(self, info: StepInfo) -> None:
+        """
+        AHX (also SHA): Stores A AND X AND (high byte of the address + 1).
+        :param info: a StepInfo object
+        """
+        high = ((info.address >> 8) + 1) & 0xFF
+        self.memory.write(info.address, self.a & self.x & high)
+
+    def alr(self, info: StepInfo) -> None:
+        """
+        ALR (also ASR): AND with an immediate value, then LSR the accumulator.
+        :param info: a StepInfo object
+        """
+        self._and(info)
+        self.lsr(StepInfo(info.address, info.pc, InstructionMode.MODE_ACCUMULATOR))
+
+    def anc(self, info: StepInfo) -> None:
+        """
+        ANC: AND with an immediate value, copying the negative flag into the
+        carry flag.
+        :param info: a StepInfo object
+        """
+        self._and(info)
+        self.c = self.n
+
+    def arr(self, info: StepInfo) -> None:
+        """
+        ARR: AND with an immediate value, then ROR the accumulator. C is taken
+        from bit 6 of the result and V from bit 6 XOR bit 5.
+        :param info: a StepInfo object
+        """
+        self._and(info)
+        self.ror(StepInfo(info.address, info.pc, InstructionMode.MODE_ACCUMULATOR))
+        self.c = (self.a >> 6) & 1
+        self.v = ((self.a >> 6) ^ (self.a >> 5)) & 1
+
+    def axs(self, info: StepInfo) -> None:
+        """
+        AXS (also SBX): Stores (A AND X) minus an immediate value in X,
+        without borrow.
+        :param info: a StepInfo object
+        """
+        value = self.a & self.x
+        operand = self.memory.read(info.address)
+        self.x = (value - operand) & 0xFF
+        self.c = 1 if value >= operand else 0
+        self.set_zn(self.x)
+
+    def dcp(self, info: StepInfo) -> None:
+        """
+        DCP: DEC a memory address, then CMP it with the accumulator.
+        :param info: a StepInfo object
+        """
+        self.dec(info)
+        self.cmp(info)
+
+    def isc(self, info: StepInfo) -> None:
+        """
+        ISC (also ISB): INC a memory address, then SBC it from the accumulator.
+        :param info: a StepInfo object
+        """
+        self.inc(info)
+        self.sbc(info)
+
+    def kil(self, info: StepInfo) -> None:
+        """
+        KIL (also JAM): Halts the CPU. The program counter is kept on the
+        opcode, so it keeps being executed until the next reset.
+        :param info: a StepInfo object
+        """
+        self.pc = (info.pc - 1) & 0xFFFF
+
+    def las(self, info: StepInfo) -> None:
+        """
+        LAS: Stores a memory address AND the stack pointer in A, X and SP.
+        :param info: a StepInfo object
+        """
+        value = self.memory.read(info.address) & self.sp
+        self.a = self.x = self.sp = value
+        self.set_zn(value)
+
+    def lax(self, info: StepInfo) -> None:
+        """
+        LAX: LDA a memory address, then TAX.
+        :param info: a StepInfo object
+        """
+        self.lda(info)
+        self.tax(info)
+
+    def rla(self, info: StepInfo) -> None:
+        """
+        RLA: ROL a memory address, then AND it with the accumulator.
+        :param info: a StepInfo object
+        """
+        self.rol(info)
+        self._and(info)
+
+    def rra(self, info: StepInfo) -> None:
+        """
+        RRA: ROR a memory address, then ADC it to the accumulator.
+        :param info: a StepInfo object
+        """
+        self.ror(info)
+        self.adc(info)
+
+    def sax(self, info: StepInfo) -> None:
+        """
+        SAX: Stores A AND X in a memory address.
+        :param info: a StepInfo object
+        """
+        self.memory.write(info.address, self.a & self.x)
+
+    def shx(self, info: StepInfo) -> None:
+        """
+        SHX: Stores X AND (high byte of the address + 1).
+        :param info: a StepInfo object
+        """
+        high = ((info.address >> 8) + 1) & 0xFF
+        self.memory.write(info.address, self.x & high)
+
+    def shy(self, info: StepInfo) -> None:
+        """
+        SHY: Stores Y AND (high byte of the address + 1).
+        :param info: a StepInfo object
+        """
+        high = ((info.address >> 8) + 1) & 0xFF
+        self.memory.write(info.address, self.y & high)
+
+    def slo(self, info: StepInfo) -> None:
+        """
+        SLO: ASL a memory address, then ORA it with the accumulator.
+        :param info: a StepInfo object
+        """
+        self.asl(info)
+        self.ora(info)
+
+    def sre(self, info: StepInfo) -> None:
+        """
+        SRE: LSR a memory address, then EOR it with the accumulator.
+        :param info: a StepInfo object
+        """
+        self.lsr(info)
+        self.eor(info)
+
+    def tas(self, info: StepInfo) -> None:
+        """
+        TAS (also SHS): Stores A AND X in the stack pointer, then stores
+        SP AND (high byte of the address + 1) in memory.
+        :param info: a StepInfo object
+        """
+        self.sp = self.a & self.x
+        high = ((info.address >> 8) + 1) & 0xFF
+        self.memory.write(info.address, self.sp & high)
+
+    def xaa(self, info: StepInfo) -> None:
+        """
+        XAA (also ANE): Unstable on real hardware, emulated as TXA followed by
+        an AND with an immediate value.
+        :param info: a StepInfo object
+        """
+        self.txa(info)
+        self._and(info)
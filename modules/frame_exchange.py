@@ -0,0 +1,69 @@
+from collections import deque
+import numpy as np
+from typing import Optional, Tuple
+
+
+class FrameExchange(object):
+    """
+    Triple buffer handing frames from the emulation thread to the UI thread
+    without locks.
+
+    Each side owns one buffer (the producer writes into its back buffer, the
+    consumer reads its front one) and the third sits in a shared slot, as
+    an (index, fresh) pair. Both sides trade their buffer for the one in
+    the slot by appending theirs and popping the oldest entry, which are
+    atomic operations on a deque: whatever the interleaving, every buffer
+    ends up owned by exactly one side, so the consumer never sees a frame
+    being written and neither side ever waits for the other. When the
+    other side swaps in between, a side can pop its own entry back; it
+    just swaps again, or the newest frame would be lost. Entries are told
+    apart by their freshness too, as the same buffer can come back around
+    as a different entry while a side waits between its two operations.
+    """
+
+    def __init__(self, shape: Tuple[int, ...], dtype=np.uint8) -> None:
+        """
+        :param shape: shape of the frames exchanged
+        :param dtype: type of their elements
+        """
+        self.buffers = [np.zeros(shape, dtype=dtype) for _ in range(3)]
+        self.back = 0  # owned by the producer
+        self.front = 1  # owned by the consumer
+        self.slot = deque([(2, False)])
+
+        self.published = 0
+        self.dropped = 0  # published, but replaced before being taken
+        self.duplicated = 0  # takes without a new frame
+
+    def publish(self, frame: np.ndarray) -> None:
+        """
+        Copies a frame into the back buffer and makes it the newest one.
+        Called from the producer thread only.
+        :param frame: array of the exchange's shape
+        """
+        np.copyto(self.buffers[self.back], frame)
+        own = entry = (self.back, True)
+        while entry == own:
+            self.slot.append(own)
+            entry = self.slot.popleft()
+        self.back, fresh = entry
+        if fresh:
+            # The previous frame, never taken
+            self.dropped += 1
+        self.published += 1
+
+    def take(self) -> Optional[np.ndarray]:
+        """
+        Gets the newest frame, if there's one that hasn't been taken yet.
+        Called from the consumer thread only.
+        :return: the frame, valid until the next call, or None
+        """
+        own = entry = (self.front, False)
+        while entry == own:
+            self.slot.append(own)
+            entry = self.slot.popleft()
+        self.front, fresh = entry
+        if not fresh:
+            self.duplicated += 1
+            return None
+        return self.buffers[self.front]
@@ -0,0 +1,136 @@
+import os
+import struct
+import zlib
+import numpy as np
+from typing import List, Optional
+
+from .framebuffer import FrameBuffer
+
+
+class FrameSink(object):
+    """
+    Receives every completed frame, converted to the sink's format. Sinks
+    are registered with ppu.add_frame_listener(sink.on_frame); the frames
+    they get are views only valid during the call, so anything kept has to
+    be copied.
+    """
+
+    fmt = FrameBuffer.FORMAT_RGB24
+
+    def __init__(self, fmt: Optional[str] = None) -> None:
+        """
+        :param fmt: one of the FrameBuffer.FORMAT_* values
+        """
+        if fmt is not None:
+            self.fmt = fmt
+
+    def on_frame(self, frame_buffer: FrameBuffer) -> None:
+        self.write(frame_buffer.frame(self.fmt), frame_buffer.frames)
+
+    def write(self, frame: np.ndarray, number: int) -> None:
+        """
+        :param frame: the frame, shaped as returned by FrameBuffer.frame
+        :param number: frames completed so far, this one included
+        """
+        raise NotImplementedError
+
+    def close(self) -> None:
+        pass
+
+
+class NullSink(FrameSink):
+    """
+    Drops every frame, without even converting it.
+    """
+
+    def on_frame(self, frame_buffer: FrameBuffer) -> None:
+        pass
+
+    def write(self, frame: np.ndarray, number: int) -> None:
+        pass
+
+
+class RingSink(FrameSink):
+    """
+    Keeps the last frames in memory, in a preallocated ring.
+    """
+
+    def __init__(self, size: int, fmt: Optional[str] = None) -> None:
+        super().__init__(fmt)
+        self.size = size
+        self.ring = None  # type: Optional[np.ndarray]
+        self.numbers = [0] * size  # type: List[int]
+        self.count = 0  # frames written so far
+
+    def write(self, frame: np.ndarray, number: int) -> None:
+        if self.ring is None:
+            self.ring = np.zeros((self.size, ) + frame.shape, dtype=frame.dtype)
+        slot = self.count % self.size
+        self.ring[slot] = frame
+        self.numbers[slot] = number
+        self.count += 1
+
+    def frames(self) -> List[np.ndarray]:
+        """
+        :return: the frames kept, oldest first, as views into the ring
+        """
+        kept = min(self.count, self.size)
+        return [self.ring[(self.count - kept + i) % self.size] for i in range(kept)]
+
+
+class RawFileSink(FrameSink):
+    """
+    Appends the bytes of every frame to a file.
+    """
+
+    def __init__(self, path: str, fmt: Optional[str] = None) -> None:
+        super().__init__(fmt)
+        self.file = open(path, 'wb')
+
+    def write(self, frame: np.ndarray, number: int) -> None:
+        self.file.write(np.ascontiguousarray(frame).data)
+
+    def close(self) -> None:
+        self.file.close()
+
+
+class PNGSink(FrameSink):
+    """
+    Saves one every N frames as a PNG file.
+    """
+
+    def __init__(self, directory: str, every: int = 1) -> None:
+        super().__init__(FrameBuffer.FORMAT_RGB24)
+        self.directory = directory
+        self.every = every
+        os.makedirs(directory, exist_ok=True)
+
+    def on_frame(self, frame_buffer: FrameBuffer) -> None:
+        # Skip the conversion of the frames that won't be saved
+        if frame_buffer.frames % self.every == 0:
+            super().on_frame(frame_buffer)
+
+    def write(self, frame: np.ndarray, number: int) -> None:
+        write_png(os.path.join(self.directory, f'frame{number:06d}.png'), frame)
+
+
+def write_png(path: str, frame: np.ndarray) -> None:
+    """
+    Writes an RGB24 frame as a PNG file.
+    :param frame: array of uint8 shaped (height, width, 3)
+    """
+    height, width = frame.shape[:2]
+    # Every row starts with its filter type (0, none)
+    rows = np.zeros((height, width * 3 + 1), dtype=np.uint8)
+    rows[:, 1:] = frame.reshape(height, width * 3)
+
+    def chunk(kind: bytes, data: bytes) -> bytes:
+        return (struct.pack('>I', len(data)) + kind + data +
+                struct.pack('>I', zlib.crc32(kind + data) & 0xFFFFFFFF))
+
+    header = struct.pack('>IIBBBBB', width, height, 8, 2, 0, 0, 0)
+    with open(path, 'wb') as png:
+        png.write(b'\x89PNG\r\n\x1a\n')
+        png.write(chunk(b'IHDR', header))
+        png.write(chunk(b'IDAT', zlib.compress(rows.tobytes())))
+        png.write(chunk(b'IEND', b''))
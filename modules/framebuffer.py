@@ -0,0 +1,91 @@
+import numpy as np
+from typing import Sequence, Tuple
+
+from .palette import COLORS, emphasis_table
+
+
+class FrameBuffer(object):
+    """
+    Double-buffered frame of palette indexes (240x256 uint8). The PPU draws
+    into the back plane, which becomes the front one at vertical blank.
+    Each plane comes with the color emphasis of its lines, kept as offsets
+    into the 512 entry color tables (emphasis * 64).
+
+    The front plane is turned into pixels with a single lookup into a color
+    table, written into a preallocated array per format, so the views
+    returned are only valid until the next conversion.
+    """
+
+    WIDTH = 256
+    HEIGHT = 240
+
+    FORMAT_RAW = 'raw'  # palette indexes
+    FORMAT_RGB24 = 'rgb24'
+    FORMAT_RGBA32 = 'rgba32'
+    FORMAT_RGB565 = 'rgb565'
+
+    def __init__(self, palette: Sequence[Tuple[int, int, int]],
+                 overscan: Tuple[int, int, int, int] = (0, 0, 0, 0)) -> None:
+        """
+        :param palette: the 64 RGB colors of the NES palette, or the full
+        512 entry table with emphasis
+        :param overscan: rows/columns cropped from the output, as (top,
+        bottom, left, right)
+        """
+        self.back = np.zeros((self.HEIGHT, self.WIDTH), dtype=np.uint8)
+        self.front = np.zeros((self.HEIGHT, self.WIDTH), dtype=np.uint8)
+        self.back_emphasis = np.zeros(self.HEIGHT, dtype=np.uint16)
+        self.front_emphasis = np.zeros(self.HEIGHT, dtype=np.uint16)
+        self.indexes = np.zeros((self.HEIGHT, self.WIDTH), dtype=np.uint16)
+        self.frames = 0  # frames completed so far
+        self.overscan = overscan
+        self.set_palette(palette)
+
+    def set_palette(self, palette: Sequence[Tuple[int, int, int]]) -> None:
+        """
+        Builds the color tables of every output format.
+        :param palette: the 64 base RGB colors (expanded with the emphasis
+        combinations) or the full 512 entry table
+        """
+        rgb = np.array(palette, dtype=np.uint8).reshape(-1, 3)
+        if len(rgb) == COLORS:
+            rgb = emphasis_table(rgb)
+        rgba = np.full((len(rgb), 4), 0xFF, dtype=np.uint8)
+        rgba[:, :3] = rgb
+        r, g, b = (rgb.astype(np.uint16).T >> np.array([[3], [2], [3]], dtype=np.uint16))
+        self.tables = {
+            self.FORMAT_RGB24: rgb,
+            self.FORMAT_RGBA32: rgba,
+            self.FORMAT_RGB565: (r << 11) | (g << 5) | b,
+        }
+        self.outputs = {
+            name: np.zeros((self.HEIGHT, self.WIDTH) + table.shape[1:], dtype=table.dtype)
+            for name, table in self.tables.items()
+        }
+
+    def swap(self) -> None:
+        """
+        Shows the frame just drawn, the old front plane being reused for the
+        next one.
+        """
+        self.front, self.back = self.back, self.front
+        self.front_emphasis, self.back_emphasis = self.back_emphasis, self.front_emphasis
+        self.frames += 1
+
+    def crop(self, frame: np.ndarray) -> np.ndarray:
+        top, bottom, left, right = self.overscan
+        return frame[top:self.HEIGHT - bottom, left:self.WIDTH - right]
+
+    def frame(self, fmt: str = FORMAT_RGB24) -> np.ndarray:
+        """
+        Returns the last complete frame in the given format.
+        :param fmt: one of the FORMAT_* values
+        :return: view shaped (height, width) for raw and RGB565, or
+        (height, width, channels) for RGB24 and RGBA32
+        """
+        if fmt == self.FORMAT_RAW:
+            return self.crop(self.front)
+        output = self.outputs[fmt]
+        np.add(self.front, self.front_emphasis[:, None], out=self.indexes)
+        np.take(self.tables[fmt], self.indexes, axis=0, out=output)
+        return self.crop(output)
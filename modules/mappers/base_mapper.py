@@ -1,10 +1,18 @@
 import numpy as np
+from typing import Callable, List, Tuple
 
 
 class BaseMapper(object):
 
+    # Whether step() has to be called on every PPU cycle (IRQ counters and
+    # such), see Scheduler.add_component
+    needs_step = True
+
     def __init__(self, cartridge) -> None:
         self._cartridge = cartridge
+        self._bank_listeners = []  # type: List[Callable[[], None]]
+        self._mirror_listeners = []  # type: List[Callable[[], None]]
+        self._chr_listeners = []  # type: List[Callable[[int], None]]
 
     @property
     def prg(self) -> np.ndarray:
@@ -24,7 +32,57 @@ class BaseMapper(object):
 
     @mirror.setter
     def mirror(self, value: np.uint8) -> None:
+        changed = value != self._cartridge.mirror
         self._cartridge.mirror = value
+        if changed:
+            for listener in self._mirror_listeners:
+                listener()
+
+    def add_bank_listener(self, listener: Callable[[], None]) -> None:
+        """
+        Registers a function to be called every time the banks mapped by the
+        cartridge change.
+        :param listener: callable without arguments
+        """
+        self._bank_listeners.append(listener)
+
+    def add_mirror_listener(self, listener: Callable[[], None]) -> None:
+        """
+        Registers a function to be called every time the nametable mirroring
+        changes.
+        :param listener: callable without arguments
+        """
+        self._mirror_listeners.append(listener)
+
+    def add_chr_listener(self, listener: Callable[[int], None]) -> None:
+        """
+        Registers a function to be called with the CHR index of every byte
+        written in CHR RAM.
+        :param listener: callable receiving an int
+        """
+        self._chr_listeners.append(listener)
+
+    def notify_bank_switch(self) -> None:
+        for listener in self._bank_listeners:
+            listener()
+
+    def notify_chr_write(self, index: int) -> None:
+        for listener in self._chr_listeners:
+            listener(index)
+
+    def prg_bank_offsets(self) -> Tuple[int, int]:
+        """
+        Returns the offsets inside the PRG ROM of the 16 KB banks currently
+        mapped at $8000 and $C000.
+        """
+        raise NotImplementedError
+
+    def chr_bank_offsets(self) -> Tuple[int, int]:
+        """
+        Returns the offsets inside CHR of the 4 KB banks currently mapped at
+        $0000 and $1000 (PPU side).
+        """
+        raise NotImplementedError
 
     def read(self, address: np.uint16) -> np.uint8:
         raise NotImplementedError
@@ -1,10 +1,13 @@
 import numpy as np
+from typing import Tuple
 
 from .base_mapper import BaseMapper
 
 
 class Mapper1(BaseMapper):
 
+    needs_step = False
+
     def __init__(self, cartridge) -> None:
         super().__init__(cartridge)
         self.shift_register = np.uint8(0x10)
@@ -14,13 +17,19 @@ class Mapper1(BaseMapper):
         self.prg_bank = np.uint8(0)
         self.chr_bank0 = np.uint8(0)
         self.chr_bank1 = np.uint8(0)
-        self.prg_offsets = np.zeros(shape=(2,), dtype=np.uint8)
-        self.chr_offsets = np.zeros(shape=(2,), dtype=np.uint8)
+        self.prg_offsets = np.zeros(shape=(2,), dtype=np.uint32)
+        self.chr_offsets = np.zeros(shape=(2,), dtype=np.uint32)
         self.prg_offsets[1] = self.prg_bank_offset(-1)
 
     def step(self) -> None:
         pass
 
+    def prg_bank_offsets(self) -> Tuple[int, int]:
+        return int(self.prg_offsets[0]), int(self.prg_offsets[1])
+
+    def chr_bank_offsets(self) -> Tuple[int, int]:
+        return int(self.chr_offsets[0]), int(self.chr_offsets[1])
+
     def read(self, address: np.uint16) -> np.uint8:
         if address < 0x2000:  # CHR read
             bank = address // 0x1000
@@ -40,7 +49,9 @@ class Mapper1(BaseMapper):
         if address < 0x2000:  # CHR write
             bank = address // 0x1000
             offset = address % 0x1000
-            self.chr[self.chr_offsets[bank] + int(offset)] = value
+            index = int(self.chr_offsets[bank]) + int(offset)
+            self.chr[index] = value
+            self.notify_chr_write(index)
         elif address >= 0x8000:
             self.load_register(address, value)
         elif address >= 0x6000:
@@ -120,6 +131,8 @@ class Mapper1(BaseMapper):
             self.chr_offsets[0] = self.chr_bank_offset(int(self.chr_bank0))
             self.chr_offsets[1] = self.chr_bank_offset(int(self.chr_bank1))
 
+        self.notify_bank_switch()
+
     def prg_bank_offset(self, index: int) -> int:
         if index >= 0x80:
             index -= 0x100
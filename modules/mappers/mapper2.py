@@ -1,4 +1,5 @@
 import numpy as np
+from typing import Tuple
 
 from .base_mapper import BaseMapper
 
@@ -7,6 +8,7 @@ class Mapper2(BaseMapper):
     """
     Mapper 0 games seem to be compatible with this one.
     """
+    needs_step = False
     prg_banks: int = 0
     prg_bank_1: int = 0
 
@@ -19,6 +21,12 @@ class Mapper2(BaseMapper):
     def step(self) -> None:
         pass
 
+    def prg_bank_offsets(self) -> Tuple[int, int]:
+        return self.prg_bank_1 * 0x4000, self.prg_bank_2 * 0x4000
+
+    def chr_bank_offsets(self) -> Tuple[int, int]:
+        return 0, 0x1000
+
     def read(self, address: np.uint16) -> np.uint8:
         if address < 0x2000:
             return self.chr[address]
@@ -37,8 +45,12 @@ class Mapper2(BaseMapper):
     def write(self, address: np.uint16, value: np.uint8) -> None:
         if address < 0x2000:
             self.chr[address] = value
+            self.notify_chr_write(int(address))
         elif address >= 0x8000:
-            self.prg_bank_1 = int(value) % self.prg_banks
+            bank = int(value) % self.prg_banks
+            if bank != self.prg_bank_1:
+                self.prg_bank_1 = bank
+                self.notify_bank_switch()
         elif address >= 0x6000:
             index = int(address) - 0x6000
             self.sram[index] = value
@@ -1,86 +1,195 @@
 import numpy as np
+from typing import Callable, Dict, List, Optional
+
+from .tile_cache import TileCache
 
 
 class Memory:
+    """
+    CPU memory bus. The address space is split in 256 pages of 256 bytes:
+    pages backed by a buffer (RAM, PRG ROM, SRAM) are read and written with a
+    single index operation, while the rest go through a handler per page
+    (PPU/APU/IO registers and the mapper).
+    """
+
     def __init__(self):
-        self._memory = np.zeros(0xffff, dtype=np.uint16)   # type: np.ndarray
+        self._memory = np.zeros(0x0800, dtype=np.uint8)   # type: np.ndarray
+        # Direct buffers, None for pages handled by a function
+        self.read_pages = [None] * 0x100  # type: List[Optional[memoryview]]
+        self.write_pages = [None] * 0x100  # type: List[Optional[memoryview]]
+        self.readers = [self.read_unmapped] * 0x100  # type: List[Callable[[int], int]]
+        self.writers = [self.write_unmapped] * 0x100  # type: List[Callable[[int, int], None]]
+        self.console = None
+        self.mapper = None
+        self.prg_pages = {}  # type: Dict[int, List[memoryview]]
 
-    def read(self, address: np.uint16) -> np.uint8:
+        # The lower 2KB are the system main RAM, mirrored up to $1FFF
+        ram = memoryview(self._memory)
+        for page in range(0x20):
+            view = ram[(page & 0x07) << 8:((page & 0x07) + 1) << 8]
+            self.read_pages[page] = self.write_pages[page] = view
+
+    def connect(self, console) -> None:
         """
-        Returns an 8-bit chunk of memory from a given address.
-        :param address: a location between 0x0000 and 0xFFFF
-        :return: byte
+        Maps the registers of the rest of the system and the cartridge.
+        :param console: object holding the cpu, ppu, io and mapper
         """
-        from main import Manager
+        self.console = console
+        for page in range(0x20, 0x40):
+            self.readers[page] = self.read_ppu
+            self.writers[page] = self.write_ppu
+        self.readers[0x40] = self.read_io
+        self.writers[0x40] = self.write_io
+        for page in range(0x41, 0x100):
+            self.readers[page] = self.read_mapper
+            self.writers[page] = self.write_mapper
 
-        manager = Manager()
+        self.mapper = console.mapper
+        self.prg_pages = {}
+        sram = memoryview(self.mapper.sram)
+        for page in range(0x60, 0x80):
+            view = sram[(page - 0x60) << 8:(page - 0x5F) << 8]
+            self.read_pages[page] = self.write_pages[page] = view
+        self.mapper.add_bank_listener(self.on_bank_switch)
+        self.on_bank_switch()
 
-        if address < 0x2000:
-            # The lower 2KB are the system main RAM, so can be assigned directly
-            return self._memory[int(address % 0x0800)]
-        elif address < 0x4000:
-            # PPU registers
-            return manager.ppu.read_register(0x2000 + address % 8)
-        elif address < 0x4014:
-            # APU registers
-            return np.uint8(0)
-        elif address == 0x4014:
-            # PPU register
-            return manager.ppu.read_register(address)
-        elif address == 0x4015:
-            # More APU registers
-            return np.uint8(0)
-        elif address == 0x4016:
-            return manager.io.read_state(0)
-        elif address == 0x4017:
-            return manager.io.read_state(1)
-        else:
-            # Cartridge mapper registers
-            return manager.mapper.read(address)
+    def on_bank_switch(self) -> None:
+        """
+        Points the $8000-$FFFF pages to the PRG banks currently mapped.
+        """
+        prg = None
+        for window, offset in enumerate(self.mapper.prg_bank_offsets()):
+            pages = self.prg_pages.get(offset)
+            if pages is None:
+                if prg is None:
+                    prg = memoryview(np.ascontiguousarray(self.mapper.prg, dtype=np.uint8))
+                pages = self.prg_pages[offset] = [
+                    prg[offset + (page << 8):offset + ((page + 1) << 8)]
+                    for page in range(0x40)]
+            first = 0x80 + window * 0x40
+            self.read_pages[first:first + 0x40] = pages
 
-    def write(self, address: np.uint16, value: np.uint8, length=0x0800) -> None:
+    def read(self, address: int) -> int:
+        """
+        Returns an 8-bit chunk of memory from a given address.
+        :param address: a location between 0x0000 and 0xFFFF
+        :return: byte, as a plain int
+        """
+        page = self.read_pages[address >> 8]
+        if page is not None:
+            return page[address & 0xFF]
+        return self.readers[address >> 8](address)
+
+    def write(self, address: int, value: int, length=0x0800) -> None:
         """
         Writes an 8-bit chunk of memory in a specified address.
         :param address: a location between 0x0000 and 0xFFFF
         :param length: a custom write length (8 or 16 bits)
         :param value: the byte to be written
         """
-        from main import Manager
+        page = self.write_pages[address >> 8]
+        if page is not None:
+            page[address & 0xFF] = value
+        else:
+            self.writers[address >> 8](address, value)
 
-        manager = Manager()
+    def read_block(self, start: int, length: int) -> np.ndarray:
+        """
+        Returns a range of memory. Ranges backed by RAM, SRAM or a single PRG
+        bank are returned as views without copying anything (so they must not
+        be kept around), anything else is read byte by byte.
+        :param start: first address
+        :param length: number of bytes, up to the end of the address space
+        :return: array of uint8
+        """
+        end = start + length
+        if end <= 0x2000 and start >> 11 == (end - 1) >> 11:
+            # Inside a single RAM mirror
+            return self._memory[start & 0x07FF:((end - 1) & 0x07FF) + 1]
+        if start >= 0x8000 and start >> 14 == (end - 1) >> 14:
+            # Inside a single PRG window
+            offset = self.mapper.prg_bank_offsets()[(start >> 14) & 1] + (start & 0x3FFF)
+            return np.asarray(self.mapper.prg[offset:offset + length], dtype=np.uint8)
+        page = self.read_pages[start >> 8]
+        if page is not None and start >> 8 == (end - 1) >> 8:
+            return np.frombuffer(page, dtype=np.uint8)[start & 0xFF:(start & 0xFF) + length]
+        read = self.read
+        return np.fromiter((read(address) for address in range(start, end)),
+                           dtype=np.uint8, count=length)
 
-        if address < 0x2000:
-            # The lower 2KB are the system main RAM, so can be assigned directly
-            self._memory[address % 0x0800] = value
-        elif address < 0x4000:
-            # PPU registers
-            manager.ppu.write_register(0x2000 + address % 8, value)
-        elif address < 0x4014:
-            # APU registers
-            raise NotImplementedError()  # TODO: Implement APU operations
-        elif address == 0x4014:
+    """
+    PAGE HANDLERS
+    Accessing any register makes the CPU stop its batch, so the rest of the
+    system can catch up. The PPU is caught up right away, as it has to be at
+    the right cycle when its registers are accessed.
+    """
+    def read_ppu(self, address: int) -> int:
+        self.console.cpu.sync_requested = True
+        self.console.catch_up()
+        return int(self.console.ppu.read_register(0x2000 + address % 8))
+
+    def write_ppu(self, address: int, value: int) -> None:
+        self.console.cpu.sync_requested = True
+        self.console.catch_up()
+        self.console.ppu.write_register(0x2000 + address % 8, value)
+
+    def read_io(self, address: int) -> int:
+        if address >= 0x4018:
+            # Cartridge expansion area
+            return self.read_mapper(address)
+        self.console.cpu.sync_requested = True
+        if address == 0x4014:
             # PPU register
-            manager.ppu.write_register(address, value)
-        elif address in (0x4015, 0x4017):
-            # More APU registers
-            raise NotImplementedError()  # TODO: Implement APU operations
+            self.console.catch_up()
+            return int(self.console.ppu.read_register(address))
         elif address == 0x4016:
-            manager.io.write_strobe(value)
+            return int(self.console.io.read_state(0))
+        elif address == 0x4017:
+            return int(self.console.io.read_state(1))
+        # APU registers
+        return 0
+
+    def write_io(self, address: int, value: int) -> None:
+        if address >= 0x4018:
+            self.write_mapper(address, value)
+            return
+        self.console.cpu.sync_requested = True
+        if address == 0x4014:
+            # PPU register
+            self.console.catch_up()
+            self.console.ppu.write_register(address, value)
+        elif address == 0x4016:
+            self.console.io.write_strobe(value)
         else:
-            manager.mapper.write(address, value)
+            # APU registers
+            raise NotImplementedError()  # TODO: Implement APU operations
 
-    def read16(self, address: np.uint16) -> np.uint16:
+    def read_mapper(self, address: int) -> int:
+        return int(self.mapper.read(address))
+
+    def write_mapper(self, address: int, value: int) -> None:
+        self.mapper.write(address, value)
+
+    @staticmethod
+    def read_unmapped(address: int) -> int:
+        raise Exception(f'read from unmapped address: {hex(address)}')
+
+    @staticmethod
+    def write_unmapped(address: int, value: int) -> None:
+        raise Exception(f'write to unmapped address: {hex(address)}')
+
+    def read16(self, address: int) -> int:
         """
         Reads a 16-bit chunk of memory in a specified address.
         :param address: uint16
         :return: int
         """
-        low = np.uint16(self.read(address))
-        high = np.uint16(self.read(address + 1))
+        low = self.read(address)
+        high = self.read((address + 1) & 0xFFFF)
 
         return (high << 8) | low
 
-    def read16bug(self, address: np.uint16) -> np.uint16:
+    def read16bug(self, address: int) -> int:
         """
         Taken from fogleman's source, "emulates a 6502 bug that caused the low 
         byte to wrap without incrementing the high byte"
@@ -88,7 +197,7 @@ class Memory:
         :return: word
         """
         a = address
-        b = np.uint16(a & 0xFF00) | np.uint16(np.uint8(a) + 1)
+        b = (a & 0xFF00) | ((a + 1) & 0xFF)
         low = self.read(a)
         high = self.read(b)
         return (high << 8) | low
@@ -103,6 +212,12 @@ class Memory:
 
 
 class PPUMemory(object):
+    """
+    PPU address space: pattern tables (CHR) at $0000-$1FFF, nametables at
+    $2000-$3EFF and palette RAM at $3F00-$3FFF. Every region is a direct view,
+    the mirrors being resolved through small page maps that are only rebuilt
+    when the cartridge switches banks or mirroring.
+    """
 
     MIRROR_HORIZONTAL = 0
     MIRROR_VERTICAL = 1
@@ -110,18 +225,82 @@ class PPUMemory(object):
     MIRROR_SINGLE_1 = 3
     MIRROR_FOUR = 4
 
+    # Physical nametable used by each of the four logical ones
+    mirror_tables = {
+        MIRROR_HORIZONTAL: (0, 0, 1, 1),
+        MIRROR_VERTICAL: (0, 1, 0, 1),
+        MIRROR_SINGLE_0: (0, 0, 0, 0),
+        MIRROR_SINGLE_1: (1, 1, 1, 1),
+        MIRROR_FOUR: (0, 1, 2, 3),
+    }
+
+    # $3F10/$3F14/$3F18/$3F1C are mirrors of $3F00/$3F04/$3F08/$3F0C
+    palette_map = tuple(index - 16 if index >= 16 and index % 4 == 0 else index
+                        for index in range(32))
+
     def __init__(self, console):
         self.console = console
+        self.mapper = None
+        # 2KB inside the console, plus the 2KB a four-screen cartridge adds
+        self.nametable_data = np.zeros(0x1000, dtype=np.uint8)  # type: np.ndarray
+        self.palette_data = np.zeros(32, dtype=np.uint8)  # type: np.ndarray
+        self.palette = memoryview(self.palette_data)
+        tables = memoryview(self.nametable_data)
+        self.physical_nametables = [tables[i * 0x400:(i + 1) * 0x400] for i in range(4)]
+        self.nametables = [self.physical_nametables[0]] * 4  # type: List[memoryview]
+        self.chr_pages = [None, None]  # type: List[Optional[memoryview]]
+        self.chr_writable = False
+        self.tile_cache = None  # type: Optional[TileCache]
 
-    def read(self, address: np.uint16) -> np.uint8:
-        address = address % 0x4000
+    def connect(self, mapper) -> None:
+        """
+        Maps the cartridge pattern tables and follows its bank and mirroring
+        changes.
+        :param mapper: the cartridge mapper
+        """
+        self.mapper = mapper
+        self.chr_writable = mapper.chr.flags.writeable
+        self.tile_cache = TileCache(mapper)
+        mapper.add_bank_listener(self.on_bank_switch)
+        mapper.add_mirror_listener(self.on_mirror_change)
+        self.on_bank_switch()
+        self.on_mirror_change()
+
+    def on_bank_switch(self) -> None:
+        chr_data = memoryview(self.mapper.chr)
+        self.chr_pages = [chr_data[offset:offset + 0x1000]
+                          for offset in self.mapper.chr_bank_offsets()]
+
+    def on_mirror_change(self) -> None:
+        table = self.mirror_tables[int(self.mapper.mirror)]
+        self.nametables = [self.physical_nametables[index] for index in table]
+
+    def read(self, address: int) -> int:
+        """
+        Reads a byte from the PPU address space.
+        :param address: a location between 0x0000 and 0x3FFF (mirrored above)
+        :return: byte, as a plain int
+        """
+        address = int(address) & 0x3FFF
         if address < 0x2000:
-            return self.console.mapper.read(address)
+            return self.chr_pages[address >> 12][address & 0x0FFF]
         elif address < 0x3F00:
-            pass
-        else:
-            raise NotImplementedError()
-        # TODO: finish
+            return self.nametables[(address >> 10) & 3][address & 0x03FF]
+        return self.palette[self.palette_map[address & 0x1F]]
 
-    def write(self, address: np.uint16, value: np.uint16) -> None:
-        raise NotImplementedError()
+    def write(self, address: int, value: int) -> None:
+        """
+        Writes a byte in the PPU address space. Writes to CHR ROM are ignored.
+        :param address: a location between 0x0000 and 0x3FFF (mirrored above)
+        :param value: byte
+        """
+        address = int(address) & 0x3FFF
+        value = int(value) & 0xFF
+        if address < 0x2000:
+            if self.chr_writable:
+                # Through the mapper, so the tile cache sees the change
+                self.mapper.write(address, value)
+        elif address < 0x3F00:
+            self.nametables[(address >> 10) & 3][address & 0x03FF] = value
+        else:
+            self.palette[self.palette_map[address & 0x1F]] = value
@@ -0,0 +1,65 @@
+import numpy as np
+from typing import Sequence, Tuple
+
+# The 64 colors generated by the NES PPU (2C02), in RGB
+DEFAULT_PALETTE = (
+    (0x75, 0x75, 0x75), (0x27, 0x1b, 0x8f), (0x00, 0x00, 0xab), (0x47, 0x00, 0x9f),
+    (0x8f, 0x00, 0x77), (0xab, 0x00, 0x13), (0xa7, 0x00, 0x00), (0x7f, 0x0b, 0x00),
+    (0x43, 0x2f, 0x00), (0x00, 0x47, 0x00), (0x00, 0x51, 0x00), (0x00, 0x3f, 0x17),
+    (0x1b, 0x3f, 0x5f), (0x00, 0x00, 0x00), (0x00, 0x00, 0x00), (0x00, 0x00, 0x00),
+    (0xbc, 0xbc, 0xbc), (0x00, 0x73, 0xef), (0x23, 0x3b, 0xef), (0x83, 0x00, 0xf3),
+    (0xbf, 0x00, 0xbf), (0xe7, 0x00, 0x5b), (0xdb, 0x2b, 0x00), (0xcb, 0x4f, 0x0f),
+    (0x8b, 0x73, 0x00), (0x00, 0x97, 0x00), (0x00, 0xab, 0x00), (0x00, 0x93, 0x3b),
+    (0x00, 0x83, 0x8b), (0x00, 0x00, 0x00), (0x00, 0x00, 0x00), (0x00, 0x00, 0x00),
+    (0xff, 0xff, 0xff), (0x3f, 0xbf, 0xff), (0x5f, 0x97, 0xff), (0xa7, 0x8b, 0xfd),
+    (0xf7, 0x7b, 0xff), (0xff, 0x77, 0xb7), (0xff, 0x77, 0x63), (0xff, 0x9b, 0x3b),
+    (0xf3, 0xbf, 0x3f), (0x83, 0xd3, 0x13), (0x4f, 0xdf, 0x4b), (0x58, 0xf8, 0x98),
+    (0x00, 0xeb, 0xdb), (0x00, 0x00, 0x00), (0x00, 0x00, 0x00), (0x00, 0x00, 0x00),
+    (0xff, 0xff, 0xff), (0xab, 0xe7, 0xff), (0xc7, 0xd7, 0xff), (0xd7, 0xcb, 0xff),
+    (0xff, 0xc7, 0xff), (0xff, 0xc7, 0xdb), (0xff, 0xbf, 0xb3), (0xff, 0xdb, 0xab),
+    (0xff, 0xe7, 0xa3), (0xe3, 0xff, 0xa3), (0xab, 0xf3, 0xbf), (0xb3, 0xff, 0xcf),
+    (0x9f, 0xff, 0xf3), (0x00, 0x00, 0x00), (0x00, 0x00, 0x00), (0x00, 0x00, 0x00),
+)
+
+# Attenuation of the channels not emphasized by PPUMASK
+EMPHASIS_FACTOR = 0.816
+
+COLORS = 64
+EMPHASIS_LEVELS = 8
+
+
+def emphasis_table(palette: Sequence[Tuple[int, int, int]]) -> np.ndarray:
+    """
+    Expands the 64 base colors into the 512 entry table used for output:
+    one copy of the palette per combination of the PPUMASK emphasis bits,
+    at offset emphasis * 64.
+    :param palette: the 64 RGB colors
+    :return: array of uint8 shaped (512, 3)
+    """
+    base = np.array(palette, dtype=np.float64).reshape(COLORS, 3)
+    table = np.empty((EMPHASIS_LEVELS, COLORS, 3), dtype=np.float64)
+    for emphasis in range(EMPHASIS_LEVELS):
+        scale = np.ones(3)
+        # Red (bit 0), green (bit 1) and blue (bit 2) each darken the others
+        for channel in range(3):
+            if emphasis & (1 << channel):
+                scale[[c for c in range(3) if c != channel]] *= EMPHASIS_FACTOR
+        table[emphasis] = base * scale
+    return np.rint(table).astype(np.uint8).reshape(-1, 3)
+
+
+def load_palette(path: str) -> np.ndarray:
+    """
+    Loads a .pal file: raw RGB triplets, either the 64 base colors or the
+    full 512 entry table with the emphasis combinations already applied.
+    :param path: file to load
+    :return: array of uint8 shaped (512, 3)
+    """
+    with open(path, 'rb') as pal:
+        data = np.frombuffer(pal.read(), dtype=np.uint8)
+    if len(data) == COLORS * 3:
+        return emphasis_table(data.reshape(COLORS, 3))
+    if len(data) == COLORS * EMPHASIS_LEVELS * 3:
+        return data.reshape(-1, 3).copy()
+    raise ValueError(f'{path} is not a palette file: expected {COLORS * 3} or '
+                     f'{COLORS * EMPHASIS_LEVELS * 3} bytes, got {len(data)}')
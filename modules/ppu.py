@@ -1,10 +1,13 @@
 import logging
 import numpy as np
-from typing import List
-from pyglet.graphics import Batch
-from .memory import Memory
-from .cpu import Interrupt
-from main import Manager
+from typing import TYPE_CHECKING, Callable, List, Optional
+from .framebuffer import FrameBuffer
+from .memory import Memory, PPUMemory
+from .palette import DEFAULT_PALETTE
+
+if TYPE_CHECKING:
+    from .cpu import CPU
+    from .scheduler import Scheduler
 
 
 class PPU:
@@ -15,7 +18,8 @@ class PPU:
     scanline: int = 0
     frame: int = 0
     frame_number: int = 0
-    palette: List[tuple] = []
+    color_mask: int = 0x3F  # 0x30 in grayscale, keeping only the brightness
+    emphasis: int = 0  # offset of the emphasized colors (see FrameBuffer)
 
     v: np.uint16 = 0  # current vram address (15 bit)
     t: np.uint16 = 0  # temporary vram address (15 bit)
@@ -47,96 +51,52 @@ class PPU:
     flag_sprite_overflow: np.uint8 = np.uint8(0)
     flag_sprite_zero_hit: np.uint8 = np.uint8(0)
 
-    tile_data: np.uint64 = None
+    tile_data: int = 0  # 64 bits, two tiles of 4-bit pixels
     sprite_count: int = 0
     sprite_positions = None
-    front = None
     background_color: List[int] = []
-    attribute_table_byte = None
-    name_table_byte: np.uint8 = None
-    low_tile_byte: np.uint8 = None
-    high_tile_byte: np.uint8 = None
-
-    oam_address: np.uint8 = np.uint8(0)
+    # Fetch latches, read before being fetched when rendering is enabled
+    # in the middle of a tile. The pattern planes come from the tile cache
+    # already spread into 4-bit pixels.
+    attribute_table_byte: int = 0
+    name_table_byte: int = 0
+    low_tile_byte: int = 0
+    high_tile_byte: int = 0
+
+    oam_address: int = 0
     buffered_data: np.uint8 = np.uint8(0)
 
-    def __init__(self, memory: Memory):
-        self.window_frame = Batch()  # type: Batch
-
-        self.palette_data = [(0x75, 0x75, 0x75),
-                             (0x27, 0x1b, 0x8f),
-                             (0x00, 0x00, 0xab),
-                             (0x47, 0x00, 0x9f),
-                             (0x8f, 0x00, 0x77),
-                             (0xab, 0x00, 0x13),
-                             (0xa7, 0x00, 0x00),
-                             (0x7f, 0x0b, 0x00),
-                             (0x43, 0x2f, 0x00),
-                             (0x00, 0x47, 0x00),
-                             (0x00, 0x51, 0x00),
-                             (0x00, 0x3f, 0x17),
-                             (0x1b, 0x3f, 0x5f),
-                             (0x00, 0x00, 0x00),
-                             (0x00, 0x00, 0x00),
-                             (0x00, 0x00, 0x00),
-                             (0xbc, 0xbc, 0xbc),
-                             (0x00, 0x73, 0xef),
-                             (0x23, 0x3b, 0xef),
-                             (0x83, 0x00, 0xf3),
-                             (0xbf, 0x00, 0xbf),
-                             (0xe7, 0x00, 0x5b),
-                             (0xdb, 0x2b, 0x00),
-                             (0xcb, 0x4f, 0x0f),
-                             (0x8b, 0x73, 0x00),
-                             (0x00, 0x97, 0x00),
-                             (0x00, 0xab, 0x00),
-                             (0x00, 0x93, 0x3b),
-                             (0x00, 0x83, 0x8b),
-                             (0x00, 0x00, 0x00),
-                             (0x00, 0x00, 0x00),
-                             (0x00, 0x00, 0x00),
-                             (0xff, 0xff, 0xff),
-                             (0x3f, 0xbf, 0xff),
-                             (0x5f, 0x97, 0xff),
-                             (0xa7, 0x8b, 0xfd),
-                             (0xf7, 0x7b, 0xff),
-                             (0xff, 0x77, 0xb7),
-                             (0xff, 0x77, 0x63),
-                             (0xff, 0x9b, 0x3b),
-                             (0xf3, 0xbf, 0x3f),
-                             (0x83, 0xd3, 0x13),
-                             (0x4f, 0xdf, 0x4b),
-                             (0x58, 0xf8, 0x98),
-                             (0x00, 0xeb, 0xdb),
-                             (0x00, 0x00, 0x00),
-                             (0x00, 0x00, 0x00),
-                             (0x00, 0x00, 0x00),
-                             (0xff, 0xff, 0xff),
-                             (0xab, 0xe7, 0xff),
-                             (0xc7, 0xd7, 0xff),
-                             (0xd7, 0xcb, 0xff),
-                             (0xff, 0xc7, 0xff),
-                             (0xff, 0xc7, 0xdb),
-                             (0xff, 0xbf, 0xb3),
-                             (0xff, 0xdb, 0xab),
-                             (0xff, 0xe7, 0xa3),
-                             (0xe3, 0xff, 0xa3),
-                             (0xab, 0xf3, 0xbf),
-                             (0xb3, 0xff, 0xcf),
-                             (0x9f, 0xff, 0xf3),
-                             (0x00, 0x00, 0x00),
-                             (0x00, 0x00, 0x00),
-                             (0x00, 0x00, 0x00)]
-
+    def __init__(self, memory: Memory, ppu_memory: PPUMemory, cpu: 'CPU'):
         self.memory = memory
-        # self.palette_data = np.ndarray((32, ), dtype=np.uint8)
-        self.nametable_data = np.ndarray((2048, ), dtype=np.uint8)
-        self.oam_data = np.ndarray((2048, ), dtype=np.uint8)
+        self.ppu_memory = ppu_memory
+        self.cpu = cpu
+        self.frame_listeners = []  # type: List[Callable[[FrameBuffer], None]]
+        self.oam_data = np.zeros((256, ), dtype=np.uint8)
+        self.oam_changed = True  # sprite_lines has to be built again
+        self.sprite_lines = None
+        self.sprite_line_counts = []
+        self.sprite_line_overflow = []
         self.sprite_count = 0
         self.sprite_priorities = np.ndarray((8, ), dtype=np.uint8)
         self.sprite_indexes = np.ndarray((8, ), dtype=np.uint8)
         self.sprite_patterns = np.ndarray((8, ), dtype=np.uint32)
+        self.sprite_positions = np.ndarray((8, ), dtype=np.uint8)
+        self.frame_buffer = FrameBuffer(DEFAULT_PALETTE)
+        # Palette indexes of the frame being drawn
+        self.pixels = self.frame_buffer.back
+        self.renderer = None  # draws whole scanlines when set
+        self.background_cache = None
+        self.scroll_writes = 0  # increased by every write changing the scroll
+        self.frameskip = 0  # frames skipped after each one drawn
+        self.skip_frame = False  # whether the current frame is drawn
+        self.sprite_zero_hit_cycle = None  # type: Optional[int]
+        self.line_renderer = None  # used to find sprite 0 hits when skipping
         self.frame = 0
+        self.last_synced = 0  # CPU cycle the PPU has caught up to
+        # When set (catch-up mode), NMIs are left pending for the scheduled
+        # 'nmi' event to deliver, and OAM DMA completes on a 'dma' event
+        self.scheduler = None  # type: Optional[Scheduler]
+        self.nmi_pending = False
 
         self.reset()
 
@@ -206,11 +166,14 @@ class PPU:
         self.flag_increment = (value >> 2) & 1
         self.flag_sprite_table = (value >> 3) & 1
         self.flag_background_table = (value >> 4) & 1
+        if (value >> 5) & 1 != self.flag_sprite_size:
+            self.oam_changed = True
         self.flag_sprite_size = (value >> 5) & 1
         self.flag_master_slave = (value >> 6) & 1
         self.nmi_output = (value >> 7) & 1 == 1
         self.nmi_change()
         self.t = (self.t & 0xF3FF) | ((np.uint16(value) & 0x03) << 10)
+        self.scroll_writes += 1
 
     def write_mask(self, value: np.uint8) -> None:
         """
@@ -230,6 +193,8 @@ class PPU:
         self.flag_red_tint = (value >> 5) & 1
         self.flag_green_tint = (value >> 6) & 1
         self.flag_blue_tint = (value >> 7) & 1
+        self.color_mask = 0x30 if self.flag_grayscale else 0x3F
+        self.emphasis = (int(value) >> 5) << 6
 
     def read_status(self) -> np.uint8:
         """
@@ -253,7 +218,7 @@ class PPU:
         Most games just write $00 here and then use OAMDMA.
         :param value: byte
         """
-        self.oam_address = value
+        self.oam_address = int(value) & 0xFF
 
     def read_oam_data(self) -> np.uint8:
         """
@@ -271,7 +236,8 @@ class PPU:
         :param value: byte
         """
         self.oam_data[self.oam_address] = value
-        self.oam_address += 1
+        self.oam_address = (self.oam_address + 1) & 0xFF
+        self.oam_changed = True
 
     def write_scroll(self, value: np.uint8) -> None:
         """
@@ -289,6 +255,7 @@ class PPU:
             self.t = (self.t & 0x8FFF) | ((np.uint16(value) & 0x07) << 12)
             self.t = (self.t & 0xFC1F) | ((np.uint16(value) & 0xF8) << 2)
             self.w = np.uint8(0)
+        self.scroll_writes += 1
 
     def write_address(self, value: np.uint8) -> None:
         """
@@ -304,7 +271,8 @@ class PPU:
         else:
             self.t = (self.t & 0xFF00) | np.uint16(value)
             self.v = self.t
-            self.w = np.uint8(1)
+            self.w = np.uint8(0)
+        self.scroll_writes += 1
 
     def read_data(self) -> np.uint8:
         """
@@ -314,18 +282,17 @@ class PPU:
 
         :return: byte
         """
-        value = self.memory.read(self.v)
+        value = self.ppu_memory.read(self.v)
         if self.v % 0x4000 < 0x3F00:
             # emulate buffered reads
             buffered = self.buffered_data
             self.buffered_data = value
             value = buffered
         else:
-            self.buffered_data = self.memory.read(self.v - 0x1000)
-        if self.flag_increment == 0:
-            self.v += 1
-        else:
-            self.v += 32
+            # Palette reads are immediate, the buffer gets the nametable
+            # byte "under" the palette
+            self.buffered_data = self.ppu_memory.read(self.v - 0x1000)
+        self.increment_address()
         return value
 
     def write_data(self, value: np.uint8) -> None:
@@ -336,13 +303,16 @@ class PPU:
  
         :param value: byte
         """
-        manager = Manager()
+        self.ppu_memory.write(self.v, value)
+        if self.background_cache is not None and 0x2000 <= self.v % 0x4000 < 0x3F00:
+            self.background_cache.on_nametable_write(self.v)
+        self.increment_address()
 
-        manager.ppu_memory.write(self.v, np.uint16(value))
-        if self.flag_increment == 0:
-            self.v += 1
-        else:
-            self.v += 32
+    def increment_address(self) -> None:
+        """
+        Moves v past the byte accessed through $2007, wrapping at 15 bits.
+        """
+        self.v = (int(self.v) + (32 if self.flag_increment else 1)) & 0x7FFF
 
     def write_dma(self, value: np.uint8) -> None:
         """
@@ -351,61 +321,73 @@ class PPU:
         internal PPU OAM.
         :param value: byte
         """
-        manager = Manager()
-        memory = manager.memory
-        cpu = manager.cpu
-        address = np.uint8(np.uint16(value) << 8)
-        for i in range(256):
-            self.oam_data[self.oam_address] = memory.read(address)
-            self.oam_address += 1
-            address += 1
-        cpu.stall += 513
-        if cpu.cycles % 2 == 1:
-            cpu.stall += 1
-
-    def fetch_tile_data(self) -> np.uint32:
-        return np.uint32(self.tile_data >> 32)
+        cpu = self.cpu
+        data = self.memory.read_block(int(value) << 8, 256)
+        start = int(self.oam_address)
+        stall = 514 if cpu.cycles % 2 == 1 else 513
+        cpu.stall += stall
+        if self.scheduler is not None:
+            # OAM is filled once the CPU is released
+            self.scheduler.schedule(cpu.cycles + stall, 'dma', lambda cycle: self.copy_oam(data, start))
+        else:
+            self.copy_oam(data, start)
+
+    def copy_oam(self, data: np.ndarray, start: int) -> None:
+        """
+        Stores the 256 bytes of an OAM DMA.
+        :param data: bytes read from the CPU page
+        :param start: OAM address when the DMA started
+        """
+        # The copy starts at the OAM address and wraps around, which leaves
+        # the address where it was
+        self.oam_data[start:256] = data[:256 - start]
+        self.oam_data[:start] = data[256 - start:]
+        self.oam_changed = True
+
+    def enable_scanline_renderer(self, background_cache: bool = False) -> None:
+        """
+        Draws whole scanlines at once (see ScanlineRenderer) instead of a
+        pixel per cycle.
+        :param background_cache: keep the nametables prerendered (see
+        BackgroundCache), requires the cartridge to be loaded
+        """
+        from .renderer import ScanlineRenderer
+
+        if background_cache:
+            from .background_cache import BackgroundCache
+
+            self.background_cache = BackgroundCache(self.ppu_memory)
+        self.renderer = ScanlineRenderer(self, self.background_cache)
+
+    def fetch_tile_data(self) -> int:
+        return self.tile_data >> 32
 
     def fetch_attribute_table_byte(self) -> None:
         v = self.v
         address = 0x23C0 | (v & 0x0C00) | ((v >> 4) & 0x38) | ((v >> 2) & 0x07)
         shift = ((v >> 4) & 4) | (v & 2)
-        memory = Manager().memory
-        self.attribute_table_byte = ((memory.read(address) >> shift) & 3) << 2
+        self.attribute_table_byte = ((self.ppu_memory.read(address) >> shift) & 3) << 2
 
     def fetch_low_tile_byte(self) -> None:
-        fine_y = (self.v >> 12) & 7
-        table = self.flag_background_table
-        tile = self.name_table_byte
-        address = 0x1000 * np.uint16(table) + np.uint16(tile) * 16 + fine_y
-        memory = Manager().memory
-        self.low_tile_byte = memory.read(address)
+        fine_y = (int(self.v) >> 12) & 7
+        rows = self.ppu_memory.tile_cache.row_table(int(self.flag_background_table))
+        self.low_tile_byte = int(rows[self.name_table_byte, 0, 0, fine_y])
 
     def fetch_high_tile_byte(self) -> None:
-        fine_y = (self.v >> 12) & 7
-        table = self.flag_background_table
-        tile = self.name_table_byte
-        address = 0x1000 * np.uint16(table) + np.uint16(tile) * 16 + fine_y
-        memory = Manager().memory
-        self.high_tile_byte = memory.read(address + 8)
+        fine_y = (int(self.v) >> 12) & 7
+        rows = self.ppu_memory.tile_cache.row_table(int(self.flag_background_table))
+        self.high_tile_byte = int(rows[self.name_table_byte, 0, 1, fine_y])
 
     def store_tile_data(self) -> None:
-        data = np.uint32(0)
-        for i in range(8):
-            a = self.attribute_table_byte
-            p1 = (self.low_tile_byte & 0x80) >> 7
-            p2 = (self.high_tile_byte & 0x80) >> 6
-            self.low_tile_byte << 1
-            self.high_tile_byte << 1
-            data <<= 4
-            data |= np.uint32(a | p1 | p2)
-        self.tile_data |= np.uint64(data)
+        data = self.low_tile_byte | self.high_tile_byte
+        # The attribute bits are the same for the 8 pixels
+        self.tile_data |= data | (int(self.attribute_table_byte) * 0x11111111)
 
     def background_pixel(self) -> np.uint8:
         if self.flag_show_background == 0:
             return np.uint8(0)
-        data = self.fetch_tile_data() >> ((7 - self.x) * 4)
-        return np.uint8(data & 0x0F)
+        data = self.fetch_tile_data() >> ((7 - int(self.x)) * 4)
+        return data & 0x0F
 
     def sprite_pixel(self):
         if self.flag_show_sprites == 0:
@@ -443,7 +425,7 @@ class PPU:
 
         if not b:
             if not s:
-                color = bytes(0)
+                color = 0
             else:
                 color = sprite | 0x10
         elif not s:
@@ -455,8 +437,24 @@ class PPU:
                 color = sprite | 0x10
             else:
                 color = background
-        c = self.palette[self.read_palette(np.uint16(color) % 64)]
-        self.background_color = [x, y, c]  # FIXME: If it fails, it's a possible failure point
+        self.pixels[y, x] = self.read_palette(color) & self.color_mask
+        if x == 0:
+            self.frame_buffer.back_emphasis[y] = self.emphasis
+
+    def fill_backdrop(self, first: int, last: int) -> None:
+        """
+        Fills lines of the frame being drawn with the backdrop color, all
+        that's shown while rendering is disabled: the first palette entry,
+        or the one v points to while it's inside the palette.
+        :param first: first line
+        :param last: line after the last one
+        """
+        if self.skip_frame:
+            return
+        v = int(self.v) & 0x3FFF
+        color = self.read_palette(v if v >= 0x3F00 else 0) & self.color_mask
+        self.pixels[first:last] = color
+        self.frame_buffer.back_emphasis[first:last] = self.emphasis
 
     def fetch_sprite_pattern(self, i: int, row: int) -> np.uint32:
         tile = self.oam_data[i * 4 + 1]
@@ -475,53 +473,44 @@ class PPU:
                 tile += 1
                 row -= 8
 
-        address = 0x1000 * np.uint16(table) + np.uint16(tile) * 16 + np.uint16(row)  # type: np.uint16
-        a = (attributes & 3) << 2
-        memory = Manager().memory
-        low_tile_byte = memory.read(address)
-        high_tile_byte = memory.read(address + 8)
-        data = np.uint32(0)
-        for i in range(8):
-            if attributes & 0x40 == 0x40:
-                p1 = (low_tile_byte & 1) << 0
-                p2 = (high_tile_byte & 1) << 1
-                low_tile_byte >>= 1
-                high_tile_byte >>= 1
-            else:
-                p1 = (low_tile_byte & 0x80) >> 7
-                p2 = (high_tile_byte & 0x80) >> 6
-                low_tile_byte <<= 1
-                high_tile_byte <<= 1
-            data <<= 4
-            data |= np.uint32(a | p1 | p2)
-        return data
+        flip = (int(attributes) >> 6) & 1
+        planes = self.ppu_memory.tile_cache.row_table(int(table))[int(tile), flip, :, int(row)]
+        a = (int(attributes) & 3) << 2
+        return np.uint32(int(planes[0]) | int(planes[1]) | (a * 0x11111111))
+
+    def build_sprite_table(self) -> None:
+        """
+        Finds the sprites shown on every visible line at once: the first 8
+        (in OAM order) of each line, and whether the line has more of them.
+        Only needed after OAM or the sprite size change.
+        """
+        h = 8 if self.flag_sprite_size == 0 else 16
+        ys = self.oam_data[0::4].astype(np.int16)
+        rows = np.arange(240, dtype=np.int16)[:, None] - ys[None, :]
+        visible = (rows >= 0) & (rows < h)
+        counts = visible.sum(axis=1)
+        # A stable sort of the hidden flags leaves the visible sprites first,
+        # still in OAM order
+        self.sprite_lines = np.argsort(~visible, axis=1, kind='stable')[:, :8]
+        self.sprite_line_counts = np.minimum(counts, 8).tolist()
+        self.sprite_line_overflow = (counts > 8).tolist()
+        self.oam_changed = False
 
     def evaluate_sprites(self) -> None:
-        if self.flag_sprite_size == 0:
-            h = 8
-        else:
-            h = 16
-        count = 0
-
-        for i in range(64):
-            y = self.oam_data[i * 4 + 0]
-            a = self.oam_data[i * 4 + 2]
-            x = self.oam_data[i * 4 + 3]
-            row = self.scanline - int(y)
-
-            if row < 0 or row >= h:
-                continue
-
-            if count < 8:
-                self.sprite_patterns[count] = self.fetch_sprite_pattern(i, row)
-                self.sprite_positions[count] = x
-                self.sprite_priorities[count] = (a >> 5) & 1
-                self.sprite_indexes[count] = np.uint8(i)
-
-            count += 1
-
-        if count > 8:
-            count = 8
+        if self.oam_changed:
+            self.build_sprite_table()
+        line = self.scanline
+        count = self.sprite_line_counts[line]
+
+        for slot, i in enumerate(self.sprite_lines[line, :count].tolist()):
+            y = int(self.oam_data[i * 4 + 0])
+            a = int(self.oam_data[i * 4 + 2])
+            self.sprite_patterns[slot] = self.fetch_sprite_pattern(i, line - y)
+            self.sprite_positions[slot] = self.oam_data[i * 4 + 3]
+            self.sprite_priorities[slot] = (a >> 5) & 1
+            self.sprite_indexes[slot] = i
+
+        if self.sprite_line_overflow[line]:
             self.flag_sprite_overflow = np.uint8(1)
 
         self.sprite_count = count
@@ -535,9 +524,67 @@ class PPU:
             self.nmi_delay = np.uint8(15)
         self.nmi_previous = nmi
 
-    @staticmethod
-    def trigger_nmi() -> None:
-        Interrupt.NMI = True
+    def cycles_until_event(self) -> int:
+        """
+        Returns how many PPU cycles are left until the next change the CPU
+        could be polling for: the vertical blank being set or cleared, the
+        delayed NMI, the end of the frame (where run_frame returns) or
+        (while a sprite 0 hit is still possible) the end of the current
+        visible line.
+        """
+        frame_dots = 262 * 341
+        position = self.scanline * 341 + self.cycle
+        events = [(241 * 341 + 1 - position) % frame_dots,
+                  (261 * 341 + 1 - position) % frame_dots,
+                  frame_dots - position]
+        if self.nmi_delay > 0:
+            events.append(int(self.nmi_delay))
+        rendering_enabled = self.flag_show_background != 0 or self.flag_show_sprites != 0
+        if rendering_enabled and not self.flag_sprite_zero_hit and self.scanline < 240:
+            events.append(341 - self.cycle)
+        # The odd frames skip a cycle, so play it safe
+        return max(min(event for event in events if event > 0) - 1, 0)
+
+    def cycles_until_nmi(self) -> Optional[int]:
+        """
+        Predicts when the next NMI will be triggered, assuming the registers
+        aren't written until then.
+        :return: PPU cycles left, or None if there won't be any
+        """
+        if self.nmi_delay > 0:
+            return int(self.nmi_delay)
+        if not self.nmi_output or self.nmi_occurred:
+            # Disabled, or already raised for the current vertical blank
+            return None
+        position = self.scanline * 341 + self.cycle
+        vblank = (241 * 341 + 1 - position) % (262 * 341)
+        # Raising the NMI output starts the same 15 cycle delay as above
+        return (vblank or 262 * 341) + 15
+
+    def cycles_until_deadline(self) -> int:
+        """
+        PPU cycles left until the rest of the system has to catch up with the
+        PPU: the next NMI or the end of the frame.
+        """
+        frame_end = 262 * 341 - (self.scanline * 341 + self.cycle)
+        nmi = self.cycles_until_nmi()
+        if nmi is not None and nmi < frame_end:
+            return nmi
+        return frame_end
+
+    def trigger_nmi(self) -> None:
+        if self.scheduler is not None:
+            self.nmi_pending = True
+        else:
+            self.cpu.trigger_nmi()
+
+    def add_frame_listener(self, listener: Callable[[FrameBuffer], None]) -> None:
+        """
+        Registers a function to be called with the frame buffer every time a
+        frame is completed (skipped frames aside).
+        :param listener: callable receiving the FrameBuffer
+        """
+        self.frame_listeners.append(listener)
 
     def tick(self) -> None:
         """
@@ -551,20 +598,69 @@ class PPU:
             if self.f == 1 and self.scanline == 261 and self.cycle == 339:
                 self.cycle = 0
                 self.scanline = 0
-                self.frame += 1
-                self.f ^= 1
+                self.end_frame()
                 return
         self.cycle += 1
         if self.cycle > 340:
             self.cycle = 0
             self.scanline += 1
             if self.scanline > 261:
-                # FIXME: Possible fuckup point, but those are the risks of coding wasted i guess
-                # The whole frame should be ready to be shown by now (I guess)
-                Manager().ui.generate_frame()
                 self.scanline = 0
-                self.frame += 1
-                self.f ^= 1
+                self.end_frame()
+
+    def end_frame(self) -> None:
+        """
+        Shows the frame just finished (unless it was skipped) and decides
+        whether the next one is skipped.
+        """
+        if not self.skip_frame:
+            for listener in self.frame_listeners:
+                listener(self.frame_buffer)
+        self.frame += 1
+        self.f ^= 1
+        self.skip_frame = self.frameskip > 0 and self.frame % (self.frameskip + 1) != 0
+
+    def run(self, cycles: int) -> None:
+        """
+        Executes the given number of PPU cycles. Stretches where the PPU has
+        nothing to do (rendering disabled, or the vertical blank lines) are
+        skipped in one go, stopping right before the next cycle with
+        something to do: setting or clearing the vertical blank, the NMI,
+        the end of the frame or the pre-render line.
+        :param cycles: PPU cycles to run
+        """
+        step = self.step
+        while cycles > 0:
+            rendering_enabled = self.flag_show_background != 0 or self.flag_show_sprites != 0
+            if rendering_enabled and not 241 <= self.scanline < 261:
+                step()
+                cycles -= 1
+                continue
+
+            position = self.scanline * 341 + self.cycle
+            # Cycles whose tick only moves the counters
+            idle = 262 * 341 - position - 1  # the end of the frame
+            for event in (241 * 341 + 1, 261 * 341, 261 * 341 + 1):
+                if event > position:
+                    idle = min(idle, event - position - 1)
+            if self.nmi_delay > 0:
+                idle = min(idle, int(self.nmi_delay) - 1)
+            idle = min(idle, cycles)
+
+            if idle <= 0:
+                step()
+                cycles -= 1
+            else:
+                if not rendering_enabled:
+                    # The visible lines whose dot 256 is skipped
+                    first = max(-(-(position + 1 - 256) // 341), 0)
+                    last = min((position + idle - 256) // 341 + 1, 240)
+                    if first < last:
+                        self.fill_backdrop(first, last)
+                self.scanline, self.cycle = divmod(position + idle, 341)
+                if self.nmi_delay > 0:
+                    self.nmi_delay = np.uint8(int(self.nmi_delay) - idle)
+                cycles -= idle
 
     def step(self) -> None:
         """
@@ -580,11 +676,18 @@ class PPU:
         fetch_cycle = prefetch_cycle or visible_cycle
 
         # background logic
-        if rendering_enabled:
-            if visible_line and visible_cycle:
+        skip = self.skip_frame
+        if rendering_enabled and self.renderer is not None:
+            # Whole lines are drawn at once, so there's nothing to fetch. By
+            # now v has moved 33 tiles past the start of the line (the 2
+            # prefetched on the previous line, and 31 more)
+            if visible_line and self.cycle == 256 and not skip:
+                self.renderer.render_line(self.line_scroll(33))
+        elif rendering_enabled:
+            if visible_line and visible_cycle and not skip:
                 self.render_pixel()
-            if render_line and fetch_cycle:
-                self.tile_data <<= 4
+            if render_line and fetch_cycle and not skip:
+                self.tile_data = (self.tile_data << 4) & 0xFFFFFFFFFFFFFFFF
                 # We'll execute different instructions based on each cycle
                 # (in loops of 8 cycles)
                 cycle = self.cycle % 8
@@ -598,7 +701,11 @@ class PPU:
                     self.fetch_high_tile_byte()
                 elif cycle == 0:
                     self.store_tile_data()
+        elif visible_line and self.cycle == 256:
+            self.fill_backdrop(self.scanline, self.scanline + 1)
 
+        # scroll logic
+        if rendering_enabled:
             if pre_line and (self.cycle >= 280) and (self.cycle <= 304):
                 self.copy_y()
 
@@ -618,6 +725,15 @@ class PPU:
                 else:
                     self.sprite_count = 0
 
+        # Nothing is drawn on skipped frames, and lines are drawn at once by
+        # the renderer, but the CPU may still wait for the sprite 0 hit: it's
+        # raised at the cycle of the pixel hitting
+        if (skip or self.renderer is not None) and rendering_enabled and visible_line:
+            if self.cycle == 1:
+                self.predict_sprite_zero_hit()
+            elif self.cycle == self.sprite_zero_hit_cycle:
+                self.flag_sprite_zero_hit = np.uint8(1)
+
         if (self.scanline == 241) and (self.cycle == 1):
             self.set_vblank()
 
@@ -626,6 +742,46 @@ class PPU:
             self.flag_sprite_zero_hit = np.uint8(0)
             self.flag_sprite_overflow = np.uint8(0)
 
+    def predict_sprite_zero_hit(self) -> None:
+        """
+        Finds the cycle of the current line where sprite 0 hits the
+        background (if it does), from the sprites evaluated for the line and
+        the opacity of the background.
+        """
+        self.sprite_zero_hit_cycle = None
+        if self.flag_sprite_zero_hit or 0 not in self.sprite_indexes[:self.sprite_count]:
+            return
+        renderer = self.renderer
+        # The first two tiles of the line were fetched on the previous one
+        v = self.line_scroll(2)
+        if renderer is None:
+            if self.line_renderer is None:
+                from .renderer import ScanlineRenderer
+
+                self.line_renderer = ScanlineRenderer(self)
+            renderer = self.line_renderer
+
+        background = renderer.background_line(v)
+        sprite, priority, zero = renderer.sprite_line()
+        if self.flag_show_left_background == 0:
+            background[:8] = 0
+        if self.flag_show_left_sprites == 0:
+            sprite[:8] = 0
+        hits = np.flatnonzero(((background & 3) != 0) & ((sprite & 3) != 0) & zero)
+        if hits.size and hits[0] < 255:
+            self.sprite_zero_hit_cycle = int(hits[0]) + 1
+
+    def line_scroll(self, tiles: int) -> int:
+        """
+        Returns v moved back horizontally by the given number of tiles, which
+        gives the scroll the current line started at.
+        :param tiles: coarse X increments done since the start of the line
+        """
+        v = int(self.v)
+        # Coarse X and the horizontal nametable bit make a 64 tile counter
+        position = ((((v >> 10) & 1) << 5 | (v & 0x1F)) - tiles) & 0x3F
+        return (v & ~0x041F) | ((position >> 5) << 10) | (position & 0x1F)
+
     def clear_vblank(self) -> None:
         """
         Ends the Vertical Blank stage of the frame
@@ -637,7 +793,9 @@ class PPU:
         """
         Sets the Vertical Blank stage of the frame
         """
-        self.front, self.background_color = self.background_color, self.front
+        if not self.skip_frame:
+            self.frame_buffer.swap()
+            self.pixels = self.frame_buffer.back
         self.nmi_occurred = True
         self.nmi_change()
 
@@ -652,22 +810,18 @@ class PPU:
         self.v = (self.v & 0x841F) | (self.t & 0x7BE0)
 
     def fetch_nametable_byte(self) -> None:
-        v = self.v
-        address = 0x23C0 | (v & 0x0C00) | ((v >> 4) & 0x38) | ((v >> 2) & 0x07)
-        shift = ((v >> 4) & 4) | (v & 2)
-        self.attribute_table_byte = (
-            (int(self.memory.read(np.uint8(address))) >> shift) & 3
-        ) << 2
-
-    def read_palette(self, address: np.uint16) -> np.uint8:
-        if address >= 16 and address % 4 == 0:
-            address -= 16
-        return self.palette_data[address]
-
-    def write_palette(self, address: np.uint16, value: np.uint8):
-        if address >= 16 and address % 4 == 0:
-            address -= 16
-        self.palette_data[address] = value
+        self.name_table_byte = self.ppu_memory.read(0x2000 | (self.v & 0x0FFF))
+
+    def read_palette(self, address: int) -> int:
+        """
+        Reads the palette RAM, returning an index of the NES palette.
+        """
+        memory = self.ppu_memory
+        return memory.palette[memory.palette_map[int(address) & 0x1F]]
+
+    def write_palette(self, address: int, value: int):
+        memory = self.ppu_memory
+        memory.palette[memory.palette_map[int(address) & 0x1F]] = int(value) & 0xFF
 
     def increment_x(self) -> None:
         """
@@ -0,0 +1,140 @@
+import numpy as np
+from typing import TYPE_CHECKING, Optional
+
+if TYPE_CHECKING:
+    from .background_cache import BackgroundCache
+    from .ppu import PPU
+
+
+class ScanlineRenderer(object):
+    """
+    Renders a whole scanline at once, instead of a pixel per PPU cycle.
+
+    The line is drawn at cycle 256 from the scroll it started at and x: the
+    33 tiles it can show are gathered from the nametables, their rows of
+    pixels taken from the tile cache and combined with their attributes,
+    then the sprites evaluated on the previous line are composited on top.
+    The sprite 0 hit isn't raised here but at its own cycle, see
+    PPU.predict_sprite_zero_hit.
+    The PPU skips the per-cycle background fetches while this renderer is
+    used (v still moves the same way), so scroll changes in the middle of a
+    line take effect on the next one.
+
+    With a background cache, the background comes from the prerendered
+    nametables instead: the whole frame is sliced at once on the first line,
+    unless the scroll or the nametables change while the frame is drawn, in
+    which case the remaining lines are sliced one by one.
+    """
+
+    def __init__(self, ppu: 'PPU', background_cache: Optional['BackgroundCache'] = None) -> None:
+        self.ppu = ppu
+        self.memory = ppu.ppu_memory
+        self.background_cache = background_cache
+        self.frame_background = None  # type: Optional[np.ndarray]
+        self.frame_stamp = None
+        self.palette_map = np.array(self.memory.palette_map, dtype=np.uint8)
+        self.tile_offsets = np.arange(33)
+
+    def render_line(self, v: int) -> None:
+        """
+        Renders the current scanline into the PPU pixels.
+        :param v: scroll of the line (see PPU.line_scroll)
+        """
+        ppu = self.ppu
+        background = self.background_line(v)
+        sprite, priority, _ = self.sprite_line()
+
+        if ppu.flag_show_left_background == 0:
+            background[:8] = 0
+        if ppu.flag_show_left_sprites == 0:
+            sprite[:8] = 0
+
+        b = (background & 3) != 0
+        s = (sprite & 3) != 0
+        sprite_on_top = s & ~(b & (priority != 0))
+        color = np.where(sprite_on_top, sprite | 0x10, np.where(b, background, 0))
+
+        palette = self.memory.palette_data[self.palette_map[color]]
+        ppu.pixels[ppu.scanline] = palette & ppu.color_mask
+        ppu.frame_buffer.back_emphasis[ppu.scanline] = ppu.emphasis
+
+    def background_line(self, v: int) -> np.ndarray:
+        """
+        :param v: scroll of the line
+        :return: 256 background colors (attribute << 2 | pixel), as uint8
+        """
+        ppu = self.ppu
+        if ppu.flag_show_background == 0:
+            return np.zeros(256, dtype=np.uint8)
+        if self.background_cache is not None:
+            return self.cached_background_line(v)
+        memory = self.memory
+        coarse_x = v & 0x1F
+        coarse_y = (v >> 5) & 0x1F
+        fine_y = (v >> 12) & 7
+        nametable = (v >> 10) & 3
+
+        # The row in the current nametable followed by the same row in the
+        # horizontally adjacent one
+        left = np.frombuffer(memory.nametables[nametable], dtype=np.uint8)
+        right = np.frombuffer(memory.nametables[nametable ^ 1], dtype=np.uint8)
+        row = coarse_y * 32
+        attribute_row = 0x3C0 + (coarse_y >> 2) * 8
+        names = np.concatenate((left[row:row + 32], right[row:row + 32]))
+        attributes = np.concatenate((left[attribute_row:attribute_row + 8],
+                                     right[attribute_row:attribute_row + 8]))
+
+        columns = (coarse_x + self.tile_offsets) & 63
+        tiles = names[columns].astype(np.intp)
+        shifts = ((coarse_y & 2) << 1) | (columns & 2)
+        palettes = ((attributes[columns >> 2] >> shifts) & 3) << 2
+
+        pattern_table = memory.tile_cache.table(int(ppu.flag_background_table))
+        pixels = pattern_table[tiles, 0, fine_y]
+        line = (pixels | palettes[:, None].astype(np.uint8)).ravel()
+        fine_x = int(ppu.x)
+        return line[fine_x:fine_x + 256].copy()
+
+    def cached_background_line(self, v: int) -> np.ndarray:
+        """
+        :param v: scroll of the line
+        :return: 256 background colors taken from the background cache
+        """
+        ppu = self.ppu
+        cache = self.background_cache
+        line = ppu.scanline
+        if line == 0 or (ppu.scroll_writes, cache.version) != self.frame_stamp:
+            cache.refresh(int(ppu.flag_background_table))
+            if line == 0:
+                self.frame_background = cache.frame(v, int(ppu.x))
+                self.frame_stamp = (ppu.scroll_writes, cache.version)
+            else:
+                # Split screen (or late nametable update)
+                self.frame_background = None
+        if self.frame_background is not None:
+            return self.frame_background[line].copy()
+        return cache.line(v, int(ppu.x))
+
+    def sprite_line(self) -> tuple:
+        """
+        Draws the sprites evaluated for the current line, the first ones in
+        OAM having priority over the rest.
+        :return: sprite colors, their priority bits and a mask of the
+        pixels drawn by sprite 0
+        """
+        ppu = self.ppu
+        sprite = np.zeros(264, dtype=np.uint8)
+        priority = np.zeros(264, dtype=np.uint8)
+        zero = np.zeros(264, dtype=bool)
+        if ppu.flag_show_sprites == 0:
+            return sprite[:256], priority[:256], zero[:256]
+
+        shifts = np.arange(28, -4, -4, dtype=np.uint32)
+        for i in range(ppu.sprite_count - 1, -1, -1):
+            colors = ((np.uint32(ppu.sprite_patterns[i]) >> shifts) & 0x0F).astype(np.uint8)
+            opaque = (colors & 3) != 0
+            x = int(ppu.sprite_positions[i])
+            sprite[x:x + 8] = np.where(opaque, colors, sprite[x:x + 8])
+            priority[x:x + 8] = np.where(opaque, ppu.sprite_priorities[i], priority[x:x + 8])
+            zero[x:x + 8] = np.where(opaque, ppu.sprite_indexes[i] == 0, zero[x:x + 8])
+        return sprite[:256], priority[:256], zero[:256]
@@ -0,0 +1,111 @@
+import heapq
+import itertools
+from typing import Callable, List, Optional
+
+
+class Scheduler(object):
+    """
+    Master clock of the console, counted in CPU cycles.
+
+    The CPU runs ahead and the scheduler brings the other components up to
+    it in catch-up fashion: each one is run for the whole stretch at once,
+    stopping only at the timestamped events in between, which are fired in
+    order. The console schedules the NMI delivery, the end of the OAM DMA
+    stall and the end of the frame; nothing raises IRQs yet (the APU frame
+    counter isn't emulated and mappers 1 and 2 have none), so there are no
+    events for them. Components can be run in bulk through a
+    run(cycles) method, or stepped through step() when they have per-cycle
+    work; those declaring needs_step = False are never called at all.
+    """
+
+    max_stretch = 29781  # CPU cycles run at most without an event, one frame
+
+    def __init__(self) -> None:
+        self.cycle = 0  # CPU cycle everything has caught up to
+        self.events = []  # heap of [cycle, order, name, callback]
+        self.pending = {}  # name -> event, for rescheduling
+        self.order = itertools.count()
+        self.runners = []  # type: List[Callable[[int], None]]
+
+    def add_component(self, component, ratio: int = 1) -> None:
+        """
+        Registers a component to be run along with the CPU.
+        :param component: object with a run(cycles) or step() method
+        :param ratio: component cycles per CPU cycle (3 for the PPU clock)
+        """
+        if not getattr(component, 'needs_step', True):
+            return
+        run = getattr(component, 'run', None)
+        if run is None:
+            step = component.step
+
+            def run(cycles: int) -> None:
+                for _ in range(cycles):
+                    step()
+        if ratio == 1:
+            self.runners.append(run)
+        else:
+            self.runners.append(lambda cycles: run(cycles * ratio))
+
+    def schedule(self, cycle: int, name: str, callback: Optional[Callable[[int], None]] = None) -> None:
+        """
+        Schedules an event, replacing the pending one with the same name.
+        :param cycle: CPU cycle the event happens at
+        :param name: event name
+        :param callback: called with the cycle once everything has caught up
+        to it, if any (events without one only make the CPU stop there)
+        """
+        self.cancel(name)
+        event = [int(cycle), next(self.order), name, callback]
+        self.pending[name] = event
+        heapq.heappush(self.events, event)
+
+    def cancel(self, name: str) -> None:
+        event = self.pending.pop(name, None)
+        if event is not None:
+            # Left in the heap, but ignored
+            event[2] = None
+
+    def first_event(self) -> Optional[list]:
+        """
+        :return: the next pending event, or None
+        """
+        events = self.events
+        while events and events[0][2] is None:
+            heapq.heappop(events)
+        return events[0] if events else None
+
+    def next_event(self) -> int:
+        """
+        :return: the cycle the CPU can run to before anything has to catch
+        up: the next pending event, at most max_stretch cycles away
+        """
+        limit = self.cycle + self.max_stretch
+        event = self.first_event()
+        return limit if event is None else min(event[0], limit)
+
+    def advance(self, cycle: int) -> None:
+        """
+        Runs the components up to the given cycle, firing the events found
+        on the way.
+        :param cycle: CPU cycle to catch up to
+        """
+        while True:
+            event = self.first_event()
+            if event is None or event[0] > cycle:
+                break
+            heapq.heappop(self.events)
+            at, _, name, callback = event
+            del self.pending[name]
+            self.run(at)
+            if callback is not None:
+                callback(at)
+        self.run(cycle)
+
+    def run(self, cycle: int) -> None:
+        cycles = cycle - self.cycle
+        if cycles <= 0:
+            return
+        self.cycle = cycle
+        for run in self.runners:
+            run(cycles)
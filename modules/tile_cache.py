@@ -0,0 +1,93 @@
+import numpy as np
+
+
+def decode_tiles(data: np.ndarray) -> np.ndarray:
+    """
+    Decodes CHR data into 8x8 tiles of 2-bit pixels, along with their
+    horizontally flipped versions.
+    :param data: CHR bytes, 16 per tile
+    :return: array of uint8 shaped (tiles, 2, 8, 8), indexed by tile, flip,
+    row and column
+    """
+    planes = np.asarray(data, dtype=np.uint8).reshape(-1, 2, 8)
+    shifts = np.arange(7, -1, -1, dtype=np.uint8)
+    low = (planes[:, 0, :, None] >> shifts) & 1
+    high = (planes[:, 1, :, None] >> shifts) & 1
+    pixels = low | (high << 1)
+    return np.stack((pixels, pixels[:, :, ::-1]), axis=1)
+
+
+def pack_rows(tiles: np.ndarray) -> np.ndarray:
+    """
+    Packs decoded tiles into rows of 8 pixels of 4 bits each, the leftmost
+    pixel in the highest bits, as the dot renderer shifts them out. The two
+    bitplanes are kept apart, as the PPU fetches them separately.
+    :param tiles: array shaped (tiles, 2, 8, 8), see decode_tiles
+    :return: array of uint32 shaped (tiles, 2, 2, 8), indexed by tile, flip,
+    plane and row
+    """
+    pixels = tiles.astype(np.uint32)
+    planes = np.stack((pixels & 1, pixels & 2), axis=2)
+    shifts = np.arange(28, -4, -4, dtype=np.uint32)
+    return np.bitwise_or.reduce(planes << shifts, axis=4)
+
+
+class TileCache(object):
+    """
+    Keeps the whole cartridge CHR decoded into tiles, so the PPU reads rows
+    of pixels instead of pairs of bitplanes: arrays of them for the
+    scanline renderers, packed ones for the dot renderer.
+
+    The two pattern tables are views over the decoded tiles, repointed when
+    the mapper switches CHR banks. Writes to CHR RAM only mark their tile,
+    which gets decoded again the next time a table is requested.
+    """
+
+    def __init__(self, mapper) -> None:
+        self.mapper = mapper
+        self.tiles = decode_tiles(mapper.chr)
+        self.rows = pack_rows(self.tiles)
+        self.dirty = set()
+        self.tables = [None, None]
+        self.row_tables = [None, None]
+        mapper.add_bank_listener(self.on_bank_switch)
+        mapper.add_chr_listener(self.on_chr_write)
+        self.on_bank_switch()
+
+    def on_bank_switch(self) -> None:
+        offsets = self.mapper.chr_bank_offsets()
+        self.tables = [self.tiles[offset >> 4:(offset >> 4) + 256] for offset in offsets]
+        self.row_tables = [self.rows[offset >> 4:(offset >> 4) + 256] for offset in offsets]
+
+    def on_chr_write(self, index: int) -> None:
+        self.dirty.add(index >> 4)
+
+    def table(self, index: int) -> np.ndarray:
+        """
+        Returns the tiles of a pattern table.
+        :param index: 0 for $0000, 1 for $1000
+        :return: array of uint8 shaped (256, 2, 8, 8), see decode_tiles
+        """
+        if self.dirty:
+            self.refresh()
+        return self.tables[index]
+
+    def row_table(self, index: int) -> np.ndarray:
+        """
+        Returns the packed rows of a pattern table.
+        :param index: 0 for $0000, 1 for $1000
+        :return: array of uint32 shaped (256, 2, 2, 8), see pack_rows
+        """
+        if self.dirty:
+            self.refresh()
+        return self.row_tables[index]
+
+    def refresh(self) -> None:
+        """
+        Decodes the tiles written since the last refresh.
+        """
+        dirty = np.fromiter(self.dirty, dtype=np.intp, count=len(self.dirty))
+        self.dirty.clear()
+        data = self.mapper.chr.reshape(-1, 16)
+        self.tiles[dirty] = decode_tiles(data[dirty])
+        self.rows[dirty] = pack_rows(self.tiles[dirty])
@@ -0,0 +1,263 @@
+import logging
+import queue
+import threading
+from typing import Callable, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+from .cpu import CPU, InstructionMode
+
+log = logging.getLogger('logger')
+
+M = InstructionMode
+
+# Mnemonics of the documented instructions
+OFFICIAL = {
+    'ADC', 'AND', 'ASL', 'BCC', 'BCS', 'BEQ', 'BIT', 'BMI', 'BNE', 'BPL', 'BRK', 'BVC',
+    'BVS', 'CLC', 'CLD', 'CLI', 'CLV', 'CMP', 'CPX', 'CPY', 'DEC', 'DEX', 'DEY', 'EOR',
+    'INC', 'INX', 'INY', 'JMP', 'JSR', 'LDA', 'LDX', 'LDY', 'LSR', 'NOP', 'ORA', 'PHA',
+    'PHP', 'PLA', 'PLP', 'ROL', 'ROR', 'RTI', 'RTS', 'SBC', 'SEC', 'SED', 'SEI', 'STA',
+    'STX', 'STY', 'TAX', 'TAY', 'TSX', 'TXA', 'TXS', 'TYA',
+}
+
+
+class Tracer(object):
+    """
+    Records every instruction executed by the CPU into a preallocated ring of
+    fixed-width binary records, which a background thread writes to disk.
+
+    Tracing works by wrapping the resolvers of the CPU dispatch table (they're
+    called before the instruction changes anything), so a CPU without a tracer
+    attached runs exactly the same code as before. The block compiler is
+    suspended while tracing, as translated blocks never go through the
+    dispatch table.
+    """
+
+    # One record per instruction, stored before it's executed
+    record_type = np.dtype([
+        ('pc', '<u2'),
+        ('opcode', 'u1'),
+        ('operand', '<u2'),
+        ('a', 'u1'),
+        ('x', 'u1'),
+        ('y', 'u1'),
+        ('p', 'u1'),
+        ('sp', 'u1'),
+        ('cycle', '<u8'),
+        ('scanline', '<i2'),
+        ('dot', '<i2'),
+        ('address', '<u2'),  # effective address
+        ('value', 'u1'),  # byte at the effective address
+    ])
+
+    chunk_size = 0x1000  # records handed to the writer at once
+    chunks = 16  # chunks in the ring
+
+    def __init__(self, cpu: CPU, path: str,
+                 ppu_position: Optional[Callable[[], Tuple[int, int]]] = None) -> None:
+        """
+        :param cpu: the CPU to trace
+        :param path: file receiving the binary records
+        :param ppu_position: returns the (scanline, dot) the PPU is at, as
+        seen by the CPU
+        """
+        self.cpu = cpu
+        self.path = path
+        self.ppu_position = ppu_position or (lambda: (-1, -1))
+        self.ring = np.zeros(self.chunk_size * self.chunks, dtype=self.record_type)
+        self.index = 0
+        self.flushed = 0  # first record not handed to the writer yet
+        self.count = 0  # records written so far
+        self.queue = queue.Queue()  # type: queue.Queue
+        self.writer = None  # type: Optional[threading.Thread]
+        self.resolvers = None  # type: Optional[dict]
+        self.saved_block_compiler = None
+
+    def start(self) -> None:
+        """
+        Starts tracing: wraps the CPU dispatch table and starts the writer.
+        """
+        if self.resolvers is not None:
+            return
+        cpu = self.cpu
+        self.writer = threading.Thread(target=self.write_chunks, name='tracer', daemon=True)
+        self.writer.start()
+        self.resolvers = {}  # wrapper -> resolver wrapped
+        dispatch = []
+        for opcode, entry in enumerate(cpu.dispatch):
+            trace = self.traced(opcode, entry[0])
+            self.resolvers[trace] = entry[0]
+            dispatch.append((trace, ) + entry[1:])
+        cpu.dispatch = dispatch
+        self.saved_block_compiler, cpu.block_compiler = cpu.block_compiler, None
+        cpu.flush_decode_cache()
+        log.info(f'Tracing to {self.path}')
+
+    def stop(self) -> None:
+        """
+        Restores the CPU and waits until every record is on disk.
+        """
+        if self.resolvers is None:
+            return
+        cpu = self.cpu
+        # Only the resolvers are unwrapped, as the handlers may have been
+        # wrapped in the meantime (by the idle loop detection)
+        resolvers = self.resolvers
+        cpu.dispatch = [(resolvers.get(entry[0], entry[0]), ) + entry[1:] for entry in cpu.dispatch]
+        cpu.block_compiler = self.saved_block_compiler
+        cpu.flush_decode_cache()
+        self.resolvers = self.saved_block_compiler = None
+        self.flush()
+        self.queue.put(None)
+        self.writer.join()
+        self.writer = None
+        log.info(f'Traced {self.count} instructions to {self.path}')
+
+    def traced(self, opcode: int, resolve: Callable) -> Callable:
+        """
+        Wraps an addressing mode resolver, recording the CPU state, the
+        effective address and the byte found there. Registers aren't read,
+        as that would change their state, so $FF is recorded for them.
+        """
+        cpu = self.cpu
+        read_pages = cpu.memory.read_pages
+        ring = self.ring
+        position = self.ppu_position
+        chunk_mask = self.chunk_size - 1
+        size = len(ring)
+
+        def trace(pc: int, operand: int) -> Tuple[int, bool]:
+            resolved = resolve(pc, operand)
+            address = resolved[0]
+            page = read_pages[address >> 8]
+            index = self.index
+            scanline, dot = position()
+            ring[index] = (pc, opcode, operand, cpu.a, cpu.x, cpu.y, cpu.flags(),
+                           cpu.sp, cpu.cycles, scanline, dot, address,
+                           0xFF if page is None else page[address & 0xFF])
+            index += 1
+            if not index & chunk_mask:
+                self.flush(index)
+            self.index = index % size
+            return resolved
+        return trace
+
+    def flush(self, end: Optional[int] = None) -> None:
+        """
+        Hands the records stored since the last flush to the writer.
+        :param end: index after the last record (the current one by default)
+        """
+        if end is None:
+            end = self.index
+        if end > self.flushed:
+            self.queue.put(self.ring[self.flushed:end].copy())
+        self.flushed = end % len(self.ring)
+
+    def write_chunks(self) -> None:
+        """
+        Writer thread: appends every chunk received to the trace file.
+        """
+        with open(self.path, 'wb') as trace_file:
+            while True:
+                chunk = self.queue.get()
+                if chunk is None:
+                    break
+                trace_file.write(chunk.tobytes())
+                self.count += len(chunk)
+
+    """
+    FORMATTING
+    """
+    operand_formats = {
+        M.MODE_ABSOLUTE: '${:04X}',
+        M.MODE_ABSOLUTE_X: '${:04X},X',
+        M.MODE_ABSOLUTE_Y: '${:04X},Y',
+        M.MODE_ACCUMULATOR: 'A',
+        M.MODE_IMMEDIATE: '#${:02X}',
+        M.MODE_IMPLIED: '',
+        M.MODE_INDEXED_INDIRECT: '(${:02X},X)',
+        M.MODE_INDIRECT: '(${:04X})',
+        M.MODE_INDIRECT_INDEXED: '(${:02X}),Y',
+        M.MODE_RELATIVE: '${:04X}',
+        M.MODE_ZERO_PAGE: '${:02X}',
+        M.MODE_ZERO_PAGE_X: '${:02X},X',
+        M.MODE_ZERO_PAGE_Y: '${:02X},Y',
+    }
+
+    # Marked with a * in nestest.log: the undocumented instructions, the NOPs
+    # besides $EA and the SBC at $EB
+    illegal_opcodes = frozenset(
+        opcode for opcode, name in enumerate(CPU.instruction_names)
+        if str(name).lstrip('_') not in OFFICIAL or
+        (str(name) == 'NOP' and opcode != 0xEA) or opcode == 0xEB)
+    nestest_names = {'ISC': 'ISB'}
+
+    @classmethod
+    def load(cls, path: str) -> np.ndarray:
+        """
+        Reads a binary trace file.
+        :param path: file written by a tracer
+        :return: structured array of records
+        """
+        return np.fromfile(path, dtype=cls.record_type)
+
+    @classmethod
+    def format_record(cls, record) -> str:
+        """
+        Formats a record the same way as the nestest.log reference trace,
+        memory annotations and illegal opcode marks included.
+        :param record: a single element of a record array
+        :return: str
+        """
+        pc = int(record['pc'])
+        opcode = int(record['opcode'])
+        operand = int(record['operand'])
+        mode = int(CPU.instruction_modes[opcode])
+        size = int(CPU.instruction_sizes[opcode]) or M.sizes[mode]
+        name = str(CPU.instruction_names[opcode]).lstrip('_')
+        name = cls.nestest_names.get(name, name)
+
+        code = [opcode, operand & 0xFF, operand >> 8][:size]
+        if mode == M.MODE_RELATIVE:
+            operand = (pc + 2 + (operand - 0x100 if operand & 0x80 else operand)) & 0xFFFF
+        disassembly = f'{name} {cls.operand_formats[mode].format(operand)}'.rstrip()
+        disassembly += cls.format_memory(record, name, mode, operand)
+        mark = '*' if opcode in cls.illegal_opcodes else ' '
+        return (f'{pc:04X}  {" ".join(f"{b:02X}" for b in code):<8} {mark}{disassembly:<32}'
+                f'A:{int(record["a"]):02X} X:{int(record["x"]):02X} '
+                f'Y:{int(record["y"]):02X} P:{int(record["p"]):02X} '
+                f'SP:{int(record["sp"]):02X} '
+                f'PPU:{int(record["scanline"]):3},{int(record["dot"]):3} '
+                f'CYC:{int(record["cycle"])}')
+
+    @staticmethod
+    def format_memory(record, name: str, mode: int, operand: int) -> str:
+        """
+        Returns the part of a nestest.log line showing the memory accessed:
+        the address the operand resolves to (when indexed or indirect) and
+        the byte found there.
+        """
+        address = int(record['address'])
+        value = f' = {int(record["value"]):02X}'
+        if mode in (M.MODE_ZERO_PAGE, M.MODE_ABSOLUTE):
+            return '' if name in ('JMP', 'JSR') else value
+        if mode in (M.MODE_ZERO_PAGE_X, M.MODE_ZERO_PAGE_Y):
+            return f' @ {address:02X}{value}'
+        if mode in (M.MODE_ABSOLUTE_X, M.MODE_ABSOLUTE_Y):
+            return f' @ {address:04X}{value}'
+        if mode == M.MODE_INDEXED_INDIRECT:
+            return f' @ {(operand + int(record["x"])) & 0xFF:02X} = {address:04X}{value}'
+        if mode == M.MODE_INDIRECT_INDEXED:
+            return f' = {(address - int(record["y"])) & 0xFFFF:04X} @ {address:04X}{value}'
+        if mode == M.MODE_INDIRECT:
+            return f' = {address:04X}'
+        return ''
+
+    @classmethod
+    def format(cls, records: Iterable) -> List[str]:
+        """
+        Formats a sequence of records as nestest.log lines.
+        :param records: record array, usually from load()
+        :return: list of str
+        """
+        return [cls.format_record(record) for record in records]
@@ -1,18 +1,48 @@
-import pyglet
+import ctypes
 import logging
-import numpy as np
+import pyglet
+from pyglet import gl
+
+from .frame_exchange import FrameExchange
+from .framebuffer import FrameBuffer
 
 log = logging.getLogger('logger')
 
 
 class UI:
+    """
+    pyglet window showing the frames of a console.
+
+    A single texture is allocated at startup and updated in place with the
+    last frame received. It's drawn scaled up with nearest-neighbor
+    filtering, so the scaling costs nothing on the CPU side.
+
+    Frames arrive from the emulation thread through a FrameExchange, so
+    neither thread waits for the other and a frame is never drawn while
+    it's being written.
+    """
+
+    scale = 2
+    overscan = 8  # lines hidden at the top and bottom, as on most TVs
 
     def __init__(self, on_draw) -> None:
+        width = FrameBuffer.WIDTH
+        height = FrameBuffer.HEIGHT - 2 * self.overscan
         self.window = pyglet.window.Window(visible=False)
-        self.window.set_size(512, 448)
+        self.window.set_size(width * self.scale, height * self.scale)
         self.window.on_draw = on_draw
+
+        self.frames = FrameExchange((height, width, 3))
+        self.texture = pyglet.image.Texture.create(width, height, internalformat=gl.GL_RGB8,
+                                                   min_filter=gl.GL_NEAREST,
+                                                   mag_filter=gl.GL_NEAREST, fmt=gl.GL_RGB)
+        self.window_frame = pyglet.graphics.Batch()
+        # Rows are uploaded top to bottom, while OpenGL goes bottom to top, so
+        # the sprite is flipped
+        self.sprite = pyglet.sprite.Sprite(self.texture, y=height * self.scale,
+                                           batch=self.window_frame)
+        self.sprite.update(scale_x=self.scale, scale_y=-self.scale)
         self.window.set_visible(True)
-        self.sprites_to_draw = []
 #        @self.window.event
 
 #        def on_key_press(symbol, modifiers):
@@ -21,20 +51,23 @@ class UI:
     def clear(self) -> None:
         self.window.clear()
 
-    def generate_frame(self) -> None:
-        from main import Manager
-        manager = Manager()
-        ppu = manager.ppu
-        memory = manager.memory
-        log.debug("PPU: Generating new frame...")
-        self.sprites_to_draw = []
-        ppu.window_frame = pyglet.graphics.Batch()
-        background_color = list(ppu.palette_data[memory.read(np.uint16(0x3f00))])
-        ppu.background_color = [255, 255, 255]
-        background_palette = [ppu.palette_data[x]
-                              for x in memory._memory[0x3f01:0x3f10]]
-        sprite_palette = [ppu.palette_data[x]
-                          for x in memory._memory[0x3f11:0x3f20]]
-
-        background = pyglet.image.ImageData(512, 448, "RGB", bytes(background_color * 512 * 448))
-        self.sprites_to_draw.append(pyglet.sprite.Sprite(background, batch=ppu.window_frame))
+    def generate_frame(self, frame_buffer: FrameBuffer) -> None:
+        """
+        Publishes the frame just completed, to be shown on the next draw.
+        Called from the emulation thread, so nothing here touches OpenGL.
+        """
+        frame = frame_buffer.frame(FrameBuffer.FORMAT_RGB24)
+        self.frames.publish(frame[self.overscan:len(frame) - self.overscan])
+
+    def draw(self) -> None:
+        """
+        Uploads the newest frame, if there's a new one, and draws it.
+        """
+        pixels = self.frames.take()
+        if pixels is not None:
+            height, width = pixels.shape[:2]
+            gl.glBindTexture(self.texture.target, self.texture.id)
+            gl.glPixelStorei(gl.GL_UNPACK_ALIGNMENT, 1)
+            gl.glTexSubImage2D(self.texture.target, 0, 0, 0, width, height, gl.GL_RGB,
+                               gl.GL_UNSIGNED_BYTE, pixels.ctypes.data_as(ctypes.c_void_p))
+        self.window_frame.draw()
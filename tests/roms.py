@@ -0,0 +1,41 @@
+"""
+Builds small iNES images for the tests: NROM, 32 KB of PRG ROM mapped at
+$8000 and 8 KB of CHR (RAM unless given).
+"""
+from typing import Optional, Sequence
+
+PROGRAM = 0x8000
+NMI_HANDLER = 0x9000
+IRQ_HANDLER = 0x9800
+
+
+def build_rom(program: Sequence[int], nmi: Sequence[int] = (0x40, ), irq: Sequence[int] = (0x40, ),
+              chr_data: Optional[bytes] = None, vertical: bool = True) -> bytes:
+    """
+    :param program: code run from reset, at $8000
+    :param nmi: NMI handler, at $9000 (RTI by default)
+    :param irq: IRQ/BRK handler, at $9800 (RTI by default)
+    :param chr_data: 8 KB of CHR ROM, CHR RAM if None
+    :param vertical: vertical mirroring, horizontal otherwise
+    :return: the contents of the .nes file
+    """
+    prg = bytearray(0x8000)
+    for address, code in ((PROGRAM, program), (NMI_HANDLER, nmi), (IRQ_HANDLER, irq)):
+        prg[address - 0x8000:address - 0x8000 + len(code)] = bytes(code)
+    prg[0x7FFA:0x8000] = bytes((NMI_HANDLER & 0xFF, NMI_HANDLER >> 8, PROGRAM & 0xFF, PROGRAM >> 8,
+                                IRQ_HANDLER & 0xFF, IRQ_HANDLER >> 8))
+    header = bytearray(b'NES\x1a') + bytes((2, 1 if chr_data else 0, 1 if vertical else 0)) + bytes(9)
+    return bytes(header) + bytes(prg) + (chr_data or b'')
+
+
+def run_to(console, address: int, limit: int = 100000) -> None:
+    """
+    Steps the console until the CPU reaches the given address (usually a
+    JMP to itself at the end of the program).
+    """
+    console.reset()
+    while console.cpu.pc != address:
+        console.cpu.step()
+        console.catch_up()
+        limit -= 1
+        assert limit > 0, f'never reached ${address:04X}'
@@ -0,0 +1,42 @@
+from modules.console import Console
+
+from roms import build_rom, run_to
+
+# Reads PPUSTATUS 256 times through a ($10),Y pointer, storing every value
+# read, and counts the passes in $12
+STATUS_THROUGH_POINTER = [
+    0xA9, 0x02, 0x85, 0x10,  # LDA #$02 / STA $10
+    0xA9, 0x20, 0x85, 0x11,  # LDA #$20 / STA $11
+    0xA9, 0x80, 0x8D, 0x00, 0x20,  # LDA #$80 / STA $2000
+    0xA0, 0x00, 0xA2, 0x00,  # LDY #0 / LDX #0
+    0xB1, 0x10,  # $8011: LDA ($10),Y
+    0x9D, 0x00, 0x02,  # STA $0200,X
+    0xE8,  # INX
+    0xD0, 0xF8,  # BNE $8011
+    0xE6, 0x12,  # INC $12
+    0xA5, 0x12, 0xC9, 0x40,  # LDA $12 / CMP #$40
+    0xD0, 0xF0,  # BNE $8011
+    0x4C, 0x21, 0x80,  # $8021: JMP $8021
+]
+HALT = 0x8021
+# NMI handler counting the interrupts in $13
+COUNT_NMI = [0xE6, 0x13, 0x40]  # INC $13 / RTI
+
+
+def run(compile_blocks: bool) -> Console:
+    console = Console(build_rom(STATUS_THROUGH_POINTER, nmi=COUNT_NMI))
+    if compile_blocks:
+        console.cpu.enable_block_compiler()
+    run_to(console, HALT, limit=10 ** 6)
+    return console
+
+
+def test_indirect_register_reads_match_the_interpreter():
+    interpreted = run(False)
+    compiled = run(True)
+    assert compiled.cpu.block_compiler.compiled > 0
+    assert compiled.cpu.cycles == interpreted.cpu.cycles
+    assert compiled.memory.read_block(0x0000, 0x300).tobytes() == \
+        interpreted.memory.read_block(0x0000, 0x300).tobytes()
+    assert (compiled.ppu.scanline, compiled.ppu.cycle) == \
+        (interpreted.ppu.scanline, interpreted.ppu.cycle)
@@ -0,0 +1,72 @@
+
+from modules.console import Console
+
+from roms import build_rom
+
+# Enables the NMI and counts loop iterations, the NMI handler takes a copy
+# of the counter, so any delay in taking the NMI changes the copies
+COUNTING = [
+    0xA9, 0x80, 0x8D, 0x00, 0x20,  # LDA #$80 / STA $2000
+    0xE6, 0x20,  # INC $20
+    0x4C, 0x05, 0x80,  # JMP $8005
+]
+# The same with a loop long enough to be translated into a single block
+COUNTING_BLOCK = [0xA9, 0x80, 0x8D, 0x00, 0x20] + [0xE6, 0x20] * 24 + [0x4C, 0x05, 0x80]
+COPY_COUNTER = [0xA5, 0x20, 0xE6, 0x30, 0xA6, 0x30, 0x95, 0x40, 0x40]  # $40,X = $20
+
+
+def copies(console: Console) -> list:
+    return [int(console.memory.read(0x40 + frame)) for frame in range(1, 4)]
+
+
+def test_nmi_is_taken_at_the_same_instruction_in_every_mode():
+    reference = Console(build_rom(COUNTING, nmi=COPY_COUNTER))
+    reference.reset()
+    while reference.memory.read(0x30) < 4:
+        reference.cpu.step()
+        reference.catch_up()
+
+    for catch_up in (False, True):
+        console = Console(build_rom(COUNTING, nmi=COPY_COUNTER))
+        console.catch_up_mode = catch_up
+        console.reset()
+        while console.memory.read(0x30) < 4:
+            console.step()
+        assert copies(console) == copies(reference)
+
+
+def test_translated_blocks_take_the_nmi_on_time():
+    reference = Console(build_rom(COUNTING_BLOCK, nmi=COPY_COUNTER))
+    reference.reset()
+    while reference.memory.read(0x30) < 4:
+        reference.step()
+
+    for catch_up in (False, True):
+        console = Console(build_rom(COUNTING_BLOCK, nmi=COPY_COUNTER))
+        console.catch_up_mode = catch_up
+        console.cpu.enable_block_compiler()
+        console.reset()
+        while console.memory.read(0x30) < 4:
+            console.step()
+        assert console.cpu.block_compiler.compiled
+        assert copies(console) == copies(reference)
+
+
+def test_consoles_side_by_side_share_no_state(tmp_path):
+    # Writes the counter to SRAM every iteration
+    program = [0xE6, 0x20, 0xA5, 0x20, 0x8D, 0x00, 0x60, 0x4C, 0x00, 0x80]
+    rom = tmp_path / 'sram.nes'
+    rom.write_bytes(build_rom(program))
+    first = Console(str(rom))
+    second = Console(build_rom(program))
+    first.reset()
+    second.reset()
+    for _ in range(10):
+        first.step()
+    assert first.memory.read(0x6000) != 0
+    assert second.memory.read(0x6000) == 0
+    assert first.cartridge.sram is not second.cartridge.sram
+    for _ in range(10):
+        second.step()
+    assert first.cpu.cycles == second.cpu.cycles
+    assert first.memory.read(0x6000) == second.memory.read(0x6000)
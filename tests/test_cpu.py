@@ -0,0 +1,86 @@
+from modules.console import Console
+from modules.cpu import CPU, InstructionMode
+
+from roms import build_rom, run_to
+
+
+def test_dispatch_table_covers_every_opcode():
+    cpu = Console(build_rom([0x4C, 0x00, 0x80])).cpu
+    assert len(cpu.dispatch) == 256
+    for opcode, (resolve, handler, size, cycles, page_cycles, mode) in enumerate(cpu.dispatch):
+        assert callable(resolve) and callable(handler)
+        assert mode == CPU.instruction_modes[opcode]
+        assert size == (CPU.instruction_sizes[opcode] or InstructionMode.sizes[mode])
+        assert cycles == CPU.instruction_cycles[opcode]
+
+
+def test_arithmetic_flags():
+    program = [
+        0xA9, 0x50, 0x18, 0x69, 0x50,  # LDA #$50 / CLC / ADC #$50
+        0x85, 0x12, 0x08, 0x68, 0x85, 0x10,  # STA $12 / PHP / PLA / STA $10
+        0x38, 0xA9, 0x50, 0xE9, 0x30,  # SEC / LDA #$50 / SBC #$30
+        0x85, 0x13, 0x08, 0x68, 0x85, 0x11,  # STA $13 / PHP / PLA / STA $11
+        0x4C, 0x16, 0x80,  # JMP $8016
+    ]
+    console = Console(build_rom(program))
+    run_to(console, 0x8016)
+    read = console.memory.read
+    # Overflow into the sign bit: N and V set, no carry (B and I come from PHP and reset)
+    assert (read(0x12), read(0x10)) == (0xA0, 0xF4)
+    # No borrow: carry set
+    assert (read(0x13), read(0x11)) == (0x20, 0x35)
+
+
+def test_registers_stay_plain_bytes():
+    program = [
+        0xA2, 0xFF, 0xE8,  # LDX #$FF / INX
+        0xA0, 0x00, 0x88,  # LDY #$00 / DEY
+        0xA9, 0xFF, 0x18, 0x69, 0x02,  # LDA #$FF / CLC / ADC #$02
+        0x4C, 0x0B, 0x80,  # JMP $800B
+    ]
+    console = Console(build_rom(program))
+    run_to(console, 0x800B)
+    cpu = console.cpu
+    assert (cpu.x, cpu.y, cpu.a, cpu.c, cpu.z) == (0x00, 0xFF, 0x01, 1, 0)
+    for register in (cpu.a, cpu.x, cpu.y, cpu.sp, cpu.pc, cpu.cycles, cpu.flags()):
+        assert type(register) is int
+    assert not hasattr(cpu, '__dict__')
+
+
+def test_code_in_ram_is_decoded_again_after_being_rewritten():
+    program = [
+        0xA9, 0xA9, 0x8D, 0x00, 0x03,  # LDA #$A9 / STA $0300 (LDA #)
+        0xA9, 0x60, 0x8D, 0x02, 0x03,  # LDA #$60 / STA $0302 (RTS)
+        0xA9, 0x11, 0x8D, 0x01, 0x03,  # LDA #$11 / STA $0301
+        0x20, 0x00, 0x03, 0x85, 0x10,  # JSR $0300 / STA $10
+        0xA9, 0x22, 0x8D, 0x01, 0x03,  # LDA #$22 / STA $0301
+        0x20, 0x00, 0x03, 0x85, 0x11,  # JSR $0300 / STA $11
+        0x4C, 0x1E, 0x80,  # JMP $801E
+    ]
+    console = Console(build_rom(program))
+    run_to(console, 0x801E)
+    assert (console.memory.read(0x10), console.memory.read(0x11)) == (0x11, 0x22)
+
+
+def test_decoded_code_follows_prg_bank_switches():
+    prg = bytearray(0x4000 * 4)
+    # Banks 0 and 1 add to different counters, then go back to the fixed bank
+    prg[0x0000:0x000A] = bytes([0xA5, 0x10, 0x18, 0x69, 0x11, 0x85, 0x10, 0x4C, 0x00, 0xC0])
+    prg[0x4000:0x400A] = bytes([0xA5, 0x11, 0x18, 0x69, 0x22, 0x85, 0x11, 0x4C, 0x10, 0xC0])
+    fixed = 0xC000
+    prg[fixed:fixed + 8] = bytes([
+        0xA9, 0x01, 0x8D, 0x00, 0x80,  # $C000: LDA #$01 / STA $8000 (bank 1)
+        0x4C, 0x00, 0x80,  # JMP $8000
+    ])
+    prg[fixed + 0x10:fixed + 0x21] = bytes([
+        0xA9, 0x00, 0x8D, 0x00, 0x80,  # $C010: LDA #$00 / STA $8000 (bank 0)
+        0xA5, 0x12, 0xD0, 0x05,  # LDA $12 / BNE $C01E
+        0xE6, 0x12, 0x4C, 0x00, 0x80,  # INC $12 / JMP $8000
+        0x4C, 0x1E, 0xC0,  # $C01E: JMP $C01E
+    ])
+    prg[-4:-2] = bytes([0x00, 0x80])  # reset vector
+    header = b'NES\x1a' + bytes([4, 0, 0x21]) + bytes(9)  # UxROM, CHR RAM
+    console = Console(header + bytes(prg))
+    run_to(console, 0xC01E)
+    # Bank 0 ran twice and bank 1 twice, each from its own decoded code
+    assert (console.memory.read(0x10), console.memory.read(0x11)) == (0x22, 0x44)
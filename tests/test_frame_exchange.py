@@ -0,0 +1,98 @@
+import threading
+from collections import deque
+
+import numpy as np
+
+from modules.frame_exchange import FrameExchange
+
+
+def frame(number: int) -> np.ndarray:
+    return np.full((4, 4), number, dtype=np.uint8)
+
+
+class Interleaved(deque):
+    """
+    Slot running a function right before the next pop, as if the other
+    thread got in between.
+    """
+
+    def __init__(self, entries, between) -> None:
+        super().__init__(entries)
+        self.between = between
+
+    def popleft(self):
+        between, self.between = self.between, None
+        if between is not None:
+            between()
+        return super().popleft()
+
+
+def test_take_returns_the_newest_frame_once():
+    exchange = FrameExchange((4, 4))
+    assert exchange.take() is None
+    exchange.publish(frame(1))
+    exchange.publish(frame(2))
+    assert (exchange.take() == 2).all()
+    assert exchange.take() is None
+    exchange.publish(frame(3))
+    assert (exchange.take() == 3).all()
+    assert (exchange.published, exchange.dropped, exchange.duplicated) == (3, 1, 2)
+
+
+def test_frame_published_while_taking_is_not_lost():
+    exchange = FrameExchange((4, 4))
+    taken = []
+    exchange.slot = Interleaved(exchange.slot, lambda: taken.append(exchange.take()))
+    exchange.publish(frame(1))
+    assert taken == [None]
+    assert (exchange.take() == 1).all()
+
+
+def test_frame_taken_while_publishing_is_the_newest():
+    exchange = FrameExchange((4, 4))
+    exchange.slot = Interleaved(exchange.slot, lambda: exchange.publish(frame(1)))
+    assert (exchange.take() == 1).all()
+
+
+def test_buffers_coming_back_around_during_a_take_are_not_lost():
+    exchange = FrameExchange((4, 4))
+
+    def publish_several() -> None:
+        # Enough for the consumer's buffer to be published back in the slot
+        for number in range(1, 5):
+            exchange.publish(frame(number))
+
+    exchange.slot = Interleaved(exchange.slot, publish_several)
+    taken = [exchange.take(), exchange.take()]
+    numbers = [int(pixels[0, 0]) for pixels in taken if pixels is not None]
+    assert numbers[-1] == 4
+    assert len(numbers) + exchange.dropped == 4
+
+
+def test_frames_taken_are_never_written_concurrently():
+    exchange = FrameExchange((64, 64))
+    published = 2000
+    torn = []
+    seen = []
+
+    def produce() -> None:
+        for number in range(1, published + 1):
+            exchange.publish(frame(number % 256).repeat(16, 0).repeat(16, 1))
+
+    producer = threading.Thread(target=produce)
+    producer.start()
+    while producer.is_alive():
+        pixels = exchange.take()
+        if pixels is not None:
+            first = int(pixels[0, 0])
+            # Every pixel of a frame holds its number, a mix means a torn read
+            if not (pixels == first).all():
+                torn.append(first)
+            seen.append(first)
+    producer.join()
+    last = exchange.take()
+    if last is not None:
+        seen.append(int(last[0, 0]))
+    assert not torn
+    assert seen[-1] == published % 256
+    assert published == len(seen) + exchange.dropped
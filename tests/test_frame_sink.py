@@ -0,0 +1,74 @@
+import argparse
+import struct
+import zlib
+
+import numpy as np
+
+from main import Manager
+from modules.frame_sink import RingSink
+
+from roms import build_rom
+
+# Sets the backdrop to $21 and shows the background
+BACKDROP = [
+    0xA9, 0x3F, 0x8D, 0x06, 0x20,  # LDA #$3F / STA $2006
+    0xA9, 0x00, 0x8D, 0x06, 0x20,  # LDA #$00 / STA $2006
+    0xA9, 0x21, 0x8D, 0x07, 0x20,  # LDA #$21 / STA $2007
+    0xA9, 0x0A, 0x8D, 0x01, 0x20,  # LDA #$0A / STA $2001
+    0x4C, 0x14, 0x80,  # JMP $8014
+]
+
+
+def headless(tmp_path, **options) -> Manager:
+    rom = tmp_path / 'backdrop.nes'
+    rom.write_bytes(build_rom(BACKDROP))
+    args = dict(romfile=str(rom), compile_blocks=False, idle_skip=False, renderer='dot',
+                frameskip=0, sync='lockstep', palette=None, trace=None, headless=True,
+                throttle=None, frames=None, raw=None, png=None, png_every=1)
+    args.update(options)
+    return Manager(argparse.Namespace(**args))
+
+
+def read_png(path) -> np.ndarray:
+    data = path.read_bytes()
+    assert data[:8] == b'\x89PNG\r\n\x1a\n'
+    chunks = {}
+    offset = 8
+    while offset < len(data):
+        length, = struct.unpack('>I', data[offset:offset + 4])
+        kind = data[offset + 4:offset + 8]
+        body = data[offset + 8:offset + 8 + length]
+        crc, = struct.unpack('>I', data[offset + 8 + length:offset + 12 + length])
+        assert crc == zlib.crc32(kind + body) & 0xFFFFFFFF
+        chunks[kind] = body
+        offset += 12 + length
+    width, height = struct.unpack('>II', chunks[b'IHDR'][:8])
+    rows = np.frombuffer(zlib.decompress(chunks[b'IDAT']), dtype=np.uint8).reshape(height, -1)
+    assert not rows[:, 0].any()  # no filters
+    return rows[:, 1:].reshape(height, width, 3)
+
+
+def test_headless_run_feeds_the_raw_and_png_sinks(tmp_path):
+    manager = headless(tmp_path, frames=4, raw=str(tmp_path / 'frames.raw'),
+                       png=str(tmp_path / 'png'), png_every=2)
+    assert not manager.throttle
+    manager.run()
+
+    raw = np.fromfile(tmp_path / 'frames.raw', dtype=np.uint8).reshape(-1, 240, 256, 3)
+    assert len(raw) == 4
+    assert (raw[-1] == (0x3F, 0xBF, 0xFF)).all()
+    saved = sorted(path.name for path in (tmp_path / 'png').iterdir())
+    assert saved == ['frame000002.png', 'frame000004.png']
+    assert (read_png(tmp_path / 'png' / 'frame000004.png') == raw[3]).all()
+
+
+def test_ring_sink_keeps_the_last_frames(tmp_path):
+    manager = headless(tmp_path, frames=5)
+    ring = RingSink(3)
+    manager.console.ppu.add_frame_listener(ring.on_frame)
+    manager.run()
+
+    assert ring.numbers == [4, 5, 3]
+    frames = ring.frames()
+    assert len(frames) == 3
+    assert all((frame == frames[-1]).all() for frame in frames)
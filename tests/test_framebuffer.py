@@ -0,0 +1,32 @@
+from modules.framebuffer import FrameBuffer
+from modules.palette import DEFAULT_PALETTE, emphasis_table
+
+
+def test_frames_are_shown_after_the_swap():
+    frame_buffer = FrameBuffer(DEFAULT_PALETTE)
+    frame_buffer.back[:] = 0x21
+    assert (frame_buffer.frame(FrameBuffer.FORMAT_RAW) == 0).all()
+    frame_buffer.swap()
+    assert frame_buffer.frames == 1
+    assert (frame_buffer.frame(FrameBuffer.FORMAT_RAW) == 0x21).all()
+    assert (frame_buffer.frame(FrameBuffer.FORMAT_RGB24) == DEFAULT_PALETTE[0x21]).all()
+
+
+def test_formats_and_overscan():
+    frame_buffer = FrameBuffer(DEFAULT_PALETTE, overscan=(8, 8, 0, 16))
+    frame_buffer.back[:] = 0x16
+    frame_buffer.back_emphasis[100:] = 64  # red emphasis from line 100
+    frame_buffer.swap()
+
+    rgb = frame_buffer.frame(FrameBuffer.FORMAT_RGB24)
+    assert rgb.shape == (224, 240, 3)
+    assert tuple(rgb[0, 0]) == DEFAULT_PALETTE[0x16]
+    assert tuple(rgb[100 - 8, 0]) == tuple(emphasis_table(DEFAULT_PALETTE)[64 + 0x16])
+
+    rgba = frame_buffer.frame(FrameBuffer.FORMAT_RGBA32)
+    assert (rgba[..., :3] == rgb).all() and (rgba[..., 3] == 0xFF).all()
+
+    red, green, blue = (int(channel) for channel in rgb[0, 0])
+    rgb565 = frame_buffer.frame(FrameBuffer.FORMAT_RGB565)
+    assert rgb565.shape == (224, 240)
+    assert int(rgb565[0, 0]) == (red >> 3) << 11 | (green >> 2) << 5 | blue >> 3
@@ -0,0 +1,34 @@
+import pytest
+
+from modules.console import Console
+
+from roms import build_rom
+
+# Enables the NMI and polls $2002 forever, the NMI handler counts frames
+POLLING = [
+    0xA9, 0x80, 0x8D, 0x00, 0x20,  # LDA #$80 / STA $2000
+    0xAD, 0x02, 0x20,  # LDA $2002
+    0x4C, 0x05, 0x80,  # JMP $8005
+]
+COUNT_FRAMES = [0xE6, 0x10, 0x40]  # INC $10 / RTI
+
+
+def run_frames(idle: bool, catch_up: bool, frames: int = 6) -> list:
+    console = Console(build_rom(POLLING, nmi=COUNT_FRAMES))
+    console.catch_up_mode = catch_up
+    console.reset()
+    if idle:
+        console.enable_idle_detection()
+    positions = []
+    for _ in range(frames):
+        console.run_frame()
+        positions.append((console.cpu.cycles, console.ppu.frame, console.ppu.scanline,
+                          console.ppu.cycle, int(console.memory.read(0x10))))
+    if idle:
+        assert console.cpu.idle_cycles_skipped > 0
+    return positions
+
+
+@pytest.mark.parametrize('catch_up', [False, True], ids=['lockstep', 'catch-up'])
+def test_run_frame_stops_at_the_same_cycle_when_skipping_idle_loops(catch_up):
+    assert run_frames(True, catch_up) == run_frames(False, catch_up)
@@ -0,0 +1,54 @@
+import numpy as np
+
+from modules.console import Console
+
+from roms import build_rom
+
+
+def test_read_block_matches_byte_reads():
+    program = list(range(256)) * 4
+    console = Console(build_rom(program))
+    memory = console.memory
+    for address in range(0x0000, 0x0800):
+        memory.write(address, address * 7 & 0xFF)
+    for start, length in ((0x0100, 256), (0x07F0, 0x20), (0x1FF8, 16), (0x80F0, 0x20),
+                          (0xBFF0, 0x20), (0x6000, 256)):
+        expected = [memory.read((start + i) & 0xFFFF) for i in range(length)]
+        assert list(memory.read_block(start, length)) == expected
+
+
+def test_oam_dma_copies_a_page_from_the_oam_address():
+    program = [
+        0xA9, 0x10, 0x8D, 0x03, 0x20,  # LDA #$10 / STA $2003
+        0xA9, 0x03, 0x8D, 0x14, 0x40,  # LDA #$03 / STA $4014
+        0x4C, 0x0A, 0x80,  # JMP $800A
+    ]
+    console = Console(build_rom(program))
+    page = np.arange(256, dtype=np.uint8)[::-1]
+    console.memory.read_block(0x0300, 256)[:] = page
+    console.reset()
+    while console.cpu.pc != 0x800A:
+        console.step()
+    oam = console.ppu.oam_data
+    assert list(oam[0x10:]) == list(page[:0xF0])
+    assert list(oam[:0x10]) == list(page[0xF0:])
+    assert console.ppu.oam_address == 0x10
+    assert console.cpu.stall in (513, 514)  # taken before the next instruction
+
+
+def test_bus_mirrors_and_registers():
+    program = [0x4C, 0x00, 0x80]
+    console = Console(build_rom(program))
+    memory = console.memory
+    memory.write(0x1842, 0x55)  # mirror of $0042
+    assert memory.read(0x0042) == memory.read(0x0842) == 0x55
+    memory.write(0x7FFF, 0x66)
+    assert memory.read(0x7FFF) == 0x66
+    assert memory.read(0x8000) == 0x4C
+    assert memory.read16(0xFFFC) == 0x8000
+    # PPU registers repeat every 8 bytes
+    memory.write(0x3FF9, 0x18)  # $2001
+    assert console.ppu.flag_show_background and console.ppu.flag_show_sprites
+    # PRG ROM stays read-only
+    memory.write(0x8000, 0x00)
+    assert memory.read(0x8000) == 0x4C
@@ -0,0 +1,84 @@
+import numpy as np
+import pytest
+
+from modules.console import Console
+from modules.palette import DEFAULT_PALETTE, EMPHASIS_FACTOR, emphasis_table, load_palette
+
+from roms import build_rom
+
+
+def backdrop(mask: int) -> list:
+    """
+    Sets the backdrop to $21 and writes the given value to PPUMASK.
+    """
+    return [
+        0xA9, 0x3F, 0x8D, 0x06, 0x20,  # LDA #$3F / STA $2006
+        0xA9, 0x00, 0x8D, 0x06, 0x20,  # LDA #$00 / STA $2006
+        0xA9, 0x21, 0x8D, 0x07, 0x20,  # LDA #$21 / STA $2007
+        0xA9, mask, 0x8D, 0x01, 0x20,  # LDA #mask / STA $2001
+        0x4C, 0x14, 0x80,  # JMP $8014
+    ]
+
+
+def test_emphasis_table_darkens_the_other_channels():
+    table = emphasis_table(DEFAULT_PALETTE).reshape(8, 64, 3)
+    assert (table[0] == np.array(DEFAULT_PALETTE)).all()
+    red, green, blue = DEFAULT_PALETTE[0x21]
+    assert tuple(table[1, 0x21]) == (red, round(green * EMPHASIS_FACTOR), round(blue * EMPHASIS_FACTOR))
+    assert tuple(table[7, 0x21]) == tuple(round(c * EMPHASIS_FACTOR ** 2) for c in (red, green, blue))
+
+
+def test_load_palette_accepts_base_and_full_tables(tmp_path):
+    base = tmp_path / 'base.pal'
+    base.write_bytes(np.array(DEFAULT_PALETTE, dtype=np.uint8).tobytes())
+    full = tmp_path / 'full.pal'
+    full.write_bytes(emphasis_table(DEFAULT_PALETTE)[::-1].tobytes())
+    assert (load_palette(str(base)) == emphasis_table(DEFAULT_PALETTE)).all()
+    assert (load_palette(str(full)) == emphasis_table(DEFAULT_PALETTE)[::-1]).all()
+    broken = tmp_path / 'broken.pal'
+    broken.write_bytes(bytes(10))
+    with pytest.raises(ValueError):
+        load_palette(str(broken))
+
+
+@pytest.mark.parametrize('renderer', [None, 'scanline'])
+@pytest.mark.parametrize('mask, color', [
+    (0x0A, DEFAULT_PALETTE[0x21]),
+    (0x0B, DEFAULT_PALETTE[0x20]),  # grayscale
+    (0x2A, tuple(emphasis_table(DEFAULT_PALETTE)[64 + 0x21])),  # red emphasis
+])
+def test_mask_applies_grayscale_and_emphasis(renderer, mask, color):
+    console = Console(build_rom(backdrop(mask)))
+    if renderer is not None:
+        console.ppu.enable_scanline_renderer()
+    console.reset()
+    for _ in range(3):
+        console.run_frame()
+    frame = console.ppu.frame_buffer.frame()
+    assert (frame == color).all()
+
+
+@pytest.mark.parametrize('renderer', [None, 'scanline'])
+@pytest.mark.parametrize('address, color', [
+    (0x20, 0x16),  # v outside the palette: the first entry
+    (0x3F, 0x2A),  # v at $3F01: that entry
+])
+def test_backdrop_is_shown_while_rendering_is_disabled(renderer, address, color):
+    program = [
+        0xA9, 0x3F, 0x8D, 0x06, 0x20,  # LDA #$3F / STA $2006
+        0xA9, 0x00, 0x8D, 0x06, 0x20,  # LDA #$00 / STA $2006
+        0xA9, 0x33, 0x8D, 0x07, 0x20,  # LDA #$33 / STA $2007
+        0xA9, 0x2A, 0x8D, 0x07, 0x20,  # LDA #$2A / STA $2007
+        0xA9, address, 0x8D, 0x06, 0x20,  # LDA #address / STA $2006
+        0xA9, 0x01, 0x8D, 0x06, 0x20,  # LDA #$01 / STA $2006
+        0x4C, 0x1E, 0x80,  # JMP $801E
+    ]
+    console = Console(build_rom(program))
+    if renderer is not None:
+        console.ppu.enable_scanline_renderer()
+    console.reset()
+    console.run_frame()
+    console.ppu.ppu_memory.write(0x3F00, 0x16)
+    for _ in range(2):
+        console.run_frame()
+        assert (console.ppu.frame_buffer.front == color).all()
@@ -0,0 +1,26 @@
+from modules.console import Console
+
+from roms import build_rom, run_to
+
+
+def test_oam_data_writes_wrap_the_address():
+    program = [
+        0xA9, 0xFE, 0x8D, 0x03, 0x20,  # LDA #$FE / STA $2003
+        0xA9, 0x11, 0x8D, 0x04, 0x20,  # LDA #$11 / STA $2004
+        0x8D, 0x04, 0x20,  # STA $2004
+        0x8D, 0x04, 0x20,  # STA $2004 (wraps to $00)
+        0x4C, 0x10, 0x80,  # JMP $8010
+    ]
+    console = Console(build_rom(program))
+    run_to(console, 0x8010)
+    assert list(console.ppu.oam_data[[0xFE, 0xFF, 0x00]]) == [0x11, 0x11, 0x11]
+    assert console.ppu.oam_address == 1
+
+
+def test_rendering_can_be_enabled_in_the_middle_of_a_tile():
+    console = Console(build_rom([0x4C, 0x00, 0x80]))
+    ppu = console.ppu
+    ppu.scanline, ppu.cycle = 10, 2  # past the nametable fetch of the tile
+    ppu.write_register(0x2001, 0x1E)
+    ppu.run(341 * 2)
+    assert (ppu.scanline, ppu.cycle) == (12, 2)
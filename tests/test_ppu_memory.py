@@ -0,0 +1,32 @@
+import pytest
+
+from modules.console import Console
+
+from roms import build_rom
+
+
+@pytest.mark.parametrize('vertical, mirrors', [
+    (True, {0x2000: 0x2800, 0x2400: 0x2C00}),
+    (False, {0x2000: 0x2400, 0x2800: 0x2C00}),
+], ids=['vertical', 'horizontal'])
+def test_nametable_mirroring(vertical, mirrors):
+    memory = Console(build_rom([0x4C, 0x00, 0x80], vertical=vertical)).ppu_memory
+    for value, (table, mirror) in enumerate(mirrors.items(), 1):
+        memory.write(table + 0x123, value)
+        assert memory.read(mirror + 0x123) == value
+        # $3000-$3EFF mirror $2000-$2EFF
+        assert memory.read(mirror + 0x1123) == value
+    first, second = mirrors
+    assert memory.read(first + 0x123) != memory.read(second + 0x123)
+
+
+def test_palette_mirrors():
+    memory = Console(build_rom([0x4C, 0x00, 0x80])).ppu_memory
+    memory.write(0x3F10, 0x21)
+    memory.write(0x3F05, 0x16)
+    assert memory.read(0x3F00) == 0x21
+    assert memory.read(0x3F30) == 0x21
+    assert memory.read(0x3F25) == 0x16
+    assert memory.read(0x3F15) == 0
+    # Addresses wrap at $4000
+    assert memory.read(0x7F00) == 0x21
@@ -0,0 +1,37 @@
+import random
+
+import pytest
+
+from modules.console import Console
+from modules.cpu import Interrupt
+
+from roms import build_rom
+
+
+def ppu_state(console: Console) -> tuple:
+    ppu = console.ppu
+    return (int(ppu.frame), int(ppu.scanline), int(ppu.cycle), bool(ppu.nmi_occurred),
+            int(ppu.nmi_delay), int(ppu.v), int(ppu.flag_sprite_zero_hit), console.cpu.interrupt)
+
+
+@pytest.mark.parametrize('mask', [0x00, 0x1E], ids=['disabled', 'rendering'])
+def test_run_matches_stepping_every_cycle(mask):
+    consoles = [Console(build_rom([0x4C, 0x00, 0x80])) for _ in range(2)]
+    for console in consoles:
+        console.ppu.write_register(0x2000, 0x80)  # NMI enabled
+        console.ppu.write_register(0x2001, mask)
+    stepped, run = consoles
+    chunks = random.Random(1)
+    nmis = 0
+    for _ in range(400):
+        cycles = chunks.randrange(1, 2000)
+        for _ in range(cycles):
+            stepped.ppu.step()
+        run.ppu.run(cycles)
+        assert ppu_state(run) == ppu_state(stepped)
+        if stepped.cpu.interrupt == Interrupt.NMI:
+            # Taken by the CPU
+            stepped.cpu.interrupt = run.cpu.interrupt = Interrupt.NONE
+            nmis += 1
+    assert nmis == run.ppu.frame
+    assert (run.ppu.frame_buffer.front == stepped.ppu.frame_buffer.front).all()
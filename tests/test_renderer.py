@@ -0,0 +1,142 @@
+import numpy as np
+import pytest
+
+from modules.console import Console
+
+from roms import build_rom
+
+LINES = 48  # visible lines compared, enough for several tile rows
+
+
+def build_console(renderer: str, seed: int = 1, chr_ram: bool = False) -> Console:
+    """
+    A console whose PPU has random CHR, nametables, palette and sprites,
+    with both layers shown and the scroll set, stopped at the start of the
+    pre-render line.
+    """
+    rng = np.random.default_rng(seed)
+    chr_data = rng.integers(0, 256, 0x2000, dtype=np.uint8).tobytes()
+    console = Console(build_rom([0x4C, 0x00, 0x80], chr_data=None if chr_ram else chr_data))
+    ppu = console.ppu
+    if chr_ram:
+        for address, value in enumerate(chr_data):
+            console.ppu_memory.write(address, value)
+    for address in range(0x2000, 0x3000):
+        console.ppu_memory.write(address, int(rng.integers(0, 256)))
+    for address in range(0x3F00, 0x3F20):
+        console.ppu_memory.write(address, int(rng.integers(0, 64)))
+    ppu.oam_data[:] = rng.integers(0, 256, 256)
+    ppu.oam_data[0:4] = (20, 0x41, 0x00, 37)  # sprite 0 near the top left
+    ppu.write_control(0x10)
+    ppu.write_mask(0x1E)
+    ppu.write_scroll(37)
+    ppu.write_scroll(19)
+    if renderer != 'dot':
+        ppu.enable_scanline_renderer(background_cache=renderer == 'layer')
+    ppu.scanline, ppu.cycle = 261, 0
+    return console
+
+
+def run_lines(console: Console, lines: int) -> list:
+    """
+    Steps the PPU until the given visible line, returning v after every dot.
+    """
+    ppu = console.ppu
+    trace = []
+    while not (ppu.scanline == lines and ppu.cycle == 0):
+        ppu.step()
+        trace.append(int(ppu.v))
+    return trace
+
+
+@pytest.mark.parametrize('renderer', ['scanline', 'layer'])
+def test_renderer_matches_dot_path(renderer):
+    dot = build_console('dot')
+    other = build_console(renderer)
+    assert run_lines(other, LINES) == run_lines(dot, LINES)
+    assert np.array_equal(other.ppu.pixels[:LINES], dot.ppu.pixels[:LINES])
+    assert other.ppu.flag_sprite_zero_hit == dot.ppu.flag_sprite_zero_hit
+
+
+def first_sprite_zero_hit(console: Console) -> tuple:
+    ppu = console.ppu
+    while not ppu.flag_sprite_zero_hit:
+        ppu.step()
+        assert not 240 <= ppu.scanline < 261, 'no sprite 0 hit'
+    return ppu.scanline, ppu.cycle, int(ppu.v)
+
+
+@pytest.mark.parametrize('renderer', ['scanline', 'layer'])
+def test_sprite_zero_hit_is_raised_at_the_dot_hitting(renderer):
+    assert first_sprite_zero_hit(build_console(renderer)) == first_sprite_zero_hit(build_console('dot'))
+
+
+@pytest.mark.parametrize('renderer', ['dot', 'scanline', 'layer'])
+def test_skipped_frames_keep_scroll_and_sprite_zero_timing(renderer):
+    drawn = build_console('dot')
+    skipped = build_console(renderer)
+    # The frame starting after the pre-render line is skipped
+    skipped.ppu.frameskip = 1
+    skipped.ppu.frame = 0
+    assert first_sprite_zero_hit(skipped) == first_sprite_zero_hit(drawn)
+    assert skipped.ppu.skip_frame
+    assert run_lines(skipped, LINES) == run_lines(drawn, LINES)
+
+
+def write_vram(console: Console, address: int, value: int) -> None:
+    ppu = console.ppu
+    ppu.write_register(0x2006, address >> 8)
+    ppu.write_register(0x2006, address & 0xFF)
+    ppu.write_register(0x2007, value)
+
+
+def test_layer_follows_vram_and_pattern_table_changes():
+    dot = build_console('dot')
+    layer = build_console('layer')
+    for console in (dot, layer):
+        # A whole frame first, so the layer is drawn
+        run_lines(console, LINES)
+        run_lines(console, 261)
+        write_vram(console, 0x208A, 0x33)
+        write_vram(console, 0x2BC0, 0xFF)  # attribute, through the $2800 mirror
+        write_vram(console, 0x2CA3, 0x44)  # the $2400 nametable, through its mirror
+        console.ppu.write_scroll(37)
+        console.ppu.write_scroll(19)
+        run_lines(console, LINES)
+    assert np.array_equal(layer.ppu.pixels[:LINES], dot.ppu.pixels[:LINES])
+
+    for console in (dot, layer):
+        run_lines(console, 261)
+        console.ppu.write_control(0x00)  # background patterns from $0000
+        run_lines(console, LINES)
+    assert np.array_equal(layer.ppu.pixels[:LINES], dot.ppu.pixels[:LINES])
+
+
+def test_chr_writes_only_redraw_the_tiles_using_the_pattern():
+    dot = build_console('dot', chr_ram=True)
+    layer = build_console('layer', chr_ram=True)
+    cache = layer.ppu.background_cache
+    for console in (dot, layer):
+        run_lines(console, LINES)
+        run_lines(console, 261)
+    # The layer marks the tiles showing the pattern under the top left one
+    pattern = layer.ppu_memory.read(0x2000)
+    nametables = [0x2000 + (y // 30) * 0x800 + (x // 32) * 0x400 + (y % 30) * 32 + x % 32
+                  for y in range(60) for x in range(64)]
+    names = np.array([layer.ppu_memory.read(address) for address in nametables]).reshape(60, 64)
+    drawn = cache.layer.copy()
+    cache.layer[:] = 0xEE  # so redrawn tiles can be told apart
+    for console in (dot, layer):
+        write_vram(console, 0x1000 + pattern * 16 + 3, 0x5A)
+        write_vram(console, 0x0000 + pattern * 16 + 3, 0x5A)  # not the background table
+        console.ppu.write_scroll(37)
+        console.ppu.write_scroll(19)
+    cache.refresh(1)
+    redrawn = (cache.layer.reshape(60, 8, 64, 8) != 0xEE).any(axis=(1, 3))
+    assert redrawn[0, 0]
+    assert np.array_equal(redrawn, names == pattern)
+
+    np.copyto(cache.layer, drawn, where=cache.layer == 0xEE)
+    for console in (dot, layer):
+        run_lines(console, LINES)
+    assert np.array_equal(layer.ppu.pixels[:LINES], dot.ppu.pixels[:LINES])
@@ -0,0 +1,80 @@
+from modules.console import Console
+from modules.scheduler import Scheduler
+
+from roms import build_rom
+
+
+class Counter(object):
+    def __init__(self) -> None:
+        self.cycles = 0
+
+    def run(self, cycles: int) -> None:
+        self.cycles += cycles
+
+
+def test_events_fire_in_order_with_components_caught_up():
+    scheduler = Scheduler()
+    counter = Counter()
+    scheduler.add_component(counter, 3)
+    fired = []
+    scheduler.schedule(20, 'b', lambda cycle: fired.append(('b', cycle, counter.cycles)))
+    scheduler.schedule(10, 'a', lambda cycle: fired.append(('a', cycle, counter.cycles)))
+    scheduler.schedule(15, 'c', lambda cycle: fired.append(('c', cycle, counter.cycles)))
+    scheduler.cancel('c')
+    scheduler.schedule(30, 'b', lambda cycle: fired.append(('b', cycle, counter.cycles)))
+
+    assert scheduler.next_event() == 10
+    scheduler.advance(25)
+    assert fired == [('a', 10, 30)]
+    assert counter.cycles == 75
+    scheduler.advance(40)
+    assert fired == [('a', 10, 30), ('b', 30, 90)]
+    assert counter.cycles == 120
+
+
+def test_next_event_is_an_int_without_events():
+    scheduler = Scheduler()
+    assert scheduler.next_event() == Scheduler.max_stretch
+    scheduler.schedule(Scheduler.max_stretch * 2, 'far')
+    assert scheduler.next_event() == Scheduler.max_stretch
+    scheduler.advance(100)
+    assert scheduler.next_event() == 100 + Scheduler.max_stretch
+
+
+def test_components_without_per_cycle_work_are_not_run():
+    class Idle(Counter):
+        needs_step = False
+
+    scheduler = Scheduler()
+    idle = Idle()
+    scheduler.add_component(idle)
+    scheduler.advance(100)
+    assert idle.cycles == 0
+
+
+def test_catch_up_mode_runs_without_pending_events():
+    console = Console(build_rom([0x4C, 0x00, 0x80]))  # JMP $8000
+    console.catch_up_mode = True
+    console.reset()
+    console.scheduler.cancel('nmi')
+    console.scheduler.cancel('frame end')
+    assert console.step() > 0
+
+
+def test_catch_up_mode_fills_oam_when_the_dma_stall_ends():
+    program = [
+        0xA9, 0x55, 0x8D, 0x10, 0x02,  # LDA #$55 / STA $0210
+        0xA9, 0x02, 0x8D, 0x14, 0x40,  # LDA #$02 / STA $4014
+        0x4C, 0x0A, 0x80,  # JMP $800A
+    ]
+    console = Console(build_rom(program))
+    console.catch_up_mode = True
+    console.reset()
+    while console.cpu.stall == 0:
+        console.step()
+    end = console.scheduler.pending['dma'][0]
+    assert end == console.cpu.cycles + console.cpu.stall
+    assert console.ppu.oam_data[0x10] == 0
+    console.step()
+    assert console.cpu.cycles == end
+    assert console.ppu.oam_data[0x10] == 0x55
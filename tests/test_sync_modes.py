@@ -0,0 +1,46 @@
+import random
+
+from modules.console import Console
+
+from roms import build_rom
+
+# Fills the first nametable and the palette, then scrolls by one pixel
+# every frame from the NMI handler
+SCROLLING = [
+    0xA9, 0x20, 0x8D, 0x06, 0x20,  # LDA #$20 / STA $2006
+    0xA9, 0x00, 0x8D, 0x06, 0x20,  # LDA #$00 / STA $2006
+    0xA2, 0x00, 0xA0, 0x04,  # LDX #$00 / LDY #$04
+    0x8E, 0x07, 0x20,  # $800E: STX $2007
+    0xE8, 0xD0, 0xFA,  # INX / BNE $800E
+    0x88, 0xD0, 0xF7,  # DEY / BNE $800E
+    0xA9, 0x3F, 0x8D, 0x06, 0x20,  # LDA #$3F / STA $2006
+    0xA9, 0x00, 0x8D, 0x06, 0x20,  # LDA #$00 / STA $2006
+    0xA2, 0x00,  # LDX #$00
+    0x8E, 0x07, 0x20,  # $8023: STX $2007
+    0xE8, 0xE0, 0x20, 0xD0, 0xF8,  # INX / CPX #$20 / BNE $8023
+    0xA9, 0x80, 0x8D, 0x00, 0x20,  # LDA #$80 / STA $2000
+    0xA9, 0x1E, 0x8D, 0x01, 0x20,  # LDA #$1E / STA $2001
+    0x4C, 0x35, 0x80,  # JMP $8035
+]
+SCROLL = [0xE6, 0x10, 0xA5, 0x10, 0x8D, 0x05, 0x20, 0x8D, 0x05, 0x20, 0x40]
+
+
+def frames(catch_up: bool, count: int = 5) -> list:
+    chr_data = bytes(random.Random(2).randrange(256) for _ in range(0x2000))
+    console = Console(build_rom(SCROLLING, nmi=SCROLL, chr_data=chr_data))
+    console.catch_up_mode = catch_up
+    drawn = []
+    console.ppu.add_frame_listener(lambda frame_buffer: drawn.append(frame_buffer.front.copy()))
+    console.reset()
+    for _ in range(count):
+        console.run_frame()
+    assert len(set(frame.tobytes() for frame in drawn)) > 1
+    return drawn
+
+
+def test_catch_up_mode_draws_the_same_frames_as_lockstep():
+    reference = frames(False)
+    drawn = frames(True)
+    assert len(drawn) == len(reference)
+    for frame, expected in zip(drawn, reference):
+        assert (frame == expected).all()
@@ -0,0 +1,66 @@
+import numpy as np
+
+from modules.console import Console
+from modules.tile_cache import decode_tiles, pack_rows
+
+from roms import build_rom
+
+
+def test_decode_tiles_combines_the_bitplanes():
+    tile = bytes([0x81, 0, 0, 0, 0, 0, 0, 0x0F, 0x80, 0, 0, 0, 0, 0, 0, 0x3C])
+    tiles = decode_tiles(np.frombuffer(tile, dtype=np.uint8))
+    assert tiles.shape == (1, 2, 8, 8)
+    assert list(tiles[0, 0, 0]) == [3, 0, 0, 0, 0, 0, 0, 1]
+    assert list(tiles[0, 0, 7]) == [0, 0, 2, 2, 3, 3, 1, 1]
+    assert list(tiles[0, 1, 7]) == [1, 1, 3, 3, 2, 2, 0, 0]
+
+
+def test_pack_rows_splits_the_planes():
+    tile = bytes([0x81, 0, 0, 0, 0, 0, 0, 0, 0x80, 0, 0, 0, 0, 0, 0, 0])
+    rows = pack_rows(decode_tiles(np.frombuffer(tile, dtype=np.uint8)))
+    assert rows.shape == (1, 2, 2, 8)
+    assert rows.dtype == np.uint32
+    assert (int(rows[0, 0, 0, 0]), int(rows[0, 0, 1, 0])) == (0x10000001, 0x20000000)
+    assert (int(rows[0, 1, 0, 0]), int(rows[0, 1, 1, 0])) == (0x10000001, 0x00000002)
+
+
+def test_chr_ram_writes_reach_the_dot_renderer():
+    console = Console(build_rom([0x4C, 0x00, 0x80]))
+    console.reset()
+    memory = console.ppu_memory
+    memory.write(0x3F00, 0x0F)
+    memory.write(0x3F01, 0x16)
+    console.ppu.write_register(0x2001, 0x0A)  # background, left column included
+    for _ in range(2):
+        console.run_frame()
+    assert (console.ppu.frame_buffer.front == 0x0F).all()
+    # Every line of tile $00, the whole nametable, low plane only
+    for address in range(8):
+        memory.write(address, 0xFF)
+    for _ in range(2):
+        console.run_frame()
+    assert (console.ppu.frame_buffer.front == 0x16).all()
+
+
+def test_chr_ram_writes_update_the_decoded_tiles():
+    console = Console(build_rom([0x4C, 0x00, 0x80]))
+    cache = console.ppu_memory.tile_cache
+    assert not cache.table(1)[5].any()
+    ppu = console.ppu
+    # Row 2 of tile $05 in the $1000 table, low plane only
+    ppu.write_register(0x2006, 0x10)
+    ppu.write_register(0x2006, 0x52)
+    ppu.write_register(0x2007, 0xF0)
+    tiles = cache.table(1)
+    assert list(tiles[5, 0, 2]) == [1, 1, 1, 1, 0, 0, 0, 0]
+    assert list(tiles[5, 1, 2]) == [0, 0, 0, 0, 1, 1, 1, 1]
+    assert not cache.table(0).any()
+
+
+def test_chr_rom_is_not_written():
+    chr_data = bytes(range(256)) * 32
+    console = Console(build_rom([0x4C, 0x00, 0x80], chr_data=chr_data))
+    console.ppu_memory.write(0x0000, 0xFF)
+    assert console.ppu_memory.read(0x0000) == 0
+    expected = decode_tiles(np.frombuffer(chr_data[:0x1000], dtype=np.uint8))
+    assert (console.ppu_memory.tile_cache.table(0) == expected).all()
@@ -0,0 +1,59 @@
+from modules.console import Console
+from modules.tracer import Tracer
+
+from roms import build_rom, run_to
+
+PROGRAM = [
+    0xA9, 0x34,  # LDA #$34
+    0x85, 0x10,  # STA $10
+    0xA2, 0x02,  # LDX #$02
+    0x9D, 0x00, 0x02,  # STA $0200,X
+    0xA0, 0x02,  # LDY #$02
+    0xA9, 0x02,  # LDA #$02
+    0x85, 0x21,  # STA $21
+    0xA1, 0x1E,  # LDA ($1E,X)
+    0xB1, 0x20,  # LDA ($20),Y
+    0xA7, 0x10,  # LAX $10 (illegal)
+    0x1A,  # NOP (illegal)
+    0x6C, 0x20, 0x80,  # JMP ($8020)
+    0x00, 0x00, 0x00, 0x00, 0x00, 0x00, 0x00,
+    0x22, 0x80,  # $8020: pointer to $8022
+    0x4C, 0x22, 0x80,  # JMP $8022
+]
+
+EXPECTED = [
+    '8000  A9 34     LDA #$34                        A:00',
+    '8002  85 10     STA $10 = 00                    A:34',
+    '8004  A2 02     LDX #$02                        A:34',
+    '8006  9D 00 02  STA $0200,X @ 0202 = 00         A:34',
+    '8009  A0 02     LDY #$02                        A:34',
+    '800B  A9 02     LDA #$02                        A:34',
+    '800D  85 21     STA $21 = 00                    A:02',
+    '800F  A1 1E     LDA ($1E,X) @ 20 = 0200 = 00    A:02',
+    '8011  B1 20     LDA ($20),Y = 0200 @ 0202 = 34  A:00',
+    '8013  A7 10    *LAX $10 = 34                    A:34',
+    '8015  1A       *NOP                             A:34',
+    '8016  6C 20 80  JMP ($8020) = 8022              A:34',
+    '8022  4C 22 80  JMP $8022                       A:34',
+]
+
+
+def test_records_format_as_nestest_lines(tmp_path):
+    console = Console(build_rom(PROGRAM))
+    console.enable_trace(str(tmp_path / 'trace.bin'))
+    run_to(console, 0x8022)
+    console.cpu.step()
+    console.disable_trace()
+    lines = Tracer.format(Tracer.load(str(tmp_path / 'trace.bin')))
+    assert [line[:52] for line in lines] == EXPECTED
+
+
+def test_stopping_keeps_the_idle_detection_enabled_while_tracing(tmp_path):
+    console = Console(build_rom([0x4C, 0x00, 0x80]))  # JMP $8000
+    cpu = console.cpu
+    resolvers = [entry[0] for entry in cpu.dispatch]
+    console.enable_trace(str(tmp_path / 'trace.bin'))
+    console.enable_idle_detection()
+    console.disable_trace()
+    assert [entry[0] for entry in cpu.dispatch] == resolvers
+    assert hasattr(cpu.dispatch[0x4C][1], '__wrapped__')  # still checking for idle loops